@@ -1,11 +1,26 @@
-import sqlite3
 import networkx as nx
 import matplotlib.pyplot as plt
+import numpy as np
 from collections import Counter
+from communities import find_communities_sparse
+from kcore import decompose_graph
+from pagerank import rank_graph
+from scipy.sparse.csgraph import connected_components
+from sparse_graph import load_sparse_graph
+from storage import connect
+import sys
+
+# Community detection for --sparse runs: 'label_propagation', or 'leiden' /
+# 'louvain' with igraph installed (see communities.py)
+SPARSE_COMMUNITY_METHOD = 'label_propagation'
 
 def load_graph_from_db(db_path='furry_network.db'):
     """Load the network from SQLite into a NetworkX graph"""
-    conn = sqlite3.connect(db_path)
+    # Read-only, so this can run while a crawl is writing to the same file
+    conn = connect(db_path, read_only=True)
+    # One read transaction for both queries: with WAL, users and follows
+    # come from the same snapshot even if the crawl commits in between
+    conn.execute('BEGIN')
     
     # Create directed graph
     G = nx.DiGraph()
@@ -86,6 +101,76 @@ def analyze_graph(G):
             largest = max(nx.weakly_connected_components(G), key=len)
             print(f"  Largest component size: {len(largest)} ({100*len(largest)/G.number_of_nodes():.1f}%)")
 
+def analyze_sparse_graph(graph, top_k=10):
+    """
+    analyze_graph for a SparseGraph (see sparse_graph.py)
+    
+    Everything is a numpy/scipy operation over whole arrays, so this stays
+    fast on crawls far too big for networkx. Also returns the numbers.
+    """
+    print("\n" + "="*50)
+    print("GRAPH STATISTICS")
+    print("="*50)
+    
+    n = graph.num_nodes
+    A = graph.adjacency
+    print(f"Nodes (users): {n}")
+    print(f"Edges (follows): {graph.num_edges}")
+    
+    # Mutual follows: the stored flags, and every pair that follows each other
+    mutual_count = int(graph.mutual.sum())
+    mutual_pairs = graph.mutual_adjacency().nnz // 2
+    print(f"Mutual follows: {mutual_count}")
+    print(f"Mutual pairs: {mutual_pairs}")
+    
+    density = graph.num_edges / (n * (n - 1)) if n > 1 else 0.0
+    print(f"Graph density: {density:.4f}")
+    
+    # Degree statistics
+    in_degrees = graph.in_degrees()
+    out_degrees = graph.out_degrees()
+    percentiles = (50, 90, 99, 99.9)
+    in_percentiles = np.percentile(in_degrees, percentiles) if n else np.zeros(len(percentiles))
+    out_percentiles = np.percentile(out_degrees, percentiles) if n else np.zeros(len(percentiles))
+    
+    print(f"\nDegree statistics:")
+    print(f"  Average in-degree (followers): {in_degrees.mean() if n else 0:.2f}")
+    print(f"  Average out-degree (following): {out_degrees.mean() if n else 0:.2f}")
+    print(f"  Max in-degree: {in_degrees.max(initial=0)}")
+    print(f"  Max out-degree: {out_degrees.max(initial=0)}")
+    print(f"  In-degree percentiles: " + ", ".join(f"p{p:g} {v:.0f}" for p, v in zip(percentiles, in_percentiles)))
+    print(f"  Out-degree percentiles: " + ", ".join(f"p{p:g} {v:.0f}" for p, v in zip(percentiles, out_percentiles)))
+    
+    # Most followed users: argpartition finds the top k without sorting everyone
+    k = min(top_k, n)
+    top = np.argpartition(-in_degrees, k - 1)[:k] if k else np.array([], dtype=np.int64)
+    top = top[np.argsort(-in_degrees[top], kind='stable')]
+    print(f"\nTop {k} most followed users in graph:")
+    for i in top:
+        print(f"  {graph.label(i)}: {in_degrees[i]} followers")
+    
+    # Connectivity
+    num_components = largest = 0
+    if n > 0:
+        num_components, labels = connected_components(A, directed=True, connection='weak')
+        largest = int(np.bincount(labels).max())
+        print(f"\nWeakly connected components: {num_components}")
+        if num_components > 1:
+            print(f"  Largest component size: {largest} ({100*largest/n:.1f}%)")
+    
+    return {
+        'nodes': n,
+        'edges': graph.num_edges,
+        'mutual_follows': mutual_count,
+        'mutual_pairs': mutual_pairs,
+        'density': density,
+        'in_degree_percentiles': dict(zip(percentiles, in_percentiles.tolist())),
+        'out_degree_percentiles': dict(zip(percentiles, out_percentiles.tolist())),
+        'top_followed': [(graph.dids[i], int(in_degrees[i])) for i in top],
+        'weak_components': num_components,
+        'largest_component': largest,
+    }
+
 def visualize_graph(G, output_file='graph_visualization.png', max_nodes=500):
     """Create a simple visualization of the graph"""
     print(f"\nCreating visualization...")
@@ -199,6 +284,15 @@ def find_communities(G):
         return None
 
 def main():
+    if '--sparse' in sys.argv:
+        # Big crawls: sparse matrices only, no networkx graph, drawing or Gephi export
+        graph = load_sparse_graph()
+        analyze_sparse_graph(graph)
+        find_communities_sparse(graph, SPARSE_COMMUNITY_METHOD)
+        rank_graph(graph, 'furry_network.db')
+        decompose_graph(graph, 'furry_network.db')
+        return
+    
     # Load graph
     G = load_graph_from_db()
     
@@ -0,0 +1,420 @@
+"""
+Concurrent version of the two-phase crawl in main.py
+
+Same algorithm, but instead of crawling one user at a time it keeps
+CRAWL_CONCURRENCY users in flight over one shared HTTP session. The
+crawler spends nearly all of its time waiting on the network, so this
+scales throughput roughly with the concurrency level (until the API's
+rate limit is reached).
+
+Database writes still happen on the event loop thread, one user at a
+time, so SQLite only ever sees a single writer.
+
+Usage:
+    CRAWL_CONCURRENCY=16 python async_crawler.py
+"""
+
+from bluesky_api import AsyncBlueskyAPI, PaginationError, ProfileError, pick_smaller_side
+from db_writer import DBWriter, DBWriteError
+from metrics import TextfileExporter
+from storage import FurryNetworkDB
+from main import (
+    BLUESKY_HANDLE, BLUESKY_APP_PASSWORD, COMPACT_DB, MIN_CONNECTIONS, PHASE1_MUTUALS_ONLY, PIPELINED_WRITES, PROFILE_PREFETCH,
+    METRICS_TEXTFILE, METRICS_INTERVAL,
+    ConnectionWriter, save_profile, save_mutuals_only,
+    scan_initial_candidates, find_new_candidates, print_final_stats
+)
+import asyncio, itertools, os
+
+# Number of users crawled at the same time
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "16"))
+
+class ProfilePrefetcher:
+    """
+    Async counterpart of ProfileCache in main.py
+    
+    Call queued(did) whenever a user is put on the work queue. The first
+    worker that needs a profile we don't have starts one bulk get_profiles
+    for the next PROFILE_PREFETCH queued users; workers that need any of
+    those wait on the same call.
+    """
+    def __init__(self, api, window=PROFILE_PREFETCH):
+        self.api = api
+        self.window = window
+        self.pending = {}  # queued DIDs not requested yet (dict as an ordered set)
+        self.requests = {}  # did -> task fetching its profile
+    
+    def queued(self, did):
+        if did not in self.requests:
+            self.pending[did] = None
+    
+    async def get(self, did):
+        """Get a user's profile (None if the account is gone; raises ProfileError if it can't be fetched right now)"""
+        if did not in self.requests:
+            self.pending.pop(did, None)
+            batch = [did]
+            while self.pending and len(batch) < self.window:
+                queued_did = next(iter(self.pending))
+                del self.pending[queued_did]
+                batch.append(queued_did)
+            task = asyncio.ensure_future(self.api.get_profiles(batch))
+            for batch_did in batch:
+                self.requests[batch_did] = task
+        
+        profiles = await self.requests.pop(did)
+        profile = profiles.get(did)
+        if profile is None:
+            # Missing from the bulk response - ask on its own to get the error
+            profile = await self.api.get_profile(did)
+        return profile
+    
+    def drop(self, did):
+        """Forget a queued user the crawl won't fetch (crawled or skipped already, or past the limit)"""
+        self.pending.pop(did, None)
+        self.requests.pop(did, None)
+    
+    def clear(self):
+        """Forget everything prefetched or pending, e.g. at the end of a phase"""
+        for task in set(self.requests.values()):
+            task.cancel()
+        self.pending.clear()
+        self.requests.clear()
+
+async def run_workers(queue, crawl, concurrency):
+    """
+    Run `concurrency` workers calling crawl(item) on queue items until the queue is drained
+    
+    An item that fails is reported and skipped, except for DBWriteError:
+    nothing can be saved any more, so that stops every worker and is raised.
+    """
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                await crawl(item)
+            except DBWriteError:
+                raise
+            except Exception as e:
+                print(f"Error crawling {item}: {e}")
+            finally:
+                queue.task_done()
+    
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    drained = asyncio.create_task(queue.join())
+    # A worker only finishes by raising
+    done, _ = await asyncio.wait([drained, *workers], return_when=asyncio.FIRST_COMPLETED)
+    for task in [drained, *workers]:
+        task.cancel()
+    await asyncio.gather(drained, *workers, return_exceptions=True)
+    for task in done:
+        if task is not drained:
+            task.result()
+
+async def crawl_connections_async(api, db, did, handle, mutual_core):
+    """Async version of crawl_connections in main.py (pages are written as they arrive)"""
+    writer = ConnectionWriter(db, did, handle, mutual_core)
+    for direction, cursor in writer.resume():
+        fetch = api.iter_follows if direction == 'follows' else api.iter_followers
+        try:
+            async for page in fetch(did, cursor=cursor):
+                writer.add_page(direction, page.actors)
+        except PaginationError as e:
+            if e.cursor:
+                db.save_cursor(did, direction, e.cursor)
+            raise
+    return writer
+
+async def crawl_mutuals_only_async(api, db, did, profile):
+    """Async version of crawl_mutuals_only in main.py"""
+    if not pick_smaller_side(profile):
+        return await crawl_connections_async(api, db, did, profile.handle, mutual_core=True)
+    try:
+        result = await api.find_mutuals(did, smaller_side_first=True, profile=profile)
+    except PaginationError:
+        raise
+    except Exception as e:
+        raise PaginationError(did, 'relationships', None, [], e) from e
+    return save_mutuals_only(db, did, profile.handle, result)
+
+async def phase1_mutuals_graph_async(api, db, seed_account, max_users=None, concurrency=CRAWL_CONCURRENCY, mutuals_only=False):
+    """
+    Phase 1 (concurrent): Build the core mutual network
+    
+    See phase1_mutuals_graph in main.py. Up to `concurrency` mutuals are
+    fetched at once; BFS order is only approximate as a result.
+    
+    Args:
+        max_users: Maximum number of users to crawl (None for unlimited)
+        concurrency: Number of users in flight at the same time
+        mutuals_only: Only store the smaller side of each user's connections
+            (see PHASE1_MUTUALS_ONLY in main.py)
+    """
+    print("\n=== PHASE 1: Building Mutual Core Network ===")
+    print(f"Concurrency: {concurrency} users in flight")
+    if max_users:
+        print(f"Limit: {max_users} users")
+    
+    # Queue of users to process (BFS) - only mutuals get added here.
+    # Resumed from the crawl_queue table if a previous run was interrupted
+    queue = asyncio.Queue()
+    profiles = ProfilePrefetcher(api)
+    db.requeue(1, ('failed',))  # Profiles that couldn't be fetched last time
+    resumed = [did for did, _ in db.get_queue(1)]
+    if resumed:
+        print(f"Resuming: {len(resumed)} mutuals still queued from the last run")
+    else:
+        resumed = [seed_account]
+        db.enqueue(1, [(seed_account, 0)])
+    for did in resumed:
+        queue.put_nowait(did)
+        profiles.queued(did)
+    claimed = set()  # Users a worker has started on (in flight or done)
+    processed = set()
+    
+    async def crawl(current_did):
+        # Skip if already processed or being processed
+        if current_did in claimed or db.is_crawled(current_did):
+            profiles.drop(current_did)
+            return
+        
+        # Check if we've hit the limit
+        if max_users and len(claimed) >= max_users:
+            profiles.drop(current_did)
+            return
+        
+        claimed.add(current_did)
+        
+        # Get profile (prefetched in bulk with the rest of the queue)
+        try:
+            profile = await profiles.get(current_did)
+        except ProfileError as e:
+            print(f"\nProcessing: {current_did}")
+            print(f"  {e}")
+            print(f"  Will retry on the next run")
+            db.set_queue_status(1, current_did, 'failed')
+            claimed.discard(current_did)
+            return
+        if not profile:
+            print(f"\nProcessing: {current_did}")
+            print(f"  Could not fetch profile, skipping")
+            db.set_queue_status(1, current_did, 'skipped')
+            claimed.discard(current_did)
+            return
+        
+        # Find mutuals, adding ALL connections to database page by page
+        save_profile(db, profile)
+        try:
+            if mutuals_only:
+                result = await crawl_mutuals_only_async(api, db, current_did, profile)
+            else:
+                result = await crawl_connections_async(api, db, current_did, profile.handle, mutual_core=True)
+        except PaginationError as e:
+            print(f"\nProcessing: {current_did}")
+            print(f"  {e}")
+            print(f"  Saved progress, will resume on the next run")
+            claimed.discard(current_did)
+            return
+        
+        # No awaits from here on, so output for this user is not
+        # interleaved with other workers
+        print(f"\nProcessing: {current_did}")
+        print(f"  {profile.display_name or profile.handle}")
+        print(f"  Followers: {getattr(profile, 'followers_count', 0)}, Following: {getattr(profile, 'follows_count', 0)}")
+        print(f"  Found {len(result.mutuals)} mutuals")
+        print(f"  Debug: {result.follows_count} follows, {result.followers_count} followers")
+        print(f"  Added {len(result.connections)} connections to database")
+        
+        # Only add MUTUALS to the processing queue
+        new_mutuals = [did for did in result.mutuals if did not in claimed and not db.is_crawled(did)]
+        for mutual_did in new_mutuals:
+            queue.put_nowait(mutual_did)
+            profiles.queued(mutual_did)
+        
+        # Mark as crawled and as part of mutual core
+        with db.transaction():
+            db.enqueue(1, [(did, 0) for did in new_mutuals])
+            db.set_queue_status(1, current_did, 'done')
+            db.mark_as_crawled(current_did)
+            db.mark_as_mutual_core(current_did)
+            db.clear_cursors(current_did)
+        processed.add(current_did)
+        
+        # Print progress
+        stats = db.get_stats()
+        print(f"  Progress: {stats['crawled_users']} mutual core crawled, {len(claimed) - len(processed)} in flight, {queue.qsize()} mutuals in queue, {stats['total_users']} accounts total in DB")
+    
+    await run_workers(queue, crawl, concurrency)
+    profiles.clear()
+    
+    if max_users and len(processed) >= max_users:
+        print(f"\n⚠️  Reached Phase 1 limit of {max_users} users")
+    print(f"\n✓ Phase 1 complete: {len(processed)} mutual core members crawled")
+
+async def phase2_expand_graph_async(api, db, min_connections=3, max_users=None, concurrency=CRAWL_CONCURRENCY):
+    """
+    Phase 2 (concurrent): Expand beyond mutual core by finding connected community members
+    
+    See phase2_expand_graph in main.py. Up to `concurrency` candidates are
+    fetched at once.
+    
+    Args:
+        min_connections: Minimum connections to mutual core to be included
+        max_users: Maximum number of users to crawl in this phase (None for unlimited)
+        concurrency: Number of users in flight at the same time
+    """
+    print(f"\n=== PHASE 2: Expanding Beyond Mutual Core ===")
+    print(f"Minimum connections to mutual core: {min_connections}")
+    print(f"Concurrency: {concurrency} users in flight")
+    if max_users:
+        print(f"Limit: {max_users} users")
+    
+    # Step 1: Find initial candidates from uncrawled users in database
+    # Best connected first; a user whose count goes up while queued is
+    # pushed again and the old entry is skipped (see frontier.py)
+    queue = asyncio.PriorityQueue()
+    queued = {}  # did -> connection count it is queued with
+    order = itertools.count()
+    profiles = ProfilePrefetcher(api)
+    
+    def enqueue(did, conn_count):
+        queue.put_nowait((-conn_count, next(order), did))
+        queued[did] = conn_count
+        profiles.queued(did)
+    
+    # Also kept in the crawl_queue table, like in main.py
+    db.requeue(2, ('failed',))
+    db.enqueue(2, scan_initial_candidates(db, min_connections))
+    for did, conn_count in db.get_queue(2, min_priority=min_connections):
+        enqueue(did, conn_count)
+    
+    # Step 2: Crawl qualified users, best connected first
+    claimed = set()  # Users a worker has started on (in flight, done or failed)
+    in_flight = set()
+    crawled = set()
+    limit = asyncio.Condition()  # Notified whenever a user leaves in_flight
+    
+    async def crawl(entry):
+        priority, _, current_did = entry
+        if queued.get(current_did) != -priority:
+            return  # Superseded by a higher-priority entry
+        del queued[current_did]
+        
+        # Check if we've hit the limit. Like main.py, only users actually
+        # crawled count towards it, so while it is only reached counting
+        # the users in flight, wait: one of them may fail and free its place
+        if max_users:
+            async with limit:
+                await limit.wait_for(lambda: len(crawled) + len(in_flight) < max_users or len(crawled) >= max_users)
+            if len(crawled) >= max_users:
+                profiles.drop(current_did)
+                return
+        
+        # Skip if already processed or being processed
+        if current_did in claimed or db.is_crawled(current_did):
+            profiles.drop(current_did)
+            return
+        
+        claimed.add(current_did)
+        in_flight.add(current_did)
+        try:
+            await crawl_user(current_did)
+        finally:
+            in_flight.discard(current_did)
+            async with limit:
+                limit.notify_all()
+        
+    async def crawl_user(current_did):
+        # Get profile (prefetched in bulk with the rest of the queue)
+        try:
+            profile = await profiles.get(current_did)
+        except ProfileError as e:
+            print(f"\n{e}")
+            print(f"  Will retry on the next run")
+            db.set_queue_status(2, current_did, 'failed')
+            return
+        if not profile:
+            print(f"  Could not fetch profile, skipping")
+            db.set_queue_status(2, current_did, 'skipped')
+            return
+        
+        # Get their connections (follows + followers), written page by page
+        save_profile(db, profile)
+        try:
+            result = await crawl_connections_async(api, db, current_did, profile.handle, mutual_core=False)
+        except PaginationError as e:
+            print(f"\nCrawling: {profile.display_name or profile.handle} (@{profile.handle})")
+            print(f"  {e}")
+            print(f"  Saved progress, will resume on the next run")
+            return
+        
+        # No awaits from here on, so output for this user is not
+        # interleaved with other workers
+        print(f"\nCrawling: {profile.display_name or profile.handle} (@{profile.handle})")
+        print(f"  Found {result.follows_count} follows, {result.followers_count} followers")
+        
+        new_candidates = find_new_candidates(db, result.connections, claimed, queued, min_connections)
+        for did, conn_count in new_candidates:
+            enqueue(did, conn_count)
+        
+        # Mark as crawled
+        with db.transaction():
+            db.enqueue(2, new_candidates)
+            db.set_queue_status(2, current_did, 'done')
+            db.mark_as_crawled(current_did)
+            db.clear_cursors(current_did)
+        crawled.add(current_did)
+        
+        # Print progress
+        print(f"  Progress: {len(crawled)} crawled in Phase 2, {len(in_flight) - 1} more in flight, {len(queued)} in queue")
+    
+    await run_workers(queue, crawl, concurrency)
+    profiles.clear()
+    
+    if max_users and len(crawled) >= max_users:
+        print(f"\n⚠️  Reached Phase 2 limit of {max_users} users")
+    print(f"\n✓ Phase 2 complete: {len(crawled)} additional users crawled")
+
+async def main_async():
+    # Initialize
+    print("Furry Fandom Network Mapper (concurrent)")
+    print("=" * 50)
+    
+    api = await AsyncBlueskyAPI.create(BLUESKY_HANDLE, BLUESKY_APP_PASSWORD)
+    if METRICS_TEXTFILE:
+        exporter = TextfileExporter(api.metrics, METRICS_TEXTFILE, METRICS_INTERVAL).start()
+    
+    # Connect to database
+    db = FurryNetworkDB(compact=COMPACT_DB)
+    if PIPELINED_WRITES:
+        db = DBWriter(db)
+    
+    try:
+        # Print initial stats
+        stats = db.get_stats()
+        print(f"\nDatabase stats:")
+        print(f"  Total users: {stats['total_users']}")
+        print(f"  Crawled users: {stats['crawled_users']}")
+        print(f"  Follow relationships: {stats['total_follows']}")
+        
+        # Starting point - your account
+        seed_account = api.me.did
+        
+        # TEST LIMITS - Remove max_users parameter for full run
+        await phase1_mutuals_graph_async(api, db, seed_account, max_users=50, mutuals_only=PHASE1_MUTUALS_ONLY)
+        await phase2_expand_graph_async(api, db, min_connections=MIN_CONNECTIONS, max_users=100)
+        
+        # Final stats
+        print_final_stats(db)
+        print(f"\n{api.metrics.summary()}")
+    finally:
+        # Close connections
+        await api.close()
+        db.close()
+        if METRICS_TEXTFILE:
+            exporter.stop()
+
+def main():
+    asyncio.run(main_async())
+
+if __name__ == "__main__":
+    main()
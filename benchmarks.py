@@ -0,0 +1,224 @@
+"""
+Benchmarks for the crawler, the database and analysis.py
+
+Everything runs offline on synthetic graphs (synthetic_graph.py), with
+the crawl going through the fake API backend (fake_bluesky.py):
+
+- crawl: users crawled per second in Phase 1 and Phase 2, with main.py
+  and with async_crawler.py
+- writes: follows written per second through FurryNetworkDB, a page at a
+  time like the crawler writes them
+- core_count: latency of get_mutual_core_connection_count
+- load_graph: load_graph_from_db time and peak Python memory
+
+Results go to a JSON file in benchmark_results/ (named after the time and
+git commit), so runs can be compared over time. Sizes are configurable;
+the defaults take a few minutes.
+
+Usage:
+    python benchmarks.py [--users 200000] [--crawl-users 20000] [--latency 0.0]
+                         [--compact] [--only crawl,writes] [--output results.json]
+"""
+
+from synthetic_graph import generate, write_db, to_fake_bluesky, did, handle
+from storage import FurryNetworkDB
+from db_writer import DBWriter
+import main as main_crawler
+import async_crawler
+import analysis
+import numpy as np
+import argparse, asyncio, contextlib, io, json, os, platform, sqlite3, subprocess, tempfile, time, tracemalloc
+
+BENCHMARKS = ('crawl', 'writes', 'core_count', 'load_graph')
+RESULTS_DIR = 'benchmark_results'
+
+# Crawl limits, so crawl benchmarks measure throughput rather than graph size
+PHASE1_USERS = 200
+PHASE2_USERS = 300
+
+# Users get_mutual_core_connection_count is timed on
+CORE_COUNT_SAMPLES = 2000
+
+def _quiet(fn, *args, **kwargs):
+    """Call fn with its progress output swallowed"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def _crawled(db):
+    return db.get_stats()['crawled_users']
+
+def _rate(count, seconds):
+    return {'count': count, 'seconds': round(seconds, 3), 'per_second': round(count / seconds, 1) if seconds else None}
+
+def _open_db(path, compact):
+    db = FurryNetworkDB(path, compact=compact)
+    return DBWriter(db) if main_crawler.PIPELINED_WRITES else db
+
+def bench_crawl(args, workdir):
+    """Users crawled per second in both phases, sync and async"""
+    graph = generate(args.crawl_users, args.avg_follows, seed=args.seed)
+    # Start in the biggest community, where Phase 1 has plenty to find
+    seed = int(np.flatnonzero(graph.community == np.bincount(graph.community).argmax())[0])
+    fake = to_fake_bluesky(graph, latency=args.latency, account=did(seed))
+    results = {}
+    
+    api = _quiet(fake.api)
+    db = _open_db(os.path.join(workdir, 'crawl_sync.db'), args.compact)
+    started = time.perf_counter()
+    _quiet(main_crawler.phase1_mutuals_graph, api, db, did(seed), max_users=PHASE1_USERS)
+    phase1 = _rate(_crawled(db), time.perf_counter() - started)
+    before = _crawled(db)
+    started = time.perf_counter()
+    _quiet(main_crawler.phase2_expand_graph, api, db, main_crawler.MIN_CONNECTIONS, max_users=PHASE2_USERS)
+    phase2 = _rate(_crawled(db) - before, time.perf_counter() - started)
+    db.close()
+    results['sync'] = {'phase1': phase1, 'phase2': phase2}
+    
+    async def run_async():
+        api = await fake.async_api()
+        db = _open_db(os.path.join(workdir, 'crawl_async.db'), args.compact)
+        started = time.perf_counter()
+        await async_crawler.phase1_mutuals_graph_async(api, db, did(seed), max_users=PHASE1_USERS, concurrency=args.concurrency)
+        phase1 = _rate(_crawled(db), time.perf_counter() - started)
+        before = _crawled(db)
+        started = time.perf_counter()
+        await async_crawler.phase2_expand_graph_async(api, db, main_crawler.MIN_CONNECTIONS, PHASE2_USERS, args.concurrency)
+        phase2 = _rate(_crawled(db) - before, time.perf_counter() - started)
+        db.close()
+        await api.close()
+        return {'phase1': phase1, 'phase2': phase2, 'concurrency': args.concurrency}
+    
+    results['async'] = _quiet(asyncio.run, run_async())
+    results['api_calls'] = dict(fake.calls)
+    return results
+
+def bench_writes(args, workdir, graph):
+    """Follows written per second, in crawler-sized pages"""
+    db = FurryNetworkDB(os.path.join(workdir, 'writes.db'), compact=args.compact)
+    edges = min(len(graph.src), args.write_edges)
+    src = graph.src[:edges].tolist()
+    dst = graph.dst[:edges].tolist()
+    
+    started = time.perf_counter()
+    for start in range(0, edges, 100):
+        page = range(start, min(start + 100, edges))
+        with db.transaction():
+            db.add_users((did(dst[i]), handle(dst[i]), None) for i in page)
+            db.add_follows((did(src[i]), handle(src[i]), did(dst[i]), handle(dst[i]), False) for i in page)
+    elapsed = time.perf_counter() - started
+    db.close()
+    return _rate(edges, elapsed)
+
+def bench_core_count(args, db_path, graph):
+    """get_mutual_core_connection_count latency over a sample of users, in milliseconds"""
+    db = FurryNetworkDB(db_path)
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(graph.users, size=min(CORE_COUNT_SAMPLES, graph.users), replace=False)
+    timings = []
+    for i in sample.tolist():
+        started = time.perf_counter()
+        db.get_mutual_core_connection_count(did(i))
+        timings.append(time.perf_counter() - started)
+    db.close()
+    timings = np.array(timings) * 1000
+    return {
+        'calls': len(timings),
+        'mean_ms': round(float(timings.mean()), 4),
+        **{f'p{p}_ms': round(float(np.percentile(timings, p)), 4) for p in (50, 95, 99)},
+        'max_ms': round(float(timings.max()), 4),
+    }
+
+def bench_load_graph(args, db_path):
+    """load_graph_from_db time, then peak memory in a second (traced, slower) run"""
+    started = time.perf_counter()
+    G = _quiet(analysis.load_graph_from_db, db_path)
+    elapsed = time.perf_counter() - started
+    nodes, edges = G.number_of_nodes(), G.number_of_edges()
+    del G
+    
+    tracemalloc.start()
+    G = _quiet(analysis.load_graph_from_db, db_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del G
+    return {'nodes': nodes, 'edges': edges, 'seconds': round(elapsed, 3), 'peak_mb': round(peak / 1e6, 1)}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    """Run the selected benchmarks; returns the results dict"""
+    results = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'settings': {
+            'users': args.users, 'crawl_users': args.crawl_users, 'avg_follows': args.avg_follows,
+            'latency': args.latency, 'compact': args.compact, 'seed': args.seed,
+            'pipelined_writes': main_crawler.PIPELINED_WRITES,
+        },
+        'results': {},
+    }
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        if 'crawl' in args.only:
+            print("Benchmarking crawl...")
+            results['results']['crawl'] = bench_crawl(args, workdir)
+        
+        if set(args.only) & {'writes', 'core_count', 'load_graph'}:
+            started = time.perf_counter()
+            graph = generate(args.users, args.avg_follows, seed=args.seed)
+            results['settings']['edges'] = len(graph.src)
+            results['settings']['generate_seconds'] = round(time.perf_counter() - started, 3)
+        
+        if 'writes' in args.only:
+            print("Benchmarking writes...")
+            results['results']['writes'] = bench_writes(args, workdir, graph)
+        
+        if set(args.only) & {'core_count', 'load_graph'}:
+            db_path = os.path.join(workdir, 'analysis.db')
+            _quiet(write_db, graph, db_path, compact=args.compact)
+            if 'core_count' in args.only:
+                print("Benchmarking get_mutual_core_connection_count...")
+                results['results']['core_count'] = bench_core_count(args, db_path, graph)
+            if 'load_graph' in args.only:
+                print("Benchmarking load_graph_from_db...")
+                results['results']['load_graph'] = bench_load_graph(args, db_path)
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the crawler, database and analysis on synthetic data')
+    parser.add_argument('--users', type=int, default=200_000, help='users in the graph for writes/core_count/load_graph')
+    parser.add_argument('--crawl-users', type=int, default=20_000, help='users in the graph the fake API serves')
+    parser.add_argument('--avg-follows', type=int, default=40)
+    parser.add_argument('--write-edges', type=int, default=500_000, help='most follows written by the writes benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per fake API request')
+    parser.add_argument('--concurrency', type=int, default=async_crawler.CRAWL_CONCURRENCY)
+    parser.add_argument('--compact', action='store_true', help='use the compact database schema')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help=f'comma-separated subset of {",".join(BENCHMARKS)}')
+    parser.add_argument('--output', help=f'JSON file to write (default: {RESULTS_DIR}/<time>-<commit>.json)')
+    args = parser.parse_args()
+    args.only = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    
+    results = run(args)
+    
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'nogit'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results['results'], indent=2))
+    print(f"\n✓ Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,379 @@
-from atproto import Client
+from atproto import AsyncClient, Client
+from metrics import ApiMetrics, response_size, xrpc_method
+from rate_limiter import RateLimiter
+from retry import RetryPolicy
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import copy
+import httpx
+import math
+import queue
+import threading
 import time
 
+# Lightweight stand-in for an atproto profile view (a few hundred bytes
+# less per account, and also what we rebuild from the database)
+Actor = namedtuple('Actor', ['did', 'handle', 'display_name'])
+
+# One page of a follows/followers listing; `cursor` resumes after it (None on the last page)
+Page = namedtuple('Page', ['actors', 'cursor'])
+
+def to_actors(profiles):
+    """Convert atproto profile views to Actor tuples"""
+    return [Actor(p.did, p.handle, getattr(p, 'display_name', None)) for p in profiles]
+
+# getRelationships accepts at most this many DIDs per call
+RELATIONSHIPS_BATCH = 30
+
+# getProfiles accepts at most this many actors per call
+PROFILES_BATCH = 25
+
+def pick_smaller_side(profile):
+    """
+    Decide how to find an actor's mutuals from its profile counts
+    
+    Returns 'follows' or 'followers' when it is cheaper to page through
+    that (smaller) side and check it with getRelationships, or None when
+    paging through both lists costs fewer requests.
+    """
+    follows_count = getattr(profile, 'follows_count', 0) or 0
+    followers_count = getattr(profile, 'followers_count', 0) or 0
+    small, large = sorted((follows_count, followers_count))
+    # Both ways page through the small side; then it's one relationships
+    # call per 30 of those versus pages of 100 of the large side
+    if math.ceil(small / RELATIONSHIPS_BATCH) >= math.ceil(large / 100):
+        return None
+    return 'follows' if follows_count <= followers_count else 'followers'
+
+def _mutual_result(side, actors, relationships):
+    """Build a find_mutuals result from one side and its relationships"""
+    # Only `side` was fetched; for follows we need to know who follows back, and vice versa
+    flag = 'followed_by' if side == 'follows' else 'following'
+    mutuals = {r.did for r in relationships if getattr(r, flag, None)}
+    return {
+        'follows': actors if side == 'follows' else None,
+        'followers': actors if side == 'followers' else None,
+        'mutuals': mutuals
+    }
+
+_DONE = object()
+
+def prefetch_pages(pages, depth=2):
+    """
+    Iterate over `pages` while a background thread fetches up to `depth` pages ahead
+    
+    Lets the caller write one page to the database while the next one is
+    still being fetched. An error from the underlying iterator is raised
+    here after the pages that came before it.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def producer():
+        try:
+            for page in pages:
+                if not put((page, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((None, e))
+    
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            page, error = buffer.get()
+            if error is not None:
+                raise error
+            if page is _DONE:
+                return
+            yield page
+    finally:
+        # Caller stopped early (or we're done) - let the producer exit
+        stop.set()
+
+class PaginationError(Exception):
+    """
+    Paging through an actor's follows/followers failed even after retries
+    
+    `cursor` is the last cursor that worked (None if the first page
+    failed), so a later run can resume from it. For get_all_* calls,
+    `items` holds what was fetched before the failure; the iter_*
+    generators have already yielded those pages, so it is empty.
+    """
+    def __init__(self, actor, direction, cursor, items, cause):
+        super().__init__(f"Gave up fetching {direction} for {actor} (last good cursor: {cursor}): {cause}")
+        self.actor = actor
+        self.direction = direction
+        self.cursor = cursor
+        self.items = items
+
+class ProfileError(Exception):
+    """
+    Fetching an actor's profile failed even after retries, but not because
+    the account is gone (see GONE_STATUSES), so a later run should try again
+    """
+    def __init__(self, actor, cause):
+        super().__init__(f"Could not fetch profile for {actor}: {cause}")
+        self.actor = actor
+
+# Statuses meaning the account itself can't be fetched: not found,
+# deactivated, taken down, invalid handle, ...
+GONE_STATUSES = {400, 404}
+
+def _account_gone(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) in GONE_STATUSES
+
+def _is_session_call(kwargs):
+    """Login/refresh calls have their own (much lower) limit, so they don't feed the limiter"""
+    return '/com.atproto.server.' in str(kwargs.get('url', ''))
+
+def _collect(pages):
+    """Flatten pages into one list, keeping what we got if a page fails"""
+    items = []
+    try:
+        for page in pages:
+            items.extend(page.actors)
+    except PaginationError as e:
+        e.items = items
+        raise
+    return items
+
+async def _collect_async(pages):
+    """Flatten async pages into one list, keeping what we got if a page fails"""
+    items = []
+    try:
+        async for page in pages:
+            items.extend(page.actors)
+    except PaginationError as e:
+        e.items = items
+        raise
+    return items
+
+def _with_retry_metrics(retry_policy, metrics):
+    """Copy of retry_policy (so sharing one is fine) that counts retries in metrics"""
+    retry_policy = copy.copy(retry_policy) if retry_policy else RetryPolicy()
+    retry_policy.on_retry = metrics.record_retry
+    return retry_policy
+
+def _count_response_bytes(request, metrics):
+    """
+    Record the size of every XRPC response on the httpx client behind an
+    atproto Request or AsyncRequest (the atproto Response only keeps the
+    parsed JSON, so the raw body has to be measured here)
+    """
+    def method(response):
+        if _is_session_call({'url': response.request.url}):
+            return None
+        return xrpc_method(response.request.url)
+    
+    def hook(response):
+        name = method(response)
+        if name:
+            response.read()
+            metrics.record_bytes(name, response_size(response))
+    
+    async def async_hook(response):
+        name = method(response)
+        if name:
+            await response.aread()
+            metrics.record_bytes(name, response_size(response))
+    
+    # atproto keeps its httpx client private; request._client is what
+    # atproto 0.0.72 with httpx 0.28.1 has. If a later version moves it,
+    # crawl on without byte counts rather than fail to start
+    client = getattr(request, '_client', None)
+    if not isinstance(client, (httpx.Client, httpx.AsyncClient)):
+        print("Warning: can't find atproto's httpx client, response sizes won't be recorded")
+        return
+    client.event_hooks['response'].append(async_hook if isinstance(client, httpx.AsyncClient) else hook)
+
+class RateLimitedClient(Client):
+    """atproto Client that sends every request through a RateLimiter and records ApiMetrics"""
+    def __init__(self, rate_limiter, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics or ApiMetrics()
+        _count_response_bytes(self.request, self.metrics)
+    
+    def _invoke(self, invoke_type, **kwargs):
+        if _is_session_call(kwargs):
+            return super()._invoke(invoke_type, **kwargs)
+        
+        method = xrpc_method(kwargs.get('url', ''))
+        waited = time.monotonic()
+        self.rate_limiter.acquire()
+        started = time.monotonic()
+        self.metrics.record_wait(started - waited)
+        try:
+            response = super()._invoke(invoke_type, **kwargs)
+        except Exception as e:
+            self.metrics.record_error(method, time.monotonic() - started, e)
+            e.xrpc_method = method  # For counting the retry, if there is one
+            self.rate_limiter.update_from_error(e)
+            raise
+        self.metrics.record(method, time.monotonic() - started, response.status_code)
+        self.rate_limiter.update(response.headers)
+        return response
+
+class AsyncRateLimitedClient(AsyncClient):
+    """atproto AsyncClient that sends every request through a RateLimiter and records ApiMetrics"""
+    def __init__(self, rate_limiter, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics or ApiMetrics()
+        _count_response_bytes(self.request, self.metrics)
+    
+    async def _invoke(self, invoke_type, **kwargs):
+        if _is_session_call(kwargs):
+            return await super()._invoke(invoke_type, **kwargs)
+        
+        method = xrpc_method(kwargs.get('url', ''))
+        waited = time.monotonic()
+        await self.rate_limiter.acquire_async()
+        started = time.monotonic()
+        self.metrics.record_wait(started - waited)
+        try:
+            response = await super()._invoke(invoke_type, **kwargs)
+        except Exception as e:
+            self.metrics.record_error(method, time.monotonic() - started, e)
+            e.xrpc_method = method  # For counting the retry, if there is one
+            self.rate_limiter.update_from_error(e)
+            raise
+        self.metrics.record(method, time.monotonic() - started, response.status_code)
+        self.rate_limiter.update(response.headers)
+        return response
+
 class BlueskyAPI:
-    def __init__(self, handle, app_password):
-        """Initialize and login to Bluesky"""
-        self.client = Client()
+    def __init__(self, handle, app_password, rate_limiter=None, retry_policy=None, base_url=None, request=None, metrics=None):
+        """
+        Initialize and login to Bluesky
+        
+        Pass the same rate_limiter to every API object that shares an
+        account/IP so they draw from one request budget. base_url and
+        request (an atproto Request, e.g. with a custom httpx transport)
+        point the client somewhere other than bsky.social; see
+        fake_bluesky.py. Requests are recorded in `metrics` (an ApiMetrics,
+        new by default), available as self.metrics.
+        """
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metrics = metrics or ApiMetrics()
+        self.retry_policy = _with_retry_metrics(retry_policy, self.metrics)
+        self.client = RateLimitedClient(self.rate_limiter, base_url, request=request, metrics=self.metrics)
         self.client.login(handle, app_password)
         self.me = self.client.me
         print(f"Logged in as {self.me.handle} (DID: {self.me.did})")
     
     def get_profile(self, actor):
-        """Get a user's profile information"""
+        """
+        Get a user's profile information
+        
+        Returns None if the account is gone; raises ProfileError if it
+        couldn't be fetched for any other reason.
+        """
         try:
-            profile = self.client.app.bsky.actor.get_profile({'actor': actor})
+            profile = self.retry_policy.call(self.client.app.bsky.actor.get_profile, {'actor': actor})
             return profile
         except Exception as e:
+            if not _account_gone(e):
+                raise ProfileError(actor, e) from e
             print(f"Error getting profile for {actor}: {e}")
             return None
     
-    def get_all_follows(self, actor):
-        """Get all accounts that this actor follows (with pagination)"""
-        follows = []
-        cursor = None
-        
+    def _iter_pages(self, method, direction, actor, cursor):
+        """Page through a follows/followers listing, retrying failed pages"""
         while True:
+            params = {
+                'actor': actor,
+                'limit': 100
+            }
+            if cursor:
+                params['cursor'] = cursor
+            
             try:
-                params = {
-                    'actor': actor,
-                    'limit': 100
-                }
-                if cursor:
-                    params['cursor'] = cursor
-                
-                resp = self.client.app.bsky.graph.get_follows(params)
-                follows.extend(resp.follows)
-                
-                cursor = resp.cursor
-                if not cursor:
-                    break
-                
-                # Be polite to the API
-                time.sleep(0.05)
-                
+                resp = self.retry_policy.call(method, params)
             except Exception as e:
-                print(f"Error getting follows for {actor}: {e}")
+                raise PaginationError(actor, direction, cursor, [], e) from e
+                
+            cursor = resp.cursor
+            yield Page(to_actors(getattr(resp, direction)), cursor)
+            if not cursor:
                 break
         
-        return follows
+    def iter_follows(self, actor, cursor=None):
+        """
+        Yield pages of the accounts this actor follows as they arrive
+        
+        Each Page holds up to 100 Actor tuples plus the cursor to resume
+        after it. Raises PaginationError if a page still fails after retries.
+        """
+        return self._iter_pages(self.client.app.bsky.graph.get_follows, 'follows', actor, cursor)
+    
+    def iter_followers(self, actor, cursor=None):
+        """Yield pages of the accounts that follow this actor (see iter_follows)"""
+        return self._iter_pages(self.client.app.bsky.graph.get_followers, 'followers', actor, cursor)
     
-    def get_all_followers(self, actor):
-        """Get all accounts that follow this actor (with pagination)"""
-        followers = []
-        cursor = None
+    def get_all_follows(self, actor, cursor=None):
+        """
+        Get all accounts that this actor follows (with pagination)
         
-        while True:
-            try:
-                params = {
-                    'actor': actor,
-                    'limit': 100
-                }
-                if cursor:
-                    params['cursor'] = cursor
-                
-                resp = self.client.app.bsky.graph.get_followers(params)
-                followers.extend(resp.followers)
+        Starts from `cursor` when resuming. Raises PaginationError if a
+        page still fails after retries.
+        """
+        return _collect(self.iter_follows(actor, cursor))
                 
-                cursor = resp.cursor
-                if not cursor:
-                    break
+    def get_all_followers(self, actor, cursor=None):
+        """
+        Get all accounts that follow this actor (with pagination)
                 
-                # Be polite to the API
-                time.sleep(0.05)
-                
-            except Exception as e:
-                print(f"Error getting followers for {actor}: {e}")
-                break
+        Starts from `cursor` when resuming. Raises PaginationError if a
+        page still fails after retries.
+        """
+        return _collect(self.iter_followers(actor, cursor))
+    
+    def get_relationships(self, actor, others):
+        """
+        Get actor's relationship to each DID in others (batched 30 per call)
         
-        return followers
+        Each result has `following` set if actor follows that DID and
+        `followed_by` set if that DID follows actor.
+        """
+        relationships = []
+        for i in range(0, len(others), RELATIONSHIPS_BATCH):
+            batch = others[i:i + RELATIONSHIPS_BATCH]
+            resp = self.retry_policy.call(self.client.app.bsky.graph.get_relationships, {'actor': actor, 'others': batch})
+            # Deleted/unknown accounts come back as notFoundActor, which has no follow fields
+            relationships.extend(r for r in resp.relationships if not getattr(r, 'not_found', False))
+        return relationships
     
-    def find_mutuals(self, actor):
-        """Find mutual follows for an actor"""
+    def find_mutuals(self, actor, smaller_side_first=False, profile=None):
+        """
+        Find mutual follows for an actor
+        
+        With smaller_side_first=True only the smaller of follows/followers
+        is paged through (sizes come from `profile`, fetched if not given)
+        and its mutuals are resolved with getRelationships. The other side
+        is then None in the result. For popular accounts that is a tiny
+        fraction of the requests.
+        """
+        if smaller_side_first:
+            profile = profile or self.get_profile(actor)
+            side = pick_smaller_side(profile) if profile else None
+            if side:
+                actors = self.get_all_follows(actor) if side == 'follows' else self.get_all_followers(actor)
+                relationships = self.get_relationships(actor, [a.did for a in actors])
+                return _mutual_result(side, actors, relationships)
+        
         follows = self.get_all_follows(actor)
         followers = self.get_all_followers(actor)
         
@@ -96,14 +390,172 @@ class BlueskyAPI:
         }
     
     def get_profiles_batch(self, actors):
-        """Get multiple profiles at once (up to 25)"""
+        """Get multiple profiles at once (up to 25, see get_profiles for more)"""
+        try:
+            # API only allows 25 at a time
+            if len(actors) > PROFILES_BATCH:
+                actors = actors[:PROFILES_BATCH]
+            
+            resp = self.retry_policy.call(self.client.app.bsky.actor.get_profiles, {'actors': actors})
+            return resp.profiles
+        except Exception as e:
+            print(f"Error getting batch profiles: {e}")
+            return []
+    
+    def get_profiles(self, actors, max_workers=8):
+        """
+        Get profiles for any number of actors, keyed by DID
+        
+        Splits the list into 25-actor getProfiles calls and runs up to
+        max_workers of them at once. Accounts that could not be fetched
+        (deleted, suspended, failed batch) are missing from the result.
+        """
+        chunks = [actors[i:i + PROFILES_BATCH] for i in range(0, len(actors), PROFILES_BATCH)]
+        if not chunks:
+            return {}
+        
+        profiles = {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+            for batch in pool.map(self.get_profiles_batch, chunks):
+                profiles.update((p.did, p) for p in batch)
+        return profiles
+
+class AsyncBlueskyAPI:
+    """
+    asyncio version of BlueskyAPI with the same methods as coroutines.
+    
+    All calls go through one AsyncClient (and therefore one shared HTTP
+    connection pool), so many actors can be crawled concurrently.
+    Create it with `await AsyncBlueskyAPI.create(handle, app_password)`.
+    """
+    def __init__(self, client, rate_limiter, retry_policy):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.metrics = client.metrics
+        self.retry_policy = _with_retry_metrics(retry_policy, self.metrics)
+        self.me = client.me
+    
+    @classmethod
+    async def create(cls, handle, app_password, rate_limiter=None, retry_policy=None, base_url=None, request=None, metrics=None):
+        """Create a client and login to Bluesky (see BlueskyAPI for base_url, request and metrics)"""
+        rate_limiter = rate_limiter or RateLimiter()
+        client = AsyncRateLimitedClient(rate_limiter, base_url, request=request, metrics=metrics)
+        await client.login(handle, app_password)
+        api = cls(client, rate_limiter, retry_policy)
+        print(f"Logged in as {api.me.handle} (DID: {api.me.did})")
+        return api
+    
+    async def close(self):
+        """Close the shared HTTP session"""
+        await self.client.request.close()
+    
+    async def get_profile(self, actor):
+        """Get a user's profile information (see BlueskyAPI.get_profile)"""
+        try:
+            profile = await self.retry_policy.call_async(self.client.app.bsky.actor.get_profile, {'actor': actor})
+            return profile
+        except Exception as e:
+            if not _account_gone(e):
+                raise ProfileError(actor, e) from e
+            print(f"Error getting profile for {actor}: {e}")
+            return None
+    
+    async def _iter_pages(self, method, direction, actor, cursor):
+        """Page through a follows/followers listing, retrying failed pages"""
+        while True:
+            params = {
+                'actor': actor,
+                'limit': 100
+            }
+            if cursor:
+                params['cursor'] = cursor
+            
+            try:
+                resp = await self.retry_policy.call_async(method, params)
+            except Exception as e:
+                raise PaginationError(actor, direction, cursor, [], e) from e
+                
+            cursor = resp.cursor
+            yield Page(to_actors(getattr(resp, direction)), cursor)
+            if not cursor:
+                break
+        
+    def iter_follows(self, actor, cursor=None):
+        """Async-iterate pages of the accounts this actor follows (see BlueskyAPI.iter_follows)"""
+        return self._iter_pages(self.client.app.bsky.graph.get_follows, 'follows', actor, cursor)
+    
+    def iter_followers(self, actor, cursor=None):
+        """Async-iterate pages of the accounts that follow this actor"""
+        return self._iter_pages(self.client.app.bsky.graph.get_followers, 'followers', actor, cursor)
+    
+    async def get_all_follows(self, actor, cursor=None):
+        """Get all accounts that this actor follows (see BlueskyAPI.get_all_follows)"""
+        return await _collect_async(self.iter_follows(actor, cursor))
+        
+    async def get_all_followers(self, actor, cursor=None):
+        """Get all accounts that follow this actor (see BlueskyAPI.get_all_followers)"""
+        return await _collect_async(self.iter_followers(actor, cursor))
+    
+    async def get_relationships(self, actor, others):
+        """Get actor's relationship to each DID in others (batches of 30 run concurrently)"""
+        responses = await asyncio.gather(*(
+            self.retry_policy.call_async(
+                self.client.app.bsky.graph.get_relationships,
+                {'actor': actor, 'others': others[i:i + RELATIONSHIPS_BATCH]}
+            )
+            for i in range(0, len(others), RELATIONSHIPS_BATCH)
+        ))
+        # Deleted/unknown accounts come back as notFoundActor, which has no follow fields
+        return [r for resp in responses for r in resp.relationships if not getattr(r, 'not_found', False)]
+    
+    async def find_mutuals(self, actor, smaller_side_first=False, profile=None):
+        """Find mutual follows for an actor (see BlueskyAPI.find_mutuals)"""
+        if smaller_side_first:
+            profile = profile or await self.get_profile(actor)
+            side = pick_smaller_side(profile) if profile else None
+            if side:
+                if side == 'follows':
+                    actors = await self.get_all_follows(actor)
+                else:
+                    actors = await self.get_all_followers(actor)
+                relationships = await self.get_relationships(actor, [a.did for a in actors])
+                return _mutual_result(side, actors, relationships)
+        
+        # Both lists are paged concurrently
+        follows, followers = await asyncio.gather(
+            self.get_all_follows(actor),
+            self.get_all_followers(actor)
+        )
+        
+        follows_set = {f.did for f in follows}
+        followers_set = {f.did for f in followers}
+        
+        # Get intersection (mutuals)
+        mutuals = follows_set & followers_set
+        
+        return {
+            'follows': follows,
+            'followers': followers,
+            'mutuals': mutuals
+        }
+    
+    async def get_profiles_batch(self, actors):
+        """Get multiple profiles at once (up to 25, see get_profiles for more)"""
         try:
             # API only allows 25 at a time
-            if len(actors) > 25:
-                actors = actors[:25]
+            if len(actors) > PROFILES_BATCH:
+                actors = actors[:PROFILES_BATCH]
             
-            resp = self.client.app.bsky.actor.get_profiles({'actors': actors})
+            resp = await self.retry_policy.call_async(self.client.app.bsky.actor.get_profiles, {'actors': actors})
             return resp.profiles
         except Exception as e:
             print(f"Error getting batch profiles: {e}")
             return []
+
+    async def get_profiles(self, actors):
+        """Get profiles for any number of actors, keyed by DID (all 25-actor calls run concurrently)"""
+        batches = await asyncio.gather(*(
+            self.get_profiles_batch(actors[i:i + PROFILES_BATCH])
+            for i in range(0, len(actors), PROFILES_BATCH)
+        ))
+        return {p.did: p for batch in batches for p in batch}
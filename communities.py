@@ -0,0 +1,152 @@
+"""
+Community detection on sparse graphs
+
+find_communities in analysis.py copies the graph with G.to_undirected()
+and runs python-louvain in pure Python, which takes hours on a full
+crawl. The methods here work on a SparseGraph (sparse_graph.py) turned
+into one symmetric weighted CSR matrix:
+
+- label_propagation: numpy/scipy label propagation, no extra dependencies
+- leiden, louvain: igraph's C implementations (pip install igraph)
+
+Every method takes the symmetric matrix and returns a community number
+per node; add your own to METHODS. find_communities_sparse returns the
+same {did: community} dict as analysis.find_communities.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+import os, time
+
+def symmetrize(graph):
+    """
+    Undirected weighted adjacency: 1 per follow in either direction, so a
+    mutual pair weighs 2 however it was stored (one flagged row, two
+    rows, or two flagged rows)
+    """
+    A = graph.adjacency
+    flagged = A.copy()
+    flagged.data = graph.mutual.astype(np.int8)
+    flagged.eliminate_zeros()
+    # Every follow once: the stored rows plus the reverse follow a flag implies
+    follows = ((A + flagged.T) > 0).astype(np.int8)
+    W = (follows + follows.T).tocsr().astype(np.float32)
+    W.setdiag(0)
+    W.eliminate_zeros()
+    return W
+
+def modularity(W, labels):
+    """Newman modularity of a partition of the symmetric matrix W"""
+    total = W.data.sum()
+    if total == 0:
+        return 0.0
+    rows = np.repeat(np.arange(W.shape[0]), np.diff(W.indptr))
+    inside = W.data[labels[rows] == labels[W.indices]].sum()
+    community_degree = np.bincount(labels, weights=np.asarray(W.sum(axis=1)).ravel())
+    return float(inside / total - ((community_degree / total) ** 2).sum())
+
+def _best_labels(W, nodes, labels, onehot, rng):
+    """For each of `nodes`, the label with the most edge weight among its neighbours"""
+    # Neighbour weight per (node, label): one sparse product with the one-hot label matrix
+    votes = (W[nodes] @ onehot).tocsr()
+    counts = np.diff(votes.indptr)
+    best = labels[nodes].copy()  # Nodes without neighbours keep their label
+    has_votes = counts > 0
+    if not has_votes.any():
+        return best
+    # Random jitter (< any real weight difference) breaks ties without favouring low labels
+    data = votes.data + rng.random(len(votes.data), dtype=np.float32) * 1e-3
+    row_max = np.maximum.reduceat(data, votes.indptr[:-1][has_votes])
+    winners = data == np.repeat(row_max, counts[has_votes])
+    winner_rows = np.repeat(np.arange(len(nodes)), counts)[winners]
+    _, first = np.unique(winner_rows, return_index=True)
+    best[has_votes] = votes.indices[winners][first]
+    return best
+
+def label_propagation(W, seed=0, max_iter=30, tol=1e-3, batches=8, threads=None):
+    """
+    Semi-synchronous label propagation
+    
+    Every node starts in its own community and repeatedly takes the label
+    carrying the most edge weight among its neighbours. Each iteration
+    updates the nodes in `batches` random groups, one after another
+    (updating everyone at once makes labels oscillate), and each group is
+    split over `threads` worker threads. Stops when fewer than `tol` of
+    the nodes change.
+    """
+    rng = np.random.default_rng(seed)
+    n = W.shape[0]
+    labels = np.arange(n, dtype=np.int32)
+    threads = threads or os.cpu_count() or 1
+    with ThreadPoolExecutor(threads) as pool:
+        for iteration in range(max_iter):
+            changed = 0
+            for group in np.array_split(rng.permutation(n), batches):
+                onehot = sp.csr_matrix((np.ones(n, dtype=np.float32), labels, np.arange(n + 1)), shape=(n, n))
+                chunks = np.array_split(group, threads)
+                seeds = rng.integers(0, 2**32, len(chunks))
+                # Every chunk votes on the same labels; apply the results once all are in
+                results = list(pool.map(
+                    lambda args: _best_labels(W, args[0], labels, onehot, np.random.default_rng(args[1])),
+                    zip(chunks, seeds)))
+                for chunk, best in zip(chunks, results):
+                    changed += int((labels[chunk] != best).sum())
+                    labels[chunk] = best
+            if changed <= tol * n:
+                break
+    return labels
+
+def _igraph(W):
+    try:
+        import igraph
+    except ImportError:
+        raise SystemExit("Install igraph for Leiden/Louvain: pip install igraph")
+    upper = sp.triu(W, k=1).tocoo()
+    g = igraph.Graph(n=W.shape[0], edges=np.column_stack((upper.row, upper.col)).tolist())
+    return g, upper.data.tolist()
+
+def leiden(W, seed=0):
+    """Leiden (modularity) with igraph"""
+    import random
+    g, weights = _igraph(W)
+    random.seed(seed)  # igraph draws from Python's random module
+    return np.array(g.community_leiden(objective_function='modularity', weights=weights, n_iterations=-1).membership)
+
+def louvain(W, seed=0):
+    """Louvain (multilevel) with igraph"""
+    import random
+    g, weights = _igraph(W)
+    random.seed(seed)
+    return np.array(g.community_multilevel(weights=weights).membership)
+
+# name -> function(W, seed) returning a community number per node
+METHODS = {
+    'label_propagation': label_propagation,
+    'leiden': leiden,
+    'louvain': louvain,
+}
+
+def find_communities_sparse(graph, method='label_propagation', seed=0):
+    """
+    Find communities in a SparseGraph with one of METHODS
+    
+    Returns {did: community}, numbered from 0 = largest. The labels
+    array (by node index) is also kept as graph.community.
+    """
+    print(f"\nFinding communities ({method})...")
+    started = time.time()
+    W = symmetrize(graph)
+    labels = np.asarray(METHODS[method](W, seed=seed))
+    
+    # Renumber by size, largest first
+    _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(sizes), dtype=np.int32)
+    rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+    labels = rank[labels]
+    graph.community = labels
+    
+    print(f"Found {len(sizes)} communities in {time.time() - started:.1f}s")
+    print(f"Largest community: {sizes.max() if len(sizes) else 0} users")
+    print(f"Modularity: {modularity(W, labels):.3f}")
+    return dict(zip(graph.dids.tolist(), labels.tolist()))
@@ -0,0 +1,129 @@
+"""
+Background writer thread for FurryNetworkDB
+
+Wrap a database in DBWriter and the crawl code doesn't change, but the
+write methods (add_users, add_follows, mark_as_crawled, ...) only put
+the write on a bounded queue and return. One writer thread applies them
+in large transactions while the crawler goes on to fetch the next page.
+
+Reads wait until every queued write has been applied, so they always
+see the crawler's own writes. When the queue is full, writes block until
+the writer catches up, so memory can't grow without bound if SQLite falls
+behind the network.
+
+If a write fails, nothing queued after it is applied (it may depend on
+the failed one), and every later write, flush or close raises
+DBWriteError, so the crawl stops instead of carrying on without saving.
+"""
+
+from contextlib import contextmanager
+import queue
+import threading
+
+# FurryNetworkDB methods that only write, and so can be queued
+WRITE_METHODS = {
+    'add_user', 'add_users', 'add_missing_users', 'add_follow', 'add_follows',
+    'mark_as_crawled', 'mark_as_mutual_core', 'save_cursor', 'clear_cursors',
+    'enqueue', 'set_queue_status', 'requeue', 'clear_queue', 'rebuild_core_degrees',
+    'save_user_scores',
+}
+
+class DBWriteError(RuntimeError):
+    """The writer thread failed to apply a write; later writes were dropped"""
+
+class DBWriter:
+    def __init__(self, db, max_pending=256, batch_size=64):
+        """
+        Args:
+            db: FurryNetworkDB to write to; don't use it directly while wrapped
+            max_pending: Queued write groups before writers block (backpressure)
+            batch_size: Most write groups applied in one transaction
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_pending)
+        self.error = None  # First exception raised by the writer thread (kept for good)
+        self._group = None  # Writes collected inside transaction()
+        self._group_depth = 0
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                if self.error is None:
+                    with self.db.transaction():
+                        for group in batch:
+                            for name, args, kwargs in group or ():
+                                getattr(self.db, name)(*args, **kwargs)
+            except Exception as e:
+                self.error = e
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            
+            if batch[-1] is None:
+                return
+    
+    def _raise_error(self):
+        if self.error is not None:
+            raise DBWriteError(f"Database write failed: {self.error}") from self.error
+    
+    def _write(self, name, args, kwargs):
+        self._raise_error()
+        if self._group is not None:
+            self._group.append((name, args, kwargs))
+        else:
+            self.queue.put([(name, args, kwargs)])  # Blocks while the queue is full
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Like FurryNetworkDB.transaction: the writes in the block are applied
+        together in one transaction (reads in the block don't see them yet)
+        """
+        if self._group_depth == 0:
+            self._group = []
+        self._group_depth += 1
+        try:
+            yield self
+        finally:
+            self._group_depth -= 1
+            if self._group_depth == 0:
+                group, self._group = self._group, None
+        if self._group_depth == 0 and group:
+            self._raise_error()
+            self.queue.put(group)
+    
+    def flush(self):
+        """Wait until every queued write is committed"""
+        self.queue.join()
+        self._raise_error()
+        self.db.flush()
+    
+    def close(self):
+        """
+        Apply the remaining writes, stop the writer thread and close the
+        database; raises DBWriteError afterwards if any write failed
+        """
+        self.queue.join()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is None:
+            self.db.flush()
+        self.db.close()
+        self._raise_error()
+    
+    def __getattr__(self, name):
+        if name in WRITE_METHODS:
+            return lambda *args, **kwargs: self._write(name, args, kwargs)
+        # Anything else reads the database, so let pending writes land first
+        self.flush()
+        return getattr(self.db, name)
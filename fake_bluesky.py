@@ -0,0 +1,283 @@
+"""
+Offline stand-in for the Bluesky API, for tests and benchmarks
+
+FakeBluesky answers the XRPC calls the crawler makes (getProfile,
+getProfiles, getFollows, getFollowers, getRelationships and the login
+calls) from an in-memory follow graph. It plugs in underneath atproto as
+an httpx transport, so BlueskyAPI, the retry policy and the rate limiter
+all run exactly as they do against bsky.social - only the network is
+gone. Pagination uses real cursors, and latency, 429s and 5xx errors can
+be added to see how the crawl copes with them:
+
+    fake = FakeBluesky(follows, latency=0.05, error_rate=0.01)
+    api = fake.api()
+    phase1_mutuals_graph(api, db, api.me.did)
+    print(fake.calls)
+
+`follows` maps each DID to the DIDs it follows; followers are worked out
+from that. FakeBluesky.random_graph() builds a small random graph to try it out.
+"""
+
+from bluesky_api import AsyncBlueskyAPI, BlueskyAPI
+from rate_limiter import RateLimiter
+from retry import RetryPolicy
+from atproto import AsyncRequest, Request
+from collections import Counter
+import asyncio
+import base64
+import httpx
+import json
+import random
+import threading
+import time
+
+BASE_URL = 'https://fake.bsky.test'
+PASSWORD = 'fake-app-password'
+
+# Largest page getFollows/getFollowers return, like the real API
+MAX_PAGE_SIZE = 100
+
+# Statuses picked from for injected errors
+ERROR_STATUSES = (429, 500, 502, 503)
+
+def _fake_jwt(did):
+    """Unsigned token that atproto can read an expiry time from"""
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+    return f"{part({'alg': 'none'})}.{part({'sub': did, 'exp': int(time.time()) + 86400})}.fake"
+
+class FakeBluesky:
+    def __init__(self, follows, profiles=None, latency=0.0, error_rate=0.0, error_statuses=ERROR_STATUSES,
+                 rate_limit=None, rate_window=300, account=None, seed=0):
+        """
+        Args:
+            follows: Dict of DID -> DIDs it follows
+            profiles: Optional dict of DID -> {'handle', 'displayName', 'description'}
+            latency: Seconds every request takes
+            error_rate: Fraction of (non-login) requests that fail with one of error_statuses
+            error_statuses: HTTP statuses injected errors use
+            rate_limit: Requests allowed per rate_window seconds, with ratelimit-*
+                headers and 429s like the real API (None = unlimited, no headers)
+            rate_window: Length of a rate limit window, in seconds
+            account: DID that logs in (default: the first DID in follows)
+            seed: Seed for picking which requests fail
+        """
+        self.follows = {did: list(dict.fromkeys(following)) for did, following in follows.items()}
+        # Everyone mentioned gets an account, even if only as a followee
+        for following in list(self.follows.values()):
+            for did in following:
+                self.follows.setdefault(did, [])
+        self.followers = {did: [] for did in self.follows}
+        for did, following in self.follows.items():
+            for other in following:
+                self.followers[other].append(did)
+        self.follow_sets = {did: set(following) for did, following in self.follows.items()}
+        
+        profiles = profiles or {}
+        self.profiles = {}
+        self.by_handle = {}
+        for did in self.follows:
+            profile = profiles.get(did, {})
+            handle = profile.get('handle') or f"{did.rsplit(':', 1)[-1]}.test"
+            self.profiles[did] = {
+                'did': did,
+                'handle': handle,
+                'displayName': profile.get('displayName', handle.split('.')[0]),
+                'description': profile.get('description', ''),
+            }
+            self.by_handle[handle] = did
+        
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.account = account or next(iter(self.follows))
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.window_start = time.time()
+        self.window_used = 0
+        self.calls = Counter()  # XRPC method name -> requests, including failed ones
+        self.responses = Counter()  # HTTP status -> responses sent
+    
+    @classmethod
+    def random_graph(cls, users=500, avg_follows=30, mutual_rate=0.5, seed=0, **kwargs):
+        """
+        Fake server over a random graph: each user follows about avg_follows
+        others, and each follow is followed back with probability mutual_rate
+        """
+        rng = random.Random(seed)
+        dids = [f'did:plc:fake{i:06d}' for i in range(users)]
+        follows = {did: set() for did in dids}
+        for did in dids:
+            for other in rng.sample(dids, min(users, avg_follows)):
+                if other != did:
+                    follows[did].add(other)
+                    if rng.random() < mutual_rate:
+                        follows[other].add(did)
+        return cls({did: sorted(following) for did, following in follows.items()}, seed=seed, **kwargs)
+    
+    def api(self, handle=None, rate_limiter=None, retry_policy=None):
+        """
+        Logged-in BlueskyAPI talking to this server
+        
+        Unless given, the rate limiter only holds back when the server says
+        so (see rate_limit), and retries wait milliseconds instead of seconds.
+        """
+        return BlueskyAPI(
+            handle or self.profiles[self.account]['handle'], PASSWORD,
+            rate_limiter=rate_limiter or RateLimiter(rate=1e9, burst=1e9),
+            retry_policy=retry_policy or RetryPolicy(base_delay=0.01, max_delay=0.1),
+            base_url=BASE_URL, request=Request(transport=self.transport())
+        )
+    
+    async def async_api(self, handle=None, rate_limiter=None, retry_policy=None):
+        """Logged-in AsyncBlueskyAPI talking to this server (see api)"""
+        return await AsyncBlueskyAPI.create(
+            handle or self.profiles[self.account]['handle'], PASSWORD,
+            rate_limiter=rate_limiter or RateLimiter(rate=1e9, burst=1e9),
+            retry_policy=retry_policy or RetryPolicy(base_delay=0.01, max_delay=0.1),
+            base_url=BASE_URL, request=AsyncRequest(transport=self.async_transport())
+        )
+    
+    def transport(self):
+        """httpx transport for a (sync) atproto Request"""
+        def handler(request):
+            if self.latency:
+                time.sleep(self.latency)
+            return self.respond(request)
+        return httpx.MockTransport(handler)
+    
+    def async_transport(self):
+        """httpx transport for an atproto AsyncRequest"""
+        async def handler(request):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return self.respond(request)
+        return httpx.MockTransport(handler)
+    
+    def respond(self, request):
+        """Answer one XRPC request"""
+        method = request.url.path.rsplit('/', 1)[-1]
+        login = method.startswith('com.atproto.server.')
+        with self.lock:
+            self.calls[method] += 1
+            headers = self._rate_limit_headers() if not login else {}
+            if headers and self.window_used > self.rate_limit:
+                return self._error(429, 'RateLimitExceeded', 'Rate Limit Exceeded', headers)
+            if not login and self.error_rate and self.random.random() < self.error_rate:
+                status = self.random.choice(self.error_statuses)
+                if status == 429:
+                    headers = {'ratelimit-remaining': '0', 'ratelimit-reset': str(int(time.time()) + 1)}
+                    return self._error(429, 'RateLimitExceeded', 'Rate Limit Exceeded', headers)
+                return self._error(status, 'InternalServerError', 'Injected error', headers)
+        
+        handler = getattr(self, '_' + method.replace('.', '_'), None)
+        if handler is None:
+            return self._error(501, 'MethodNotImplemented', f'{method} is not faked')
+        try:
+            body = handler(request)
+        except LookupError as e:
+            return self._error(400, 'InvalidRequest', str(e.args[0]), headers)
+        with self.lock:
+            self.responses[200] += 1
+        return httpx.Response(200, json=body, headers=headers)
+    
+    def _rate_limit_headers(self):
+        """Count a request against the current window (call with the lock held)"""
+        if self.rate_limit is None:
+            return {}
+        now = time.time()
+        if now - self.window_start >= self.rate_window:
+            self.window_start = now
+            self.window_used = 0
+        self.window_used += 1
+        return {
+            'ratelimit-limit': str(self.rate_limit),
+            'ratelimit-remaining': str(max(0, self.rate_limit - self.window_used)),
+            'ratelimit-reset': str(int(self.window_start + self.rate_window)),
+        }
+    
+    def _error(self, status, error, message, headers=None):
+        with self.lock:
+            self.responses[status] += 1
+        return httpx.Response(status, json={'error': error, 'message': message}, headers=headers)
+    
+    def _resolve(self, actor):
+        """DID for a DID or handle; LookupError if there is no such account"""
+        did = actor if actor in self.profiles else self.by_handle.get(actor)
+        if did is None:
+            raise LookupError('Profile not found')
+        return did
+    
+    def _profile_view(self, did, detailed=False):
+        view = dict(self.profiles[did])
+        if detailed:
+            view['followersCount'] = len(self.followers[did])
+            view['followsCount'] = len(self.follows[did])
+            view['postsCount'] = 0
+        return view
+    
+    def _page(self, request, key, dids):
+        """One page of a follows/followers listing; the cursor is an offset into the list"""
+        params = request.url.params
+        subject = self._resolve(params['actor'])
+        start = int(params.get('cursor') or 0)
+        limit = min(int(params.get('limit') or 50), MAX_PAGE_SIZE)
+        actors = dids[subject][start:start + limit]
+        body = {'subject': self._profile_view(subject), key: [self._profile_view(did) for did in actors]}
+        if start + limit < len(dids[subject]):
+            body['cursor'] = str(start + limit)
+        return body
+    
+    def _session(self, did):
+        return {
+            'did': did,
+            'handle': self.profiles[did]['handle'],
+            'accessJwt': _fake_jwt(did),
+            'refreshJwt': _fake_jwt(did),
+            'active': True,
+        }
+    
+    def _com_atproto_server_createSession(self, request):
+        identifier = json.loads(request.content)['identifier']
+        did = identifier if identifier in self.profiles else self.by_handle.get(identifier, self.account)
+        return self._session(did)
+    
+    def _com_atproto_server_refreshSession(self, request):
+        return self._session(self.account)
+    
+    def _app_bsky_actor_getProfile(self, request):
+        return self._profile_view(self._resolve(request.url.params['actor']), detailed=True)
+    
+    def _app_bsky_actor_getProfiles(self, request):
+        profiles = []
+        for actor in request.url.params.get_list('actors'):
+            try:
+                profiles.append(self._profile_view(self._resolve(actor), detailed=True))
+            except LookupError:
+                continue  # Like the real API: unknown actors are left out
+        return {'profiles': profiles}
+    
+    def _app_bsky_graph_getFollows(self, request):
+        return self._page(request, 'follows', self.follows)
+    
+    def _app_bsky_graph_getFollowers(self, request):
+        return self._page(request, 'followers', self.followers)
+    
+    def _app_bsky_graph_getRelationships(self, request):
+        params = request.url.params
+        actor = self._resolve(params['actor'])
+        relationships = []
+        for other in params.get_list('others'):
+            did = other if other in self.profiles else self.by_handle.get(other)
+            if did is None:
+                relationships.append({'$type': 'app.bsky.graph.defs#notFoundActor', 'actor': other, 'notFound': True})
+                continue
+            relationship = {'$type': 'app.bsky.graph.defs#relationship', 'did': did}
+            if did in self.follow_sets[actor]:
+                relationship['following'] = f'at://{actor}/app.bsky.graph.follow/{did.rsplit(":", 1)[-1]}'
+            if actor in self.follow_sets[did]:
+                relationship['followedBy'] = f'at://{did}/app.bsky.graph.follow/{actor.rsplit(":", 1)[-1]}'
+            relationships.append(relationship)
+        return {'actor': actor, 'relationships': relationships}
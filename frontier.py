@@ -0,0 +1,61 @@
+"""
+Priority queue of users waiting to be crawled
+
+Phase 2 crawls the users with the most connections to the mutual core
+first, so a max_users budget is spent on the most clearly in-community
+accounts. push/pop are O(log n) and membership checks are O(1).
+
+A user's priority can be raised while it is queued: the new entry goes on
+the heap and the old one is skipped when it comes up (lazy deletion), so
+there is no O(n) search for it.
+"""
+
+import heapq
+import itertools
+
+class Frontier:
+    def __init__(self, items=()):
+        """
+        Args:
+            items: Initial (did, priority) pairs
+        """
+        self.heap = []  # [-priority, order pushed, did] lists; may hold stale entries
+        self.entries = {}  # did -> its live heap entry
+        self.counter = itertools.count()
+        for did, priority in items:
+            self.push(did, priority)
+    
+    def push(self, did, priority):
+        """Queue a user, or raise its priority if already queued; returns False if nothing changed"""
+        if did in self.entries and priority <= self[did]:
+            return False
+        entry = [-priority, next(self.counter), did]
+        self.entries[did] = entry
+        heapq.heappush(self.heap, entry)
+        return True
+    
+    def pop(self):
+        """Remove and return the highest-priority DID (first pushed wins ties)"""
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            did = entry[2]
+            if self.entries.get(did) is entry:
+                del self.entries[did]
+                return did
+        raise IndexError('pop from an empty Frontier')
+    
+    def __iter__(self):
+        """Queued DIDs, roughly best first (heap order, not fully sorted)"""
+        for entry in self.heap:
+            if self.entries.get(entry[2]) is entry:
+                yield entry[2]
+    
+    def __contains__(self, did):
+        return did in self.entries
+    
+    def __getitem__(self, did):
+        """Current priority of a queued DID"""
+        return -self.entries[did][0]
+    
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,126 @@
+"""
+k-core decomposition of the mutual-follow graph
+
+Phase 2 admits anyone with at least MIN_CONNECTIONS connections to the
+mutual core, which counts every connection the same whether it comes
+from the middle of the fandom or its edge. The k-core of the mutual
+graph is the largest group of users who each have at least k mutuals
+*inside the group*, and a user's core number is the largest k whose
+k-core they are in - a stricter, self-consistent notion of "in the
+fandom" that needs no extra crawling:
+
+    cores = core_numbers(graph.mutual_adjacency())
+    threshold_report(graph, cores)     # who each threshold would admit
+    save_core_numbers('furry_network.db', graph, cores)
+
+core_numbers is the Batagelj-Zaversnik bucket algorithm, O(edges).
+Saved core numbers go to users.core_number, e.g. for
+SELECT did, handle FROM users WHERE crawled = 0 AND core_number >= 5.
+"""
+
+from storage import FurryNetworkDB
+from sparse_graph import load_sparse_graph
+import numpy as np
+import sys, time
+
+# Thresholds threshold_report shows, up to the largest core number
+THRESHOLDS = (1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 75, 100, 150, 200)
+
+def core_numbers(M):
+    """
+    Core number of every node of a symmetric CSR matrix without self-loops
+    
+    Nodes sit in an array sorted by remaining degree, with the start of
+    each degree's bucket kept in bin_start. Taking nodes in order and
+    moving each of their neighbours one bucket down (a swap with the
+    first node of its bucket) peels the graph in one pass.
+    """
+    n = M.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.int32)
+    degrees = np.diff(M.indptr)
+    bin_start = np.concatenate(([0], np.cumsum(np.bincount(degrees))))[:-1].tolist()
+    vert = np.argsort(degrees, kind='stable')
+    pos = np.empty(n, dtype=np.int64)
+    pos[vert] = np.arange(n)
+    # Python lists: element access is several times faster than on numpy arrays
+    degree, vert, pos = degrees.tolist(), vert.tolist(), pos.tolist()
+    indptr, indices = M.indptr.tolist(), M.indices
+    
+    for i in range(n):
+        v = vert[i]
+        dv = degree[v]
+        for u in indices[indptr[v]:indptr[v + 1]].tolist():
+            du = degree[u]
+            if du > dv:
+                # Swap u with the first node of its bucket, then shrink the bucket past it
+                pu, pw = pos[u], bin_start[du]
+                w = vert[pw]
+                if u != w:
+                    vert[pu], vert[pw] = w, u
+                    pos[w], pos[u] = pu, pw
+                bin_start[du] += 1
+                degree[u] = du - 1
+    return np.array(degree, dtype=np.int32)
+
+def core_degrees(graph):
+    """core_degree as storage.py keeps it: distinct mutual-core users each user is connected to"""
+    connected = (graph.adjacency + graph.adjacency.T).tocsr()
+    connected.setdiag(0)
+    connected.eliminate_zeros()
+    connected.data[:] = 1
+    return connected @ graph.is_mutual_core.astype(np.int32)
+
+def threshold_report(graph, cores, min_connections=3, thresholds=THRESHOLDS):
+    """
+    For each threshold k, print how many users are in the k-core and
+    how many not yet crawled users a crawl targeting core number >= k
+    would admit, next to what Phase 2's rule admits with
+    min_connections = k. Returns the rows as dicts.
+    """
+    uncrawled = ~graph.crawled
+    core_degree = core_degrees(graph)
+    max_core = int(cores.max()) if len(cores) else 0
+    print(f"\nMutual k-cores (max core number {max_core}):")
+    print(f"  {'k':>5} {'in k-core':>10} {'uncrawled':>10} {'Phase 2 rule':>13} {'both':>8}")
+    rows = []
+    for k in sorted({*(t for t in thresholds if t <= max_core), min_connections}):
+        in_core = cores >= k
+        by_core = in_core & uncrawled
+        by_rule = (core_degree >= k) & uncrawled
+        row = {
+            'k': k,
+            'in_core': int(in_core.sum()),
+            'uncrawled_in_core': int(by_core.sum()),
+            'phase2_rule': int(by_rule.sum()),
+            'both': int((by_core & by_rule).sum()),
+        }
+        rows.append(row)
+        marker = '  <- MIN_CONNECTIONS' if k == min_connections else ''
+        print(f"  {k:>5} {row['in_core']:>10} {row['uncrawled_in_core']:>10} {row['phase2_rule']:>13} {row['both']:>8}{marker}")
+    return rows
+
+def save_core_numbers(db_path, graph, cores):
+    """Write core numbers to users.core_number"""
+    db = FurryNetworkDB(db_path)
+    try:
+        db.save_user_scores('core_number', zip(graph.dids.tolist(), cores.tolist()))
+    finally:
+        db.close()
+
+def decompose_graph(graph, db_path=None, min_connections=3):
+    """Core numbers of a SparseGraph's mutual graph, with the threshold report; optionally saved"""
+    print("\nComputing mutual k-cores...")
+    started = time.time()
+    cores = core_numbers(graph.mutual_adjacency())
+    graph.core_number = cores
+    print(f"Core numbers computed in {time.time() - started:.1f}s")
+    threshold_report(graph, cores, min_connections)
+    if db_path:
+        save_core_numbers(db_path, graph, cores)
+        print(f"\nSaved core numbers to users.core_number in {db_path}")
+    return cores
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'furry_network.db'
+    decompose_graph(load_sparse_graph(db_path), db_path)
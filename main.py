@@ -1,15 +1,309 @@
-from bluesky_api import BlueskyAPI
+from bluesky_api import BlueskyAPI, PaginationError, ProfileError, pick_smaller_side, prefetch_pages
+from db_writer import DBWriter
+from frontier import Frontier
+from metrics import TextfileExporter
 from storage import FurryNetworkDB
-import time, os
+from collections import deque
+import os
 
 # Configuration
 BLUESKY_HANDLE = os.getenv("BLUESKY_HANDLE")
 BLUESKY_APP_PASSWORD = os.getenv("BLUESKY_APP_PASSWORD")
 
+# Phase 1 settings
+# Only fetch the smaller of follows/followers for each mutual-core user and
+# resolve mutuals with getRelationships. Far fewer requests for popular
+# accounts, but Phase 2 then only sees that side of their connections.
+PHASE1_MUTUALS_ONLY = False
+
 # Phase 2 settings
 MIN_CONNECTIONS = 3  # Minimum connections to existing graph members to be added
 
-def phase1_mutuals_graph(api, db, seed_account, max_users=None):
+# Profiles of this many upcoming queue entries are fetched together
+# (getProfiles calls of 25, run concurrently) instead of one call per user
+PROFILE_PREFETCH = 500
+
+# Create a new database with the compact schema (integer user ids, far
+# smaller on disk). Existing files keep their schema - see migrate_compact.py
+COMPACT_DB = False
+
+# Write to SQLite on a background thread (see db_writer.py), so commits
+# overlap with fetching the next page instead of holding it up
+PIPELINED_WRITES = True
+
+# Write API request metrics in Prometheus text format to this file (e.g.
+# node_exporter's textfile directory) every METRICS_INTERVAL seconds
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+METRICS_INTERVAL = 15
+
+class ProfileCache:
+    """
+    Hydrates the profiles of upcoming queue entries in bulk
+    
+    The first lookup that misses fetches the next PROFILE_PREFETCH queued
+    users with api.get_profiles; the following lookups are then free.
+    """
+    def __init__(self, api, window=PROFILE_PREFETCH):
+        self.api = api
+        self.window = window
+        self.profiles = {}  # did -> profile, only for users not crawled yet
+    
+    def get(self, did, upcoming=(), skip=()):
+        """
+        Get a user's profile (None if the account is gone; raises
+        ProfileError if it can't be fetched right now)
+        
+        upcoming is the rest of the queue, in crawl order; DIDs in skip
+        (e.g. already processed) are not prefetched.
+        """
+        if did not in self.profiles:
+            batch = {did: None}
+            for queued_did in upcoming:
+                if len(batch) >= self.window:
+                    break
+                if queued_did not in self.profiles and queued_did not in skip:
+                    batch[queued_did] = None
+            self.profiles.update(self.api.get_profiles(list(batch)))
+        
+        profile = self.profiles.pop(did, None)
+        if profile is None:
+            # Missing from the bulk response - ask on its own to get the error
+            profile = self.api.get_profile(did)
+        return profile
+    
+    def drop(self, did):
+        """Forget a prefetched profile the crawl won't use (the user was crawled or skipped already)"""
+        self.profiles.pop(did, None)
+    
+    def clear(self):
+        """Forget every prefetched profile, e.g. at the end of a phase"""
+        self.profiles.clear()
+
+def save_profile(db, profile):
+    """Store a fetched profile (with full counts) in the database"""
+    db.add_user(
+        did=profile.did,
+        handle=profile.handle,
+        display_name=getattr(profile, 'display_name', None),
+        followers_count=getattr(profile, 'followers_count', 0),
+        follows_count=getattr(profile, 'follows_count', 0),
+        description=getattr(profile, 'description', '')
+    )
+
+class ConnectionWriter:
+    """
+    Writes a crawled user's follows and followers to the database page by page
+    
+    Follows must be added before followers. In Phase 1 (mutual_core=True)
+    a mutual pair is stored once, as this user's follow with is_mutual set,
+    and `mutuals` collects them. Phase 2 stores every follow as it is.
+    Only DIDs and handles are kept in memory, never whole profiles.
+    """
+    def __init__(self, db, did, handle, mutual_core):
+        self.db = db
+        self.did = did
+        self.handle = handle
+        self.mutual_core = mutual_core
+        self.follows_dids = set()
+        self.mutuals = set()
+        self.connections = {}  # did -> handle of everyone connected
+        self.follows_count = 0
+        self.followers_count = 0
+
+    def resume(self):
+        """
+        Pick up a fetch that gave up in an earlier run
+        
+        Loads what that run stored and returns the (direction, cursor)
+        fetches still to do, in order.
+        """
+        follows_cursor = self.db.get_cursor(self.did, 'follows')
+        followers_cursor = self.db.get_cursor(self.did, 'followers')
+        if not follows_cursor and not followers_cursor:
+            return [('follows', None), ('followers', None)]
+        
+        stored_follows = self.db.get_stored_connections(self.did, 'follows')
+        for did, handle, _ in stored_follows:
+            self.follows_dids.add(did)
+            self.connections[did] = handle
+        self.follows_count = len(stored_follows)
+        
+        if not followers_cursor:
+            print(f"  Resuming follows fetch ({self.follows_count} already stored)")
+            return [('follows', follows_cursor), ('followers', None)]
+        
+        # Followers are only fetched once follows are complete
+        stored_followers = self.db.get_stored_connections(self.did, 'followers')
+        for did, handle, _ in stored_followers:
+            self.connections[did] = handle
+        if self.mutual_core:
+            self.mutuals = set(self.db.get_mutuals(self.did))
+        self.followers_count = len(stored_followers) + len(self.mutuals)
+        print(f"  Resuming followers fetch ({self.followers_count} already stored)")
+        return [('followers', followers_cursor)]
+    
+    def add_page(self, direction, actors):
+        """Store one page of follows or followers (one bulk write per table)"""
+        users = []
+        follows = []
+        for actor in actors:
+            self.connections[actor.did] = actor.handle
+            users.append((actor.did, actor.handle, actor.display_name))
+            
+            if direction == 'follows':
+                self.follows_dids.add(actor.did)
+                follows.append((self.did, self.handle, actor.did, actor.handle, False))
+            elif self.mutual_core and actor.did in self.follows_dids:
+                # Mutual - flag the follow recorded above instead of adding the reverse edge
+                self.mutuals.add(actor.did)
+                follows.append((self.did, self.handle, actor.did, actor.handle, True))
+            else:
+                follows.append((actor.did, actor.handle, self.did, self.handle, False))
+        
+        with self.db.transaction():
+            # Phase 1 adds/updates everyone; Phase 2 only fills in users we don't know yet
+            if self.mutual_core:
+                self.db.add_users(users)
+            else:
+                self.db.add_missing_users(users)
+            self.db.add_follows(follows)
+        
+        if direction == 'follows':
+            self.follows_count += len(actors)
+        else:
+            self.followers_count += len(actors)
+
+def crawl_connections(api, db, did, handle, mutual_core):
+    """
+    Stream a user's follows and then followers into the database
+
+    Each page is written while the next one is being fetched. If a fetch
+    gives up, its last good cursor is saved (everything before it is
+    already stored) and PaginationError is re-raised; the user must not be
+    marked crawled, and the next run resumes from there.
+    
+    Returns the ConnectionWriter with the collected mutuals/connections.
+    """
+    writer = ConnectionWriter(db, did, handle, mutual_core)
+    for direction, cursor in writer.resume():
+        fetch = api.iter_follows if direction == 'follows' else api.iter_followers
+        try:
+            for page in prefetch_pages(fetch(did, cursor=cursor)):
+                writer.add_page(direction, page.actors)
+        except PaginationError as e:
+            if e.cursor:
+                db.save_cursor(did, direction, e.cursor)
+            raise
+    return writer
+
+def save_mutuals_only(db, did, handle, result):
+    """Store a find_mutuals(smaller_side_first=True) result: the fetched side, with mutuals flagged"""
+    writer = ConnectionWriter(db, did, handle, mutual_core=True)
+    mutuals = result['mutuals']
+    with db.transaction():
+        if result['follows'] is not None:
+            writer.add_page('follows', result['follows'])
+            writer.add_page('followers', [a for a in result['follows'] if a.did in mutuals])
+        else:
+            writer.add_page('follows', [a for a in result['followers'] if a.did in mutuals])
+            writer.add_page('followers', result['followers'])
+    return writer
+
+def crawl_mutuals_only(api, db, did, profile):
+    """
+    Phase 1 crawl that only pages through the smaller side of a user's connections
+    
+    Falls back to crawl_connections when paging through both sides is
+    cheaper anyway. Raises PaginationError if the fetch gives up.
+    """
+    if not pick_smaller_side(profile):
+        return crawl_connections(api, db, did, profile.handle, mutual_core=True)
+    try:
+        result = api.find_mutuals(did, smaller_side_first=True, profile=profile)
+    except PaginationError:
+        raise
+    except Exception as e:
+        raise PaginationError(did, 'relationships', None, [], e) from e
+    return save_mutuals_only(db, did, profile.handle, result)
+
+def scan_initial_candidates(db, min_connections):
+    """Find (did, connection count) of uncrawled users with ≥min_connections to the mutual core"""
+    print("\nScanning uncrawled users for connections to mutual core...")
+    
+    # Debug: Check mutual core count
+    cursor = db.conn.execute('SELECT COUNT(*) FROM users WHERE is_mutual_core = 1')
+    mutual_core_count = cursor.fetchone()[0]
+    print(f"Debug: {mutual_core_count} users in mutual core")
+    
+    # Recount everyone's connections to the core in one pass (cheap, and
+    # picks up any edits made to the database outside the crawler)
+    db.rebuild_core_degrees()
+    
+    # Build initial queue of users with sufficient connections (best connected first)
+    candidates = []
+    for did, handle, connection_count in db.get_phase2_candidates(min_connections):
+        candidates.append((did, connection_count))
+        if len(candidates) <= 10:  # Show the top 10
+            print(f"  {handle}: {connection_count} connections - QUEUED")
+    
+    print(f"\nInitial queue: {len(candidates)} users with ≥{min_connections} connections")
+    return candidates
+
+def find_new_candidates(db, temp_connections, processed, queued, min_connections):
+    """
+    Check a crawled user's connections for users that now qualify for Phase 2
+    
+    Returns (did, connection count) pairs to queue: new candidates, and
+    queued ones whose count went up (queued maps DID -> queued count).
+    """
+    print(f"  Checking {len(temp_connections)} connections for candidates...")
+    
+    # Scan connections for qualified users
+    new_candidates = []
+    skipped_already_processed = 0
+    skipped_already_crawled = 0
+    skipped_in_queue = 0
+    reprioritized = 0
+    skipped_insufficient_connections = 0
+    
+    for conn_did, conn_handle in temp_connections.items():
+        # Skip if already processed or in queue
+        if conn_did in processed:
+            skipped_already_processed += 1
+            continue
+        if db.is_crawled(conn_did):
+            skipped_already_crawled += 1
+            continue
+        
+        # Check connections to mutual core (now they should have recorded relationships!)
+        conn_count = db.get_core_degree(conn_did)
+        if conn_did in queued:
+            if conn_count > queued[conn_did]:
+                new_candidates.append((conn_did, conn_count))
+                reprioritized += 1
+            else:
+                skipped_in_queue += 1
+            continue
+        if conn_count >= min_connections:
+            new_candidates.append((conn_did, conn_count))
+            print(f"    ✓ {conn_handle}: {conn_count} connections to mutual core - QUEUED")
+        else:
+            skipped_insufficient_connections += 1
+            # Show first few examples
+            if skipped_insufficient_connections <= 3:
+                print(f"    ✗ {conn_handle}: only {conn_count} connections (need {min_connections})")
+    
+    print(f"  Results:")
+    print(f"    New candidates: {len(new_candidates) - reprioritized}")
+    print(f"    Moved up the queue: {reprioritized}")
+    print(f"    Skipped - already processed: {skipped_already_processed}")
+    print(f"    Skipped - already in queue: {skipped_in_queue}")
+    print(f"    Skipped - already crawled: {skipped_already_crawled}")
+    print(f"    Skipped - insufficient connections: {skipped_insufficient_connections}")
+    
+    return new_candidates
+
+def phase1_mutuals_graph(api, db, seed_account, max_users=None, mutuals_only=False):
     """
     Phase 1: Build the core mutual network
     
@@ -22,14 +316,26 @@ def phase1_mutuals_graph(api, db, seed_account, max_users=None):
     
     Args:
         max_users: Maximum number of users to crawl (None for unlimited)
+        mutuals_only: Only store the smaller side of each user's connections
+            (see PHASE1_MUTUALS_ONLY)
     """
     print("\n=== PHASE 1: Building Mutual Core Network ===")
     if max_users:
         print(f"Limit: {max_users} users")
     
-    # Queue of users to process (BFS) - only mutuals get added here
-    to_process = [seed_account]
+    # Queue of users to process (BFS) - only mutuals get added here. It is
+    # kept in the crawl_queue table too, so a restarted run carries on
+    # from where this one stopped instead of from the seed, and retries
+    # users whose profile couldn't be fetched last time
+    db.requeue(1, ('failed',))
+    to_process = deque(did for did, _ in db.get_queue(1))
+    if to_process:
+        print(f"Resuming: {len(to_process)} mutuals still queued from the last run")
+    else:
+        to_process.append(seed_account)
+        db.enqueue(1, [(seed_account, 0)])
     processed = set()
+    profiles = ProfileCache(api)
     
     while to_process:
         # Check if we've hit the limit
@@ -37,101 +343,67 @@ def phase1_mutuals_graph(api, db, seed_account, max_users=None):
             print(f"\n⚠️  Reached Phase 1 limit of {max_users} users")
             break
         
-        current_did = to_process.pop(0)
+        current_did = to_process.popleft()
         
         # Skip if already processed
         if current_did in processed or db.is_crawled(current_did):
+            profiles.drop(current_did)
             continue
         
         print(f"\nProcessing: {current_did}")
         
-        # Get profile
-        profile = api.get_profile(current_did)
+        # Get profile (prefetched in bulk with the rest of the queue)
+        try:
+            profile = profiles.get(current_did, to_process, processed)
+        except ProfileError as e:
+            print(f"  {e}")
+            print(f"  Will retry on the next run")
+            db.set_queue_status(1, current_did, 'failed')
+            continue
         if not profile:
             print(f"  Could not fetch profile, skipping")
+            db.set_queue_status(1, current_did, 'skipped')
             continue
         
-        # Get counts
-        followers_count = getattr(profile, 'followers_count', 0)
-        follows_count = getattr(profile, 'follows_count', 0)
-        
         # Add user to database
-        db.add_user(
-            did=profile.did,
-            handle=profile.handle,
-            display_name=getattr(profile, 'display_name', None),
-            followers_count=followers_count,
-            follows_count=follows_count,
-            description=getattr(profile, 'description', '')
-        )
+        save_profile(db, profile)
         
         print(f"  {profile.display_name or profile.handle}")
-        print(f"  Followers: {followers_count}, Following: {follows_count}")
+        print(f"  Followers: {getattr(profile, 'followers_count', 0)}, Following: {getattr(profile, 'follows_count', 0)}")
         
-        # Find mutuals
-        result = api.find_mutuals(current_did)
-        print(f"  Found {len(result['mutuals'])} mutuals")
-        print(f"  Debug: {len(result['follows'])} follows, {len(result['followers'])} followers")
-        
-        # Add ALL connections to database (follows + followers)
+        # Find mutuals, adding ALL connections to database (follows + followers)
         # This includes non-furries, which is fine - we'll filter in Phase 2
-        all_connections = {}  # did -> handle mapping
-        
-        # Add people this user follows
-        for follow in result['follows']:
-            all_connections[follow.did] = follow.handle
-            db.add_user(
-                did=follow.did,
-                handle=follow.handle,
-                display_name=getattr(follow, 'display_name', None)
-            )
-            # Record follow relationship
-            db.add_follow(
-                follower_did=current_did,
-                follower_handle=profile.handle,
-                following_did=follow.did,
-                following_handle=follow.handle,
-                is_mutual=(follow.did in result['mutuals'])
-            )
-        
-        # Add people who follow this user
-        follows_dids = {f.did for f in result['follows']}  # More efficient lookup
-        for follower in result['followers']:
-            all_connections[follower.did] = follower.handle
-            db.add_user(
-                did=follower.did,
-                handle=follower.handle,
-                display_name=getattr(follower, 'display_name', None)
-            )
-            # Record follow relationship (if not already added above as a mutual)
-            if follower.did not in follows_dids:
-                db.add_follow(
-                    follower_did=follower.did,
-                    follower_handle=follower.handle,
-                    following_did=current_did,
-                    following_handle=profile.handle,
-                    is_mutual=False  # Can't be mutual if not in follows
-                )
-        
-        print(f"  Added {len(all_connections)} connections to database")
+        try:
+            if mutuals_only:
+                result = crawl_mutuals_only(api, db, current_did, profile)
+            else:
+                result = crawl_connections(api, db, current_did, profile.handle, mutual_core=True)
+        except PaginationError as e:
+            print(f"  {e}")
+            print(f"  Saved progress, will resume on the next run")
+            continue
+        print(f"  Found {len(result.mutuals)} mutuals")
+        print(f"  Debug: {result.follows_count} follows, {result.followers_count} followers")
+        print(f"  Added {len(result.connections)} connections to database")
         
         # Only add MUTUALS to the processing queue
-        for mutual_did in result['mutuals']:
-            if mutual_did not in processed and not db.is_crawled(mutual_did):
-                to_process.append(mutual_did)
+        new_mutuals = [did for did in result.mutuals if did not in processed and not db.is_crawled(did)]
+        to_process.extend(new_mutuals)
         
         # Mark as crawled and as part of mutual core
-        db.mark_as_crawled(current_did)
-        db.mark_as_mutual_core(current_did)
+        with db.transaction():
+            db.enqueue(1, [(did, 0) for did in new_mutuals])
+            db.set_queue_status(1, current_did, 'done')
+            db.mark_as_crawled(current_did)
+            db.mark_as_mutual_core(current_did)
+            db.clear_cursors(current_did)
         processed.add(current_did)
         
         # Print progress
         stats = db.get_stats()
         print(f"  Progress: {stats['crawled_users']} mutual core crawled, {len(to_process)} mutuals in queue, {stats['total_users']} accounts total in DB")
         
-        # Small delay to avoid hammering the API (adjust or remove if needed)
-        time.sleep(0.01)
-    
+    profiles.clear()  # Prefetched for users left in the queue
     print(f"\n✓ Phase 1 complete: {len(processed)} mutual core members crawled")
 
 def phase2_expand_graph(api, db, min_connections=3, max_users=None):
@@ -139,7 +411,7 @@ def phase2_expand_graph(api, db, min_connections=3, max_users=None):
     Phase 2: Expand beyond mutual core by finding connected community members
     
     1. Find all uncrawled users with ≥N connections to mutual core
-    2. BFS through them, crawling users who meet the connection threshold
+    2. Crawl them, most connections to the mutual core first
     3. For each crawled user, check their connections for more qualified users
     
     Args:
@@ -151,34 +423,17 @@ def phase2_expand_graph(api, db, min_connections=3, max_users=None):
     if max_users:
         print(f"Limit: {max_users} users")
     
-    # Step 1: Find initial candidates from uncrawled users in database
-    print("\nScanning uncrawled users for connections to mutual core...")
-    uncrawled = db.get_uncrawled_users()
-    print(f"Found {len(uncrawled)} uncrawled users in database")
+    # Step 1: Find initial candidates from uncrawled users in database.
+    # The queue is kept in the crawl_queue table, which also remembers
+    # users skipped by an earlier run (see frontier.py for the ordering)
+    db.requeue(2, ('failed',))
+    db.enqueue(2, scan_initial_candidates(db, min_connections))
+    to_process = Frontier(db.get_queue(2, min_priority=min_connections))
     
-    # Debug: Check mutual core count
-    cursor = db.conn.execute('SELECT COUNT(*) FROM users WHERE is_mutual_core = 1')
-    mutual_core_count = cursor.fetchone()[0]
-    print(f"Debug: {mutual_core_count} users in mutual core")
-    
-    # Build initial queue of users with sufficient connections
-    to_process = []
-    checked_count = 0
-    for did, handle in uncrawled:
-        connection_count = db.get_mutual_core_connection_count(did)
-        checked_count += 1
-        if checked_count <= 10:  # Show first 10 for debugging
-            print(f"  Debug: {handle}: {connection_count} connections to mutual core")
-        if connection_count >= min_connections:
-            to_process.append(did)
-            if checked_count > 10:  # Only print qualified ones after first 10
-                print(f"  {handle}: {connection_count} connections - QUEUED")
-    
-    print(f"\nInitial queue: {len(to_process)} users with ≥{min_connections} connections")
-    
-    # Step 2: BFS through qualified users
+    # Step 2: Crawl qualified users, best connected first
     processed = set()
     crawled_count = 0
+    profiles = ProfileCache(api)
     
     while to_process:
         # Check if we've hit the limit
@@ -186,149 +441,65 @@ def phase2_expand_graph(api, db, min_connections=3, max_users=None):
             print(f"\n⚠️  Reached Phase 2 limit of {max_users} users")
             break
         
-        current_did = to_process.pop(0)
+        current_did = to_process.pop()
         
         # Skip if already processed
         if current_did in processed or db.is_crawled(current_did):
+            profiles.drop(current_did)
             continue
         
-        # Get profile
-        profile = api.get_profile(current_did)
+        # Get profile (prefetched in bulk with the rest of the queue)
+        try:
+            profile = profiles.get(current_did, to_process, processed)
+        except ProfileError as e:
+            print(f"  {e}")
+            print(f"  Will retry on the next run")
+            db.set_queue_status(2, current_did, 'failed')
+            processed.add(current_did)
+            continue
         if not profile:
             print(f"  Could not fetch profile, skipping")
+            db.set_queue_status(2, current_did, 'skipped')
             processed.add(current_did)
             continue
         
         print(f"\nCrawling: {profile.display_name or profile.handle} (@{profile.handle})")
         
         # Update user info in database
-        db.add_user(
-            did=profile.did,
-            handle=profile.handle,
-            display_name=getattr(profile, 'display_name', None),
-            followers_count=getattr(profile, 'followers_count', 0),
-            follows_count=getattr(profile, 'follows_count', 0),
-            description=getattr(profile, 'description', '')
-        )
+        save_profile(db, profile)
         
         # Get their connections (follows + followers)
-        follows = api.get_all_follows(current_did)
-        followers = api.get_all_followers(current_did)
-        
-        print(f"  Found {len(follows)} follows, {len(followers)} followers")
-        
-        # Process follows
-        temp_connections = {}  # did -> handle
-        for f in follows:
-            temp_connections[f.did] = f.handle
-            # Add user to DB if not exists
-            if not db.user_exists(f.did):
-                db.add_user(did=f.did, handle=f.handle, display_name=getattr(f, 'display_name', None))
-            # Record follow relationship
-            db.add_follow(
-                follower_did=current_did,
-                follower_handle=profile.handle,
-                following_did=f.did,
-                following_handle=f.handle,
-                is_mutual=False
-            )
-        
-        # Process followers
-        for f in followers:
-            temp_connections[f.did] = f.handle
-            # Add user to DB if not exists
-            if not db.user_exists(f.did):
-                db.add_user(did=f.did, handle=f.handle, display_name=getattr(f, 'display_name', None))
-            # Record follow relationship
-            db.add_follow(
-                follower_did=f.did,
-                follower_handle=f.handle,
-                following_did=current_did,
-                following_handle=profile.handle,
-                is_mutual=False
-            )
-        
-        print(f"  Checking {len(temp_connections)} connections for candidates...")
-        
-        # Scan connections for qualified users
-        new_candidates = 0
-        skipped_already_processed = 0
-        skipped_already_crawled = 0
-        skipped_in_queue = 0
-        skipped_insufficient_connections = 0
-        
-        for conn_did, conn_handle in temp_connections.items():
-            # Skip if already processed or in queue
-            if conn_did in processed:
-                skipped_already_processed += 1
-                continue
-            if conn_did in to_process:
-                skipped_in_queue += 1
-                continue
-            if db.is_crawled(conn_did):
-                skipped_already_crawled += 1
-                continue
-            
-            # Check connections to mutual core (now they should have recorded relationships!)
-            conn_count = db.get_mutual_core_connection_count(conn_did)
-            if conn_count >= min_connections:
-                to_process.append(conn_did)
-                new_candidates += 1
-                print(f"    ✓ {conn_handle}: {conn_count} connections to mutual core - QUEUED")
-            else:
-                skipped_insufficient_connections += 1
-                # Show first few examples
-                if skipped_insufficient_connections <= 3:
-                    print(f"    ✗ {conn_handle}: only {conn_count} connections (need {min_connections})")
-        
-        print(f"  Results:")
-        print(f"    New candidates: {new_candidates}")
-        print(f"    Skipped - already processed: {skipped_already_processed}")
-        print(f"    Skipped - already in queue: {skipped_in_queue}")
-        print(f"    Skipped - already crawled: {skipped_already_crawled}")
-        print(f"    Skipped - insufficient connections: {skipped_insufficient_connections}")
+        try:
+            result = crawl_connections(api, db, current_did, profile.handle, mutual_core=False)
+        except PaginationError as e:
+            print(f"  {e}")
+            print(f"  Saved progress, will resume on the next run")
+            processed.add(current_did)
+            continue
+        
+        print(f"  Found {result.follows_count} follows, {result.followers_count} followers")
+        
+        new_candidates = find_new_candidates(db, result.connections, processed, to_process, min_connections)
+        for did, conn_count in new_candidates:
+            to_process.push(did, conn_count)
         
         # Mark as crawled
-        db.mark_as_crawled(current_did)
+        with db.transaction():
+            db.enqueue(2, new_candidates)
+            db.set_queue_status(2, current_did, 'done')
+            db.mark_as_crawled(current_did)
+            db.clear_cursors(current_did)
         processed.add(current_did)
         crawled_count += 1
         
         # Print progress
         print(f"  Progress: {crawled_count} crawled in Phase 2, {len(to_process)} in queue")
         
-        time.sleep(0.01)
-    
+    profiles.clear()
     print(f"\n✓ Phase 2 complete: {crawled_count} additional users crawled")
 
-def main():
-    # Initialize
-    print("Furry Fandom Network Mapper")
-    print("=" * 50)
-
-    api = BlueskyAPI(BLUESKY_HANDLE, BLUESKY_APP_PASSWORD)
-    
-    # Connect to database
-    db = FurryNetworkDB()
-    
-    # Print initial stats
-    stats = db.get_stats()
-    print(f"\nDatabase stats:")
-    print(f"  Total users: {stats['total_users']}")
-    print(f"  Crawled users: {stats['crawled_users']}")
-    print(f"  Follow relationships: {stats['total_follows']}")
-    
-    # Starting point - your account
-    seed_account = api.me.did
-    
-    # Run Phase 1: Build mutuals graph (includes furryList automatically!)
-    # TEST LIMITS - Remove max_users parameter for full run
-    phase1_mutuals_graph(api, db, seed_account, max_users=50)
-    
-    # Run Phase 2: Expand based on connections to mutual core
-    # TEST LIMITS - Remove max_users parameter for full run
-    phase2_expand_graph(api, db, min_connections=MIN_CONNECTIONS, max_users=100)
-    
-    # Final stats
+def print_final_stats(db):
+    """Print the end-of-run database summary"""
     print("\n" + "=" * 50)
     print("FINAL RESULTS")
     print("=" * 50)
@@ -338,9 +509,48 @@ def main():
     print(f"Follow relationships: {stats['total_follows']}")
     print(f"Mutual relationships: {stats['mutual_follows']}")
     print(f"\nDatabase saved to: furry_network.db")
+
+def main():
+    # Initialize
+    print("Furry Fandom Network Mapper")
+    print("=" * 50)
+
+    api = BlueskyAPI(BLUESKY_HANDLE, BLUESKY_APP_PASSWORD)
+    if METRICS_TEXTFILE:
+        exporter = TextfileExporter(api.metrics, METRICS_TEXTFILE, METRICS_INTERVAL).start()
     
-    # Close connections
-    db.close()
+    # Connect to database
+    db = FurryNetworkDB(compact=COMPACT_DB)
+    if PIPELINED_WRITES:
+        db = DBWriter(db)
+    
+    try:
+        # Print initial stats
+        stats = db.get_stats()
+        print(f"\nDatabase stats:")
+        print(f"  Total users: {stats['total_users']}")
+        print(f"  Crawled users: {stats['crawled_users']}")
+        print(f"  Follow relationships: {stats['total_follows']}")
+        
+        # Starting point - your account
+        seed_account = api.me.did
+        
+        # Run Phase 1: Build mutuals graph (includes furryList automatically!)
+        # TEST LIMITS - Remove max_users parameter for full run
+        phase1_mutuals_graph(api, db, seed_account, max_users=50, mutuals_only=PHASE1_MUTUALS_ONLY)
+        
+        # Run Phase 2: Expand based on connections to mutual core
+        # TEST LIMITS - Remove max_users parameter for full run
+        phase2_expand_graph(api, db, min_connections=MIN_CONNECTIONS, max_users=100)
+        
+        # Final stats
+        print_final_stats(db)
+        print(f"\n{api.metrics.summary()}")
+    finally:
+        # Close connections (DBWriter applies the writes still queued)
+        db.close()
+        if METRICS_TEXTFILE:
+            exporter.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,207 @@
+"""
+Request metrics for the Bluesky API clients
+
+Every XRPC request made through BlueskyAPI / AsyncBlueskyAPI is recorded
+in an ApiMetrics object, per method (app.bsky.graph.getFollows, ...):
+request and retry counts, errors by HTTP status, bytes received and a
+latency histogram. Time spent waiting on the rate limiter is counted
+separately, so a slow crawl can be put down to slow responses, rate
+limiting or (if neither) the database:
+
+    print(api.metrics.summary())
+
+TextfileExporter writes the metrics in Prometheus text format every few
+seconds, for node_exporter's textfile collector to pick up. Set
+METRICS_TEXTFILE in main.py (or the environment) to turn it on.
+"""
+
+from collections import Counter, defaultdict
+import os
+import threading
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Status recorded for requests that got no HTTP response (timeouts, connection errors)
+NO_RESPONSE = 'none'
+
+def xrpc_method(url):
+    """XRPC method name from a request URL"""
+    return str(url).rsplit('/xrpc/', 1)[-1].split('?', 1)[0]
+
+def response_size(response):
+    """
+    Bytes received for a (read) httpx.Response: its content-length, or the
+    length of the body for responses without one (chunked, compressed)
+    """
+    length = response.headers.get('content-length')
+    if length is not None:
+        try:
+            return int(length)
+        except ValueError:
+            pass
+    return len(response.content)
+
+class MethodStats:
+    """Counters for one XRPC method"""
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.bytes = 0
+        self.statuses = Counter()  # HTTP status (or NO_RESPONSE) -> responses
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+    
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items() if status == NO_RESPONSE or status >= 400)
+
+class ApiMetrics:
+    """Thread-safe request metrics; share one between API objects to add them up"""
+    def __init__(self):
+        self.methods = defaultdict(MethodStats)
+        self.rate_limit_wait = 0.0  # Seconds spent waiting on the rate limiter
+        self.lock = threading.Lock()
+    
+    def record(self, method, seconds, status):
+        """Count one finished request (status is NO_RESPONSE if none came back)"""
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        with self.lock:
+            stats = self.methods[method]
+            stats.requests += 1
+            stats.statuses[status] += 1
+            stats.buckets[bucket] += 1
+            stats.latency_sum += seconds
+    
+    def record_error(self, method, seconds, error):
+        """Count a request that raised; atproto errors carry the response, network errors don't"""
+        response = getattr(error, 'response', None)
+        self.record(method, seconds, getattr(response, 'status_code', None) or NO_RESPONSE)
+    
+    def record_bytes(self, method, size):
+        """Count the bytes of one response (see _count_response_bytes in bluesky_api.py)"""
+        with self.lock:
+            self.methods[method].bytes += size
+    
+    def record_retry(self, error):
+        """RetryPolicy on_retry hook: the request that raised `error` is being retried"""
+        with self.lock:
+            self.methods[getattr(error, 'xrpc_method', 'unknown')].retries += 1
+    
+    def record_wait(self, seconds):
+        """Count time spent waiting for the rate limiter"""
+        with self.lock:
+            self.rate_limit_wait += seconds
+    
+    def snapshot(self):
+        """Current metrics as a plain dict (e.g. to dump as JSON)"""
+        with self.lock:
+            return {
+                'rate_limit_wait_seconds': round(self.rate_limit_wait, 3),
+                'methods': {
+                    method: {
+                        'requests': stats.requests,
+                        'errors': stats.errors,
+                        'retries': stats.retries,
+                        'bytes': stats.bytes,
+                        'statuses': {str(status): count for status, count in stats.statuses.items()},
+                        'mean_latency': round(stats.latency_sum / stats.requests, 4) if stats.requests else None,
+                        'latency_buckets': dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'], stats.buckets)),
+                    }
+                    for method, stats in sorted(self.methods.items())
+                },
+            }
+    
+    def summary(self):
+        """A few lines for the end of a crawl"""
+        snapshot = self.snapshot()
+        lines = ["API requests:"]
+        for method, stats in snapshot['methods'].items():
+            mean = f"{stats['mean_latency'] * 1000:.0f} ms" if stats['mean_latency'] is not None else '-'
+            lines.append(f"  {method}: {stats['requests']} requests, {stats['errors']} errors, "
+                         f"{stats['retries']} retries, {stats['bytes'] / 1e6:.1f} MB, mean {mean}")
+        lines.append(f"  Waited {snapshot['rate_limit_wait_seconds']:.1f}s on the rate limiter")
+        return '\n'.join(lines)
+    
+    def to_prometheus(self, labels=None):
+        """Metrics in Prometheus text exposition format; labels are added to every sample"""
+        def fmt(**sample_labels):
+            merged = {**(labels or {}), **sample_labels}
+            if not merged:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in merged.values())
+            return '{' + ','.join(f'{key}="{value}"' for key, value in zip(merged, escaped)) + '}'
+        
+        lines = []
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+        
+        with self.lock:
+            methods = sorted(self.methods.items())
+            metric('bluesky_api_requests_total', 'counter', 'XRPC requests sent, including failed ones')
+            for method, stats in methods:
+                lines.append(f'bluesky_api_requests_total{fmt(method=method)} {stats.requests}')
+            metric('bluesky_api_responses_total', 'counter', 'XRPC responses by HTTP status ("none" for no response)')
+            for method, stats in methods:
+                for status, count in sorted(stats.statuses.items(), key=lambda item: str(item[0])):
+                    lines.append(f'bluesky_api_responses_total{fmt(method=method, status=status)} {count}')
+            metric('bluesky_api_retries_total', 'counter', 'XRPC requests retried after an error')
+            for method, stats in methods:
+                lines.append(f'bluesky_api_retries_total{fmt(method=method)} {stats.retries}')
+            metric('bluesky_api_response_bytes_total', 'counter', 'Bytes received in XRPC responses')
+            for method, stats in methods:
+                lines.append(f'bluesky_api_response_bytes_total{fmt(method=method)} {stats.bytes}')
+            metric('bluesky_api_request_duration_seconds', 'histogram', 'XRPC request latency')
+            for method, stats in methods:
+                cumulative = 0
+                for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], stats.buckets):
+                    cumulative += count
+                    lines.append(f'bluesky_api_request_duration_seconds_bucket{fmt(method=method, le=bound)} {cumulative}')
+                lines.append(f'bluesky_api_request_duration_seconds_sum{fmt(method=method)} {stats.latency_sum:.6f}')
+                lines.append(f'bluesky_api_request_duration_seconds_count{fmt(method=method)} {stats.requests}')
+            metric('bluesky_api_rate_limit_wait_seconds_total', 'counter', 'Seconds spent waiting on the rate limiter')
+            lines.append(f'bluesky_api_rate_limit_wait_seconds_total{fmt()} {self.rate_limit_wait:.6f}')
+        return '\n'.join(lines) + '\n'
+
+class TextfileExporter:
+    """Writes an ApiMetrics to a Prometheus textfile every `interval` seconds from a background thread"""
+    def __init__(self, metrics, path, interval=15.0, labels=None):
+        """
+        Args:
+            metrics: ApiMetrics to export
+            path: File to write; node_exporter only reads files ending in .prom
+            interval: Seconds between writes
+            labels: Extra labels for every sample, e.g. {'account': handle}
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.labels = labels
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='metrics-textfile', daemon=True)
+    
+    def write(self):
+        """Write the file now (atomically, so the collector never reads half of it)"""
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.metrics.to_prometheus(self.labels))
+        os.replace(tmp_path, self.path)
+    
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Could not write metrics to {self.path}: {e}")
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        """Stop the thread and write the final numbers"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.write()
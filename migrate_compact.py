@@ -0,0 +1,114 @@
+"""
+Convert a crawl database to the compact schema
+
+The compact schema (see FurryNetworkDB._create_compact_tables in
+storage.py) gives every user an integer id and stores each follow as one
+(src_id, dst_id, flags) row instead of two DIDs and two handles, which
+shrinks the follows table and its indexes several times over. Everything
+in main.py, phase2.py and analysis.py works unchanged on either schema.
+
+The original file is left untouched; swap the new one in when you're happy:
+
+Usage:
+    python migrate_compact.py [furry_network.db] [furry_network_compact.db]
+"""
+
+from storage import FurryNetworkDB, FLAG_MUTUAL, connect
+import os, sys
+
+def migrate(src_path, dst_path):
+    """Copy everything from a legacy-schema src_path into a new compact dst_path"""
+    if not os.path.exists(src_path):
+        raise SystemExit(f"{src_path} not found")
+    if os.path.exists(dst_path):
+        raise SystemExit(f"{dst_path} already exists, not overwriting it")
+    
+    # Check the source before creating anything
+    conn = connect(src_path, read_only=True)
+    old_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    if 'edges' in old_tables:
+        raise SystemExit(f"{src_path} already uses the compact schema")
+    
+    db = FurryNetworkDB(dst_path, compact=True)
+    try:
+        _copy(db, src_path, old_tables)
+    except BaseException:
+        # Don't leave a partial file behind to block the next attempt
+        db.close()
+        for path in (dst_path, f'{dst_path}-wal', f'{dst_path}-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    
+    stats = db.get_stats()
+    db.close()
+    print(f"\n✓ Migrated {stats['total_users']} users and {stats['total_follows']} follows ({stats['mutual_follows']} mutual)")
+    print(f"  {src_path}: {os.path.getsize(src_path) / 1e6:.1f} MB")
+    print(f"  {dst_path}: {os.path.getsize(dst_path) / 1e6:.1f} MB")
+
+def _copy(db, src_path, old_tables):
+    """Fill the new compact database from the attached legacy one"""
+    conn = db.conn
+    conn.execute('ATTACH DATABASE ? AS old', (src_path,))
+    
+    # Building the followers index and the core_degree counts once at the
+    # end is much faster than keeping them up to date row by row
+    conn.execute('DROP INDEX idx_edges_dst')
+    conn.execute('DROP TRIGGER trg_edges_core_degree')
+    
+    print("Copying users...")
+    conn.execute('''
+        INSERT INTO users
+        (did, handle, display_name, followers_count, follows_count, description, crawled, is_mutual_core, added_at)
+        SELECT did, handle, display_name, followers_count, follows_count, description, crawled, is_mutual_core, added_at
+        FROM old.users ORDER BY rowid
+    ''')
+    
+    # Edges need both ends in users; the legacy schema didn't enforce that
+    conn.execute('''
+        INSERT OR IGNORE INTO users (did, handle, followers_count, follows_count)
+        SELECT follower_did, follower_handle, 0, 0 FROM old.follows
+        UNION ALL
+        SELECT following_did, following_handle, 0, 0 FROM old.follows
+    ''')
+    
+    print("Copying follows...")
+    conn.execute(f'''
+        INSERT INTO edges (src_id, dst_id, flags)
+        SELECT s.id, d.id, CASE WHEN f.is_mutual THEN {FLAG_MUTUAL} ELSE 0 END
+        FROM old.follows f
+        JOIN users s ON s.did = f.follower_did
+        JOIN users d ON d.did = f.following_did
+        ORDER BY s.id, d.id
+    ''')
+    
+    if 'crawl_cursors' in old_tables:
+        conn.execute('''
+            INSERT INTO crawl_cursors (did, direction, cursor, updated_at)
+            SELECT did, direction, cursor, updated_at FROM old.crawl_cursors
+        ''')
+    
+    # The crawl frontier, so a crawl migrated mid-run resumes where it was.
+    # Both schemas key the queue by DID; rowid order keeps ties oldest first
+    if 'crawl_queue' in old_tables:
+        conn.execute('''
+            INSERT INTO crawl_queue (did, phase, status, priority, enqueued_at)
+            SELECT did, phase, status, priority, enqueued_at FROM old.crawl_queue ORDER BY rowid
+        ''')
+    
+    print("Indexing...")
+    db.create_tables()
+    db.rebuild_core_degrees()
+    conn.commit()
+    conn.execute('DETACH DATABASE old')
+    conn.execute('ANALYZE')
+
+def main():
+    src_path = sys.argv[1] if len(sys.argv) > 1 else 'furry_network.db'
+    root, ext = os.path.splitext(src_path)
+    dst_path = sys.argv[2] if len(sys.argv) > 2 else f'{root}_compact{ext}'
+    migrate(src_path, dst_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+PageRank over a sparse follow graph
+
+"Most followed" by raw in-degree is topped by big accounts outside the
+fandom that Phase 1 pulled in. PageRank ranks accounts by how much they
+are followed by accounts that are themselves well followed; the
+personalized version restarts its random walk only at mutual-core
+members, so it ranks accounts by how central they are *to the fandom*:
+
+    ranker = PageRank(graph)
+    scores = ranker.run()                                   # global PageRank
+    core_scores = ranker.run(personalization=graph.is_mutual_core)
+
+Both are power iterations on a scipy sparse matrix, with the
+matrix-vector product split over threads by row blocks. save_scores
+writes them to the users.pagerank and users.core_pagerank columns.
+"""
+
+from storage import FurryNetworkDB
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+import os, time
+
+class PageRank:
+    def __init__(self, graph, threads=None):
+        """
+        Build the transition matrix of a SparseGraph once, for any number of runs
+        
+        Mutual follows that Phase 1 stored as one flagged row count in both directions.
+        """
+        A = graph.adjacency
+        flagged = A.copy()
+        flagged.data = graph.mutual.astype(np.int8)
+        flagged.eliminate_zeros()
+        links = (A + flagged.T).tocsr()  # row follows column
+        links.setdiag(0)
+        links.eliminate_zeros()
+        
+        self.n = links.shape[0]
+        out_degree = np.diff(links.indptr)
+        self.dangling = out_degree == 0  # Users who follow no one in the graph
+        # Transposed, so rank flows from follower (column) to followed (row);
+        # each follow carries 1/out_degree of the follower's rank
+        weights = np.repeat(1.0 / np.maximum(out_degree, 1), out_degree)
+        transition = sp.csr_matrix((weights, links.indices, links.indptr), shape=links.shape).T.tocsr()
+        del links, weights
+        
+        # Row blocks with about the same number of edges, one per thread
+        self.threads = threads or os.cpu_count() or 1
+        bounds = np.searchsorted(transition.indptr, np.linspace(0, transition.nnz, self.threads + 1))
+        bounds[0], bounds[-1] = 0, self.n
+        # (sharing transition's arrays rather than copying them like transition[lo:hi] would)
+        self.blocks = [
+            (lo, hi, sp.csr_matrix((
+                transition.data[transition.indptr[lo]:transition.indptr[hi]],
+                transition.indices[transition.indptr[lo]:transition.indptr[hi]],
+                transition.indptr[lo:hi + 1] - transition.indptr[lo],
+            ), shape=(hi - lo, self.n)))
+            for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+        ]
+    
+    def _multiply(self, pool, x, out):
+        """out = transition @ x, one row block per thread"""
+        def block(args):
+            lo, hi, matrix = args
+            out[lo:hi] = matrix @ x
+        list(pool.map(block, self.blocks))
+    
+    def run(self, personalization=None, alpha=0.85, tol=1e-6, max_iter=200):
+        """
+        PageRank scores (summing to 1) by power iteration
+        
+        Args:
+            personalization: Per-node restart weights (e.g. graph.is_mutual_core);
+                None restarts uniformly, i.e. plain PageRank
+            alpha: Probability of following a link rather than restarting
+            tol: Stop once the scores (which sum to 1) change by less than
+                tol in total (L1) from one iteration to the next; the error
+                left is then about alpha / (1 - alpha) * tol, whatever the size
+            max_iter: Give up after this many iterations
+        """
+        if personalization is None:
+            restart = np.full(self.n, 1.0 / self.n)
+        else:
+            restart = np.asarray(personalization, dtype=np.float64)
+            if restart.sum() == 0:
+                print("  No nodes to personalize on, using plain PageRank")
+                restart = np.ones(self.n)
+            restart = restart / restart.sum()
+        
+        scores = restart.copy()
+        spread = np.empty(self.n)
+        with ThreadPoolExecutor(self.threads) as pool:
+            for iteration in range(1, max_iter + 1):
+                self._multiply(pool, scores, spread)
+                # Rank of users with no follows goes back to the restart nodes
+                new_scores = alpha * spread + (alpha * scores[self.dangling].sum() + 1 - alpha) * restart
+                change = np.abs(new_scores - scores).sum()
+                scores = new_scores
+                if change < tol:
+                    break
+            else:
+                print(f"  PageRank did not converge in {max_iter} iterations (change {change:.2e})")
+        self.iterations = iteration
+        return scores
+
+def save_scores(db_path, graph, **columns):
+    """Write score arrays to users, e.g. save_scores(path, graph, pagerank=scores)"""
+    db = FurryNetworkDB(db_path)
+    try:
+        for column, scores in columns.items():
+            db.save_user_scores(column, zip(graph.dids.tolist(), scores.tolist()))
+    finally:
+        db.close()
+
+def rank_graph(graph, db_path=None, top_k=10):
+    """Run global and mutual-core PageRank, print the top users and optionally save both"""
+    print("\nRanking users (PageRank)...")
+    started = time.time()
+    ranker = PageRank(graph)
+    scores = ranker.run()
+    print(f"  PageRank: {ranker.iterations} iterations")
+    core_scores = ranker.run(personalization=graph.is_mutual_core)
+    print(f"  Mutual-core PageRank: {ranker.iterations} iterations ({time.time() - started:.1f}s)")
+    
+    k = min(top_k, graph.num_nodes)
+    for title, values in (("PageRank", scores), ("PageRank around the mutual core", core_scores)):
+        top = np.argpartition(-values, k - 1)[:k] if k else np.array([], dtype=np.int64)
+        top = top[np.argsort(-values[top], kind='stable')]
+        print(f"\nTop {k} by {title} (1.0 = average):")
+        for i in top:
+            print(f"  {graph.label(i)}: {values[i] * graph.num_nodes:.1f}")
+    
+    if db_path:
+        save_scores(db_path, graph, pagerank=scores, core_pagerank=core_scores)
+        print(f"\nSaved scores to users.pagerank and users.core_pagerank in {db_path}")
+    return scores, core_scores
@@ -27,6 +27,7 @@ def reset_phase2_users(db):
         WHERE is_mutual_core = 0
     ''')
     db.conn.commit()
+    db.clear_queue(2)
     
     cursor = db.conn.execute('SELECT COUNT(*) FROM users WHERE crawled = 0')
     count = cursor.fetchone()[0]
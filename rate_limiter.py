@@ -0,0 +1,102 @@
+"""
+Token-bucket rate limiter shared by every Bluesky API call
+
+Bluesky reports the remaining request budget on every response:
+
+    ratelimit-limit: 3000
+    ratelimit-remaining: 2950
+    ratelimit-reset: 1735689600      (unix time the window resets)
+
+The limiter starts at DEFAULT_RATE requests/second and, whenever these
+headers arrive, re-targets its refill rate so that the remaining budget
+is spread evenly over the time left in the window. That lets us run
+flat out when there is headroom and slow down before we hit the limit.
+If we do get a 429, every caller is held until the window resets.
+
+One RateLimiter can be shared between threads and asyncio tasks.
+"""
+
+import asyncio
+import threading
+import time
+
+DEFAULT_RATE = 10.0  # requests/second before any headers are seen (3000 per 5 min)
+DEFAULT_BURST = 10   # requests allowed back-to-back
+MIN_RATE = 0.2       # never throttle below this, even when the budget is nearly spent
+MAX_RATE = 100.0     # never go above this, even with a huge budget left
+SAFETY_MARGIN = 0.02 # fraction of the remaining budget kept in reserve
+RATE_LIMITED_WAIT = 10.0  # seconds to wait after a 429 without a reset header
+
+class RateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # monotonic time, set after a 429
+        self.lock = threading.Lock()
+    
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def _reserve(self):
+        """Take a token and return how long the caller has to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            # A negative balance is a queue of callers waiting for tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self):
+        """Wait (without blocking the event loop) until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    def update(self, headers, rate_limited=False):
+        """Adjust the request rate from a response's ratelimit-* headers"""
+        remaining = _int_header(headers, 'ratelimit-remaining')
+        reset = _int_header(headers, 'ratelimit-reset')
+        
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            
+            seconds_left = reset - time.time() if reset is not None else None
+            if rate_limited or remaining == 0:
+                # Out of budget - hold everyone until the window resets
+                wait = seconds_left if seconds_left and seconds_left > 0 else RATE_LIMITED_WAIT
+                self.blocked_until = max(self.blocked_until, now + wait)
+                self.tokens = min(self.tokens, 0.0)
+                return
+            
+            if remaining is None or seconds_left is None or seconds_left <= 0:
+                return
+            
+            # Spread what is left of the budget over what is left of the window
+            usable = remaining * (1 - SAFETY_MARGIN)
+            self.rate = min(MAX_RATE, max(MIN_RATE, usable / seconds_left))
+            # Never allow a burst bigger than the remaining budget
+            self.tokens = min(self.tokens, usable)
+    
+    def update_from_error(self, error):
+        """Adjust from a failed request (only 429s carry useful information)"""
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None) == 429:
+            self.update(response.headers or {}, rate_limited=True)
+
+def _int_header(headers, name):
+    value = headers.get(name) if headers else None
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
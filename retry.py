@@ -0,0 +1,71 @@
+"""
+Retry with jittered exponential backoff for Bluesky API calls
+
+Only failures that can succeed on a second try are retried: network
+errors, timeouts, 429s and 5xx responses. Things like "profile not
+found" (400) fail straight away.
+
+The delay before retry n is drawn uniformly from
+[0, min(max_delay, base_delay * 2**n)] ("full jitter"), so many
+crawlers failing at the same moment don't all come back at once.
+"""
+
+import asyncio
+import random
+import time
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    """Check whether a failed API call is worth retrying"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        # No response at all: connection error, timeout, ...
+        return hasattr(error, 'response') or isinstance(error, (ConnectionError, TimeoutError))
+    return getattr(response, 'status_code', None) in RETRYABLE_STATUSES
+
+class RetryPolicy:
+    def __init__(self, attempts=5, base_delay=1.0, max_delay=60.0, on_retry=None):
+        """
+        Args:
+            attempts: Total number of tries (1 = no retries)
+            base_delay: Upper bound of the first backoff, in seconds
+            max_delay: Cap on the backoff, in seconds
+            on_retry: Called with the error before each retry (BlueskyAPI counts retries with it)
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_retry = on_retry
+    
+    def delay(self, attempt):
+        """Backoff before retry number `attempt` (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    def call(self, fn, *args, **kwargs):
+        """Call fn, retrying retryable errors; re-raises the last error"""
+        for attempt in range(self.attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= self.attempts or not is_retryable(e):
+                    raise
+                if self.on_retry:
+                    self.on_retry(e)
+                delay = self.delay(attempt)
+                print(f"  Request failed ({e}), retry {attempt + 1}/{self.attempts - 1} in {delay:.1f}s")
+                time.sleep(delay)
+    
+    async def call_async(self, fn, *args, **kwargs):
+        """Await fn, retrying retryable errors; re-raises the last error"""
+        for attempt in range(self.attempts):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= self.attempts or not is_retryable(e):
+                    raise
+                if self.on_retry:
+                    self.on_retry(e)
+                delay = self.delay(attempt)
+                print(f"  Request failed ({e}), retry {attempt + 1}/{self.attempts - 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
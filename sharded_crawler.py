@@ -0,0 +1,291 @@
+"""
+Multi-process version of the two-phase crawl in main.py
+
+Runs one worker process per Bluesky account, so each has its own login
+and its own rate limit budget. Workers claim batches of DIDs from the
+crawl_queue table (see FurryNetworkDB.claim_batch), fetch them with
+BlueskyAPI and send profiles and pages back over a multiprocessing queue.
+The coordinator process is the only one that writes crawl results, in
+large transactions, so workers never wait on each other's SQLite locks.
+If a worker dies, the coordinator puts the users it had claimed back in
+the queue for the others.
+
+Accounts come from BLUESKY_ACCOUNTS, e.g.
+
+    BLUESKY_ACCOUNTS="one.bsky.social:app-pass-1,two.bsky.social:app-pass-2"
+
+(falls back to BLUESKY_HANDLE / BLUESKY_APP_PASSWORD, i.e. one worker).
+PHASE1_MUTUALS_ONLY is not supported here; every user is fully crawled.
+
+Usage:
+    python sharded_crawler.py
+"""
+
+from bluesky_api import BlueskyAPI, PaginationError, ProfileError
+from db_writer import DBWriter
+from metrics import TextfileExporter
+from storage import FurryNetworkDB
+from main import (
+    BLUESKY_HANDLE, BLUESKY_APP_PASSWORD, COMPACT_DB, MIN_CONNECTIONS, METRICS_TEXTFILE, METRICS_INTERVAL,
+    ConnectionWriter, save_profile, scan_initial_candidates, find_new_candidates, print_final_stats
+)
+from collections import namedtuple
+import multiprocessing as mp
+import os, queue, sqlite3, time
+
+# DIDs a worker claims at a time (their profiles are fetched in one go)
+CLAIM_BATCH = 25
+# Write groups (about one per message) committed together by the coordinator
+WRITE_BATCH = 500
+# Messages that can wait for the coordinator before workers block
+RESULT_QUEUE_SIZE = 2000
+# Seconds an idle worker waits before looking for new work
+IDLE_WAIT = 1.0
+
+# Start workers fresh rather than forked, so they don't inherit the
+# coordinator's open SQLite connection
+mp_context = mp.get_context('spawn')
+
+# The profile fields save_profile needs, in a form that can be sent between processes
+Profile = namedtuple('Profile', ['did', 'handle', 'display_name', 'followers_count', 'follows_count', 'description'])
+
+def load_accounts():
+    """Get (handle, app_password) pairs from BLUESKY_ACCOUNTS"""
+    accounts = os.getenv("BLUESKY_ACCOUNTS")
+    if not accounts:
+        return [(BLUESKY_HANDLE, BLUESKY_APP_PASSWORD)]
+    return [tuple(account.strip().split(':', 1)) for account in accounts.split(',') if account.strip()]
+
+def worker(handle, app_password, db_path, phase, min_priority, results, stop):
+    """Worker process: claim DIDs, crawl them, send everything to the coordinator"""
+    api = BlueskyAPI(handle, app_password)
+    db = FurryNetworkDB(db_path)  # Only used to claim work
+    if METRICS_TEXTFILE:
+        # One file per worker: furry.prom -> furry.<handle>.prom
+        root, ext = os.path.splitext(METRICS_TEXTFILE)
+        exporter = TextfileExporter(api.metrics, f'{root}.{handle}{ext}', METRICS_INTERVAL, labels={'account': handle}).start()
+    
+    while not stop.is_set():
+        try:
+            dids = db.claim_batch(phase, CLAIM_BATCH, min_priority)
+        except sqlite3.OperationalError as e:
+            # Locked for longer than BUSY_TIMEOUT by a big coordinator commit
+            print(f"\n{handle}: could not claim work ({e}), retrying")
+            time.sleep(IDLE_WAIT)
+            continue
+        if not dids:
+            time.sleep(IDLE_WAIT)
+            continue
+        results.put(('claimed', handle, dids))
+        
+        profiles = api.get_profiles(dids)
+        for did in dids:
+            if stop.is_set():
+                break
+            try:
+                profile = profiles.get(did) or api.get_profile(did)
+            except ProfileError as e:
+                results.put(('failed', did, str(e), None, None))
+                continue
+            if not profile:
+                results.put(('skipped', did))
+                continue
+            
+            # Pick up where an earlier run gave up, in the same order as
+            # ConnectionWriter.resume (follows first, so mutuals can be
+            # spotted as followers arrive)
+            follows_cursor = db.get_cursor(did, 'follows')
+            followers_cursor = db.get_cursor(did, 'followers')
+            if followers_cursor:
+                fetches = [('followers', followers_cursor)]
+            else:
+                fetches = [('follows', follows_cursor), ('followers', None)]
+            
+            results.put(('profile', did, Profile(
+                did=profile.did,
+                handle=profile.handle,
+                display_name=getattr(profile, 'display_name', None),
+                followers_count=getattr(profile, 'followers_count', 0),
+                follows_count=getattr(profile, 'follows_count', 0),
+                description=getattr(profile, 'description', '')
+            ), bool(follows_cursor or followers_cursor)))
+            try:
+                for direction, cursor in fetches:
+                    fetch = api.iter_follows if direction == 'follows' else api.iter_followers
+                    for page in fetch(did, cursor=cursor):
+                        results.put(('page', did, direction, page.actors))
+            except PaginationError as e:
+                results.put(('failed', did, str(e), e.direction, e.cursor))
+                continue
+            results.put(('done', did))
+    
+    db.close()
+    if METRICS_TEXTFILE:
+        exporter.stop()
+
+class ResultWriter:
+    """Applies worker messages to the database (coordinator side)"""
+    def __init__(self, db, phase, min_connections):
+        self.db = db
+        self.phase = phase
+        self.min_connections = min_connections
+        self.writers = {}  # did -> ConnectionWriter of users being received
+        self.claimed_by = {}  # did -> handle of the worker that claimed it, until it's finished with
+        self.crawled_count = 0
+    
+    def apply(self, message):
+        kind = message[0]
+        if kind == 'claimed':
+            for did in message[2]:
+                self.claimed_by[did] = message[1]
+            return
+        
+        did = message[1]
+        if kind == 'profile':
+            profile = message[2]
+            save_profile(self.db, profile)
+            writer = self.writers[did] = ConnectionWriter(self.db, did, profile.handle, mutual_core=self.phase == 1)
+            if message[3]:
+                writer.resume()  # Load what the earlier run stored
+        elif kind == 'page':
+            self.writers[did].add_page(message[2], message[3])
+        elif kind == 'skipped':
+            self.claimed_by.pop(did, None)
+            print(f"\n{did}: could not fetch profile, skipping")
+            self.db.set_queue_status(self.phase, did, 'skipped')
+        elif kind == 'failed':
+            self.claimed_by.pop(did, None)
+            self.writers.pop(did, None)
+            _, _, error, direction, cursor = message
+            print(f"\n{did}: {error}")
+            if cursor:
+                self.db.save_cursor(did, direction, cursor)
+                print(f"  Saved progress, will resume on the next run")
+            else:
+                print(f"  Will retry on the next run")
+            self.db.set_queue_status(self.phase, did, 'failed')
+        elif kind == 'done':
+            self.claimed_by.pop(did, None)
+            self.finish(self.writers.pop(did))
+    
+    def release(self, handle):
+        """Put the users a dead worker had claimed back in the queue; returns how many"""
+        dids = [did for did, owner in self.claimed_by.items() if owner == handle]
+        for did in dids:
+            del self.claimed_by[did]
+            self.writers.pop(did, None)
+            self.db.set_queue_status(self.phase, did, 'queued')
+        return len(dids)
+    
+    def finish(self, result):
+        """Same bookkeeping as the end of one iteration of phase1/phase2 in main.py"""
+        did = result.did
+        print(f"\nCrawled: @{result.handle}")
+        print(f"  Found {result.follows_count} follows, {result.followers_count} followers")
+        if self.phase == 1:
+            print(f"  Found {len(result.mutuals)} mutuals")
+            new_dids = [(mutual_did, 0) for mutual_did in result.mutuals if not self.db.is_crawled(mutual_did)]
+        else:
+            new_dids = find_new_candidates(self.db, result.connections, (), {}, self.min_connections)
+        
+        with self.db.transaction():
+            self.db.enqueue(self.phase, new_dids)
+            if self.phase == 1:
+                self.db.mark_as_mutual_core(did)
+            self.db.set_queue_status(self.phase, did, 'done')
+            self.db.mark_as_crawled(did)
+            self.db.clear_cursors(did)
+        self.crawled_count += 1
+
+def run_sharded(db, db_path, accounts, phase, min_priority=None, min_connections=MIN_CONNECTIONS, max_users=None):
+    """
+    Crawl everything queued for `phase` with one worker process per account
+    
+    db should be wrapped in a DBWriter, so results are written on its
+    thread in large transactions while this one keeps reading messages.
+    
+    Returns once the queue is empty, or max_users users were crawled
+    (roughly: users the workers already had in hand are still finished).
+    """
+    # Work claimed by workers of an interrupted run, or that gave up last time
+    db.requeue(phase, ('claimed', 'failed'))
+    db.flush()
+    
+    results = mp_context.Queue(RESULT_QUEUE_SIZE)  # Bounded: workers wait if writing falls behind
+    stop = mp_context.Event()
+    workers = {
+        handle: mp_context.Process(target=worker, args=(handle, app_password, db_path, phase, min_priority, results, stop), daemon=True)
+        for handle, app_password in accounts
+    }
+    for process in workers.values():
+        process.start()
+    print(f"Started {len(workers)} worker processes")
+    
+    writer = ResultWriter(db, phase, min_connections)
+    dead = set()
+    while True:
+        if max_users and writer.crawled_count >= max_users and not stop.is_set():
+            print(f"\n⚠️  Reached Phase {phase} limit of {max_users} users")
+            stop.set()
+        try:
+            message = results.get(timeout=IDLE_WAIT)
+        except queue.Empty:
+            # Everything a dead worker sent has been read by now, so whatever
+            # it still had claimed will never be finished
+            for handle, process in workers.items():
+                if handle not in dead and process.exitcode not in (0, None):
+                    dead.add(handle)
+                    released = writer.release(handle)
+                    print(f"\n⚠️  Worker {handle} exited with code {process.exitcode}, requeued {released} claimed users")
+            # Done once nothing is claimed or claimable (or every worker has exited)
+            if stop.is_set() or not any(process.is_alive() for process in workers.values()) or db.count_pending(phase, min_priority) == 0:
+                break
+            continue
+        
+        writer.apply(message)
+    
+    stop.set()
+    # Keep draining so no worker is stuck on a full queue while exiting
+    while any(process.is_alive() for process in workers.values()):
+        try:
+            writer.apply(results.get(timeout=IDLE_WAIT))
+        except queue.Empty:
+            pass
+    for process in workers.values():
+        process.join()
+    
+    # Users a worker had claimed but not finished go back in the queue
+    db.requeue(phase, ('claimed',))
+    db.flush()
+    return writer.crawled_count
+
+def main():
+    print("Furry Fandom Network Mapper (sharded)")
+    print("=" * 50)
+    
+    db_path = 'furry_network.db'
+    accounts = load_accounts()
+    db = DBWriter(FurryNetworkDB(db_path, compact=COMPACT_DB), batch_size=WRITE_BATCH)
+    
+    try:
+        # Phase 1: start from the first account unless a queue was left over
+        print("\n=== PHASE 1: Building Mutual Core Network ===")
+        if not db.get_queue(1):
+            seed_api = BlueskyAPI(*accounts[0])
+            db.enqueue(1, [(seed_api.me.did, 0)])
+        # TEST LIMITS - Remove max_users parameter for full run
+        crawled = run_sharded(db, db_path, accounts, phase=1, max_users=50)
+        print(f"\n✓ Phase 1 complete: {crawled} mutual core members crawled")
+        
+        # Phase 2: expand by connections to the mutual core
+        print(f"\n=== PHASE 2: Expanding Beyond Mutual Core ===")
+        db.enqueue(2, scan_initial_candidates(db, MIN_CONNECTIONS))
+        crawled = run_sharded(db, db_path, accounts, phase=2, min_priority=MIN_CONNECTIONS, max_users=100)
+        print(f"\n✓ Phase 2 complete: {crawled} additional users crawled")
+        
+        print_final_stats(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Memory-lean graph loading for analysis of large crawls
+
+load_graph_from_db in analysis.py builds a networkx DiGraph, which costs
+around a kilobyte of Python objects per follow - too much for tens of
+millions of follows. load_sparse_graph reads the same data into numpy
+arrays instead: every user gets an int32 index, and the follows become a
+scipy.sparse CSR adjacency matrix (row = follower, column = followed).
+That is about 6 bytes per follow once loaded and about 10 while loading.
+
+    graph = load_sparse_graph('furry_network.db')
+    graph.adjacency        # CSR matrix, graph.adjacency[i, j] == 1 if i follows j
+    graph.mutual           # bool per stored edge, aligned with adjacency.indices
+    graph.dids[i], graph.handles[i], graph.index[did]
+"""
+
+from storage import connect
+import numpy as np
+import scipy.sparse as sp
+import time
+
+# Rows fetched from SQLite at a time
+FETCH_BATCH = 100_000
+
+class SparseGraph:
+    """Follow graph as a CSR adjacency matrix plus per-user numpy arrays"""
+    def __init__(self, dids, handles, display_names, followers, following, is_mutual_core, crawled, adjacency, mutual):
+        self.dids = dids  # Object array: index -> DID
+        self.index = {did: i for i, did in enumerate(dids)}  # DID -> index
+        self.handles = handles
+        self.display_names = display_names
+        self.followers = followers  # followers_count from the profile (not the crawled in-degree)
+        self.following = following  # follows_count from the profile
+        self.is_mutual_core = is_mutual_core
+        self.crawled = crawled
+        self.adjacency = adjacency
+        self.mutual = mutual  # Stored is_mutual flag of each edge, in adjacency.indices order
+    
+    @property
+    def num_nodes(self):
+        return self.adjacency.shape[0]
+    
+    @property
+    def num_edges(self):
+        return self.adjacency.nnz
+    
+    def in_degrees(self):
+        """Followers of each user within the graph"""
+        return np.bincount(self.adjacency.indices, minlength=self.num_nodes)
+    
+    def out_degrees(self):
+        """Follows of each user within the graph"""
+        return np.diff(self.adjacency.indptr)
+    
+    def mutual_adjacency(self):
+        """
+        Symmetric CSR matrix of mutual pairs: edges stored with is_mutual
+        (Phase 1 keeps only one row for those) plus pairs where both
+        directions were stored. Self-follows are left out.
+        """
+        flagged = self.adjacency.copy()
+        flagged.data = self.mutual.astype(np.int8)
+        flagged.eliminate_zeros()
+        mutual = (flagged + flagged.T + self.adjacency.multiply(self.adjacency.T)).tocsr()
+        mutual.setdiag(0)
+        mutual.eliminate_zeros()
+        mutual.data[:] = 1
+        return mutual
+    
+    def label(self, i):
+        """'Display Name (@handle)' of user i"""
+        handle = self.handles[i] or 'unknown'
+        return f"{self.display_names[i] or handle} (@{handle})"
+
+class _Interner:
+    """Assigns int32 indexes to DIDs, collecting node attributes as it goes"""
+    def __init__(self):
+        self.index = {}
+        self.columns = [[] for _ in range(7)]  # did, handle, display_name, followers, following, core, crawled
+    
+    def add(self, did, handle=None, display_name=None, followers=0, following=0, is_mutual_core=0, crawled=0):
+        i = self.index.get(did)
+        if i is None:
+            i = self.index[did] = len(self.index)
+            for column, value in zip(self.columns, (did, handle, display_name, followers, following, is_mutual_core, crawled)):
+                column.append(value)
+        return i
+    
+    def arrays(self):
+        dids, handles, display_names, followers, following, core, crawled = self.columns
+        return (
+            np.array(dids, dtype=object), np.array(handles, dtype=object), np.array(display_names, dtype=object),
+            np.array([x or 0 for x in followers], dtype=np.int32), np.array([x or 0 for x in following], dtype=np.int32),
+            np.array(core, dtype=bool), np.array(crawled, dtype=bool),
+        )
+
+def _csr(num_nodes, src, dst, mutual):
+    """CSR adjacency from edge arrays; free when src is already sorted (the usual case)"""
+    if len(src) and np.any(src[1:] < src[:-1]):
+        order = np.argsort(src, kind='stable')
+        src, dst, mutual = src[order], dst[order], mutual[order]
+    # Row starts by binary search on the sorted src (bincount would make an
+    # int64 copy of it); int32 when it fits, so scipy doesn't upcast indices
+    index_dtype = np.int32 if len(dst) < 2**31 else np.int64
+    indptr = np.searchsorted(src, np.arange(num_nodes + 1, dtype=src.dtype)).astype(index_dtype)
+    adjacency = sp.csr_matrix((np.ones(len(dst), dtype=np.int8), dst, indptr), shape=(num_nodes, num_nodes))
+    # Rows are sorted by src already; sorting columns within rows keeps lookups fast
+    if not adjacency.has_sorted_indices:
+        order = np.lexsort((dst, src))
+        adjacency.indices[:] = dst[order]
+        mutual = mutual[order]
+        adjacency.has_sorted_indices = True
+    return adjacency, mutual
+
+def load_sparse_graph(db_path='furry_network.db'):
+    """
+    Load users and follows into a SparseGraph
+    
+    Works on both database schemas and, like load_graph_from_db, reads
+    one consistent snapshot even while a crawl is writing.
+    """
+    started = time.time()
+    conn = connect(db_path, read_only=True)
+    conn.execute('BEGIN')
+    compact = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'edges' AND type = 'table'").fetchone() is not None
+    
+    print("Loading users...")
+    nodes = _Interner()
+    order = 'id' if compact else 'did'
+    ids = []
+    cursor = conn.execute(f'''
+        SELECT {'id' if compact else 'NULL'}, did, handle, display_name, followers_count, follows_count, is_mutual_core, crawled
+        FROM users ORDER BY {order}
+    ''')
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        for row in rows:
+            nodes.add(*row[1:])
+            ids.append(row[0])
+    print(f"Loaded {len(nodes.index)} users")
+    
+    print("Loading follows...")
+    table = 'edges' if compact else 'follows'
+    num_edges = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    src = np.empty(num_edges, dtype=np.int32)
+    dst = np.empty(num_edges, dtype=np.int32)
+    mutual = np.empty(num_edges, dtype=bool)
+    filled = 0
+    
+    if compact:
+        # Integer ids map straight to indexes; no DIDs are read at all
+        id_to_index = np.full(max(ids, default=0) + 1, -1, dtype=np.int32)
+        id_to_index[ids] = np.arange(len(ids), dtype=np.int32)
+        cursor = conn.execute('SELECT src_id, dst_id, flags & 1 FROM edges')  # Primary key order: by src_id
+        while filled < num_edges:
+            rows = cursor.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            batch = np.array(rows, dtype=np.int64)
+            end = filled + len(batch)
+            src[filled:end] = id_to_index[batch[:, 0]]
+            dst[filled:end] = id_to_index[batch[:, 1]]
+            mutual[filled:end] = batch[:, 2].astype(bool)
+            filled = end
+    else:
+        # Users were indexed in DID order, so this keeps src sorted (apart
+        # from followers the legacy schema never stored in users)
+        cursor = conn.execute('''
+            SELECT follower_did, follower_handle, following_did, following_handle, is_mutual
+            FROM follows ORDER BY follower_did
+        ''')
+        add = nodes.add
+        while filled < num_edges:
+            rows = cursor.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            end = filled + len(rows)
+            src[filled:end] = [add(follower, follower_handle) for follower, follower_handle, _, _, _ in rows]
+            dst[filled:end] = [add(following, following_handle) for _, _, following, following_handle, _ in rows]
+            mutual[filled:end] = [bool(is_mutual) for *_, is_mutual in rows]
+            filled = end
+    
+    conn.close()
+    src, dst, mutual = src[:filled], dst[:filled], mutual[:filled]
+    dids, handles, display_names, followers, following, core, crawled = nodes.arrays()
+    adjacency, mutual = _csr(len(dids), src, dst, mutual)
+    del src, dst
+    
+    graph = SparseGraph(dids, handles, display_names, followers, following, core, crawled, adjacency, mutual)
+    print(f"Loaded {graph.num_edges} follow relationships in {time.time() - started:.1f}s")
+    return graph
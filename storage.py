@@ -1,13 +1,192 @@
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
+
+# PRAGMAs applied to every connection, by profile name
+PERFORMANCE_PROFILES = {
+    # SQLite's defaults: rollback journal, fsync on every commit
+    'safe': {},
+    # Write-ahead log: commits only fsync at checkpoints, and readers
+    # (analysis.py) see a consistent snapshot while a crawl is writing
+    'crawl': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,  # negative = KiB, so 64 MB
+        'mmap_size': 268435456,  # 256 MB
+        'temp_store': 'MEMORY',
+    },
+}
+DEFAULT_PROFILE = 'crawl'
+
+# Seconds a connection waits for another process's write lock before
+# "database is locked" (sharded_crawler.py's workers share the file)
+BUSY_TIMEOUT = 60
+
+# Oldest SQLite the schema and queries work with (UPSERT came in 3.24)
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+def connect(db_path='furry_network.db', profile=DEFAULT_PROFILE, read_only=False):
+    """
+    Open the crawl database with one of PERFORMANCE_PROFILES applied
+    
+    Args:
+        read_only: Open without write access (for analysis while a crawl
+            is running; the file must already exist)
+    """
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise SystemExit(
+            f"SQLite {sqlite3.sqlite_version} is too old: this needs {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer "
+            "(for INSERT ... ON CONFLICT DO UPDATE). Use a Python built with a newer SQLite."
+        )
+    # check_same_thread=False: DBWriter (db_writer.py) writes from its own
+    # thread, but never at the same time as the thread that created it
+    if read_only:
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    for pragma, value in PERFORMANCE_PROFILES[profile].items():
+        if read_only and pragma == 'journal_mode':
+            continue  # Stored in the file by the writer; can't be set read-only
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+# Insert a user, or merge into the existing row in place. Counts of 0 and
+# missing text never overwrite what we already know, and crawled /
+# is_mutual_core are left alone.
+UPSERT_USER = '''
+    INSERT INTO users 
+    (did, handle, display_name, followers_count, follows_count, description)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(did) DO UPDATE SET
+        handle = excluded.handle,
+        display_name = COALESCE(excluded.display_name, users.display_name),
+        followers_count = CASE WHEN excluded.followers_count = 0 AND users.followers_count > 0
+            THEN users.followers_count ELSE excluded.followers_count END,
+        follows_count = CASE WHEN excluded.follows_count = 0 AND users.follows_count > 0
+            THEN users.follows_count ELSE excluded.follows_count END,
+        description = COALESCE(excluded.description, users.description)
+'''
+
+# Legacy schema: one row per edge with both DIDs and handles
+ADD_FOLLOW = '''
+    INSERT INTO follows 
+    (follower_did, follower_handle, following_did, following_handle, is_mutual)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(follower_did, following_did) DO UPDATE SET is_mutual = 1
+    WHERE excluded.is_mutual = 1 AND follows.is_mutual = 0
+'''
+
+# Compact schema: edges reference users by integer id; flags only ever gain bits
+ADD_EDGE = '''
+    INSERT INTO edges (src_id, dst_id, flags)
+    SELECT s.id, d.id, ? FROM users s, users d WHERE s.did = ? AND d.did = ?
+    ON CONFLICT(src_id, dst_id) DO UPDATE SET flags = flags | excluded.flags
+    WHERE flags != flags | excluded.flags
+'''
+FLAG_MUTUAL = 1  # edges.flags bit for follows.is_mutual
+
+# Per-user analysis results that save_user_scores may write, with their
+# column types; each column is added to users the first time it is saved
+USER_SCORE_COLUMNS = {
+    'pagerank': 'REAL',
+    'core_pagerank': 'REAL',
+    'core_number': 'INTEGER',
+}
+
+def _user_row(did, handle, display_name=None, followers_count=0, follows_count=0, description=None):
+    """add_user's arguments (with its defaults) as an UPSERT_USER row"""
+    return (did, handle, display_name, followers_count, follows_count, description)
 
 class FurryNetworkDB:
-    def __init__(self, db_path='furry_network.db'):
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path='furry_network.db', commit_every=1, profile=DEFAULT_PROFILE, compact=False):
+        """
+        Args:
+            db_path: SQLite file to open (created if missing)
+            commit_every: Outside of transaction() blocks, commit once this
+                many rows have been written (1 = after every write)
+            profile: Name of the PERFORMANCE_PROFILES entry to use
+            compact: Create a new file with the compact schema (integer
+                user ids, see create_tables). Existing files keep the schema
+                they have; use migrate_compact.py to convert one.
+        """
+        self.conn = connect(db_path, profile)
+        self.compact = self._table_exists('edges') or (compact and not self._table_exists('follows'))
+        self.commit_every = commit_every
+        self._transaction_depth = 0
+        self._pending_rows = 0
         self.create_tables()
     
+    def _table_exists(self, name):
+        cursor = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+        return cursor.fetchone() is not None
+    
     def create_tables(self):
         """Create tables if they don't exist"""
+        if self.compact:
+            self._create_compact_tables()
+        else:
+            self._create_legacy_tables()
+        
+        # Last good pagination cursor of fetches that gave up part-way,
+        # so the next run can resume instead of starting from page one
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_cursors (
+                did TEXT,
+                direction TEXT,
+                cursor TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (did, direction)
+            )
+        ''')
+        
+        # Users waiting to be crawled in each phase, so a restarted run can
+        # pick up where the last one stopped. status is 'queued', 'done',
+        # 'skipped' (the account is gone), 'failed' (gave up for now; tried
+        # again next run) or 'claimed' (in progress in sharded_crawler.py)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS crawl_queue (
+                did TEXT,
+                phase INTEGER,
+                status TEXT DEFAULT 'queued',
+                priority INTEGER DEFAULT 0,
+                enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (phase, did)
+            )
+        ''')
+        
+        # Create indexes for faster lookups
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_crawled ON users(crawled)
+        ''')
+        
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_crawl_queue ON crawl_queue(phase, status, priority)
+        ''')
+        
+        # core_degree: number of distinct mutual-core users each user is
+        # connected to (either direction), kept up to date by triggers
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(users)')]
+        added_core_degree = 'core_degree' not in columns
+        if added_core_degree:
+            self.conn.execute('ALTER TABLE users ADD COLUMN core_degree INTEGER NOT NULL DEFAULT 0')
+        
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_core_degree ON users(crawled, core_degree)
+        ''')
+        
+        if self.compact:
+            self._create_compact_triggers()
+        else:
+            self._create_legacy_triggers()
+        
+        if added_core_degree:
+            # Database from before core_degree existed
+            self.rebuild_core_degrees()
+        
+        self.conn.commit()
+    
+    def _create_legacy_tables(self):
         self.conn.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 did TEXT PRIMARY KEY,
@@ -18,6 +197,7 @@ class FurryNetworkDB:
                 description TEXT,
                 crawled BOOLEAN DEFAULT 0,
                 is_mutual_core BOOLEAN DEFAULT 0,
+                core_degree INTEGER NOT NULL DEFAULT 0,
                 added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -35,78 +215,210 @@ class FurryNetworkDB:
             )
         ''')
         
-        # Create indexes for faster lookups
         self.conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_crawled ON users(crawled)
+            CREATE INDEX IF NOT EXISTS idx_follower ON follows(follower_did)
         ''')
         
         self.conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_follower ON follows(follower_did)
+            CREATE INDEX IF NOT EXISTS idx_following ON follows(following_did)
         ''')
         
+    def _create_legacy_triggers(self):
+        # A new edge counts for an end whose other end is in the core, unless
+        # the reverse edge was already there (then they were counted already)
         self.conn.execute('''
-            CREATE INDEX IF NOT EXISTS idx_following ON follows(following_did)
+            CREATE TRIGGER IF NOT EXISTS trg_follows_core_degree AFTER INSERT ON follows
+            WHEN NEW.follower_did != NEW.following_did AND NOT EXISTS (
+                SELECT 1 FROM follows WHERE follower_did = NEW.following_did AND following_did = NEW.follower_did
+            )
+            BEGIN
+                UPDATE users SET core_degree = core_degree + 1
+                WHERE did = NEW.follower_did
+                AND (SELECT is_mutual_core FROM users WHERE did = NEW.following_did) = 1;
+                UPDATE users SET core_degree = core_degree + 1
+                WHERE did = NEW.following_did
+                AND (SELECT is_mutual_core FROM users WHERE did = NEW.follower_did) = 1;
+            END
+        ''')
+        
+        # Joining or leaving the core changes the count of everyone connected
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_core_degree AFTER UPDATE OF is_mutual_core ON users
+            WHEN NEW.is_mutual_core != OLD.is_mutual_core
+            BEGIN
+                UPDATE users SET core_degree = core_degree + (CASE WHEN NEW.is_mutual_core = 1 THEN 1 ELSE -1 END)
+                WHERE did != NEW.did AND did IN (
+                    SELECT following_did FROM follows WHERE follower_did = NEW.did
+                    UNION
+                    SELECT follower_did FROM follows WHERE following_did = NEW.did
+                );
+            END
+        ''')
+    
+    def _create_compact_triggers(self):
+        # Same as _create_legacy_triggers, on the edge table
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_edges_core_degree AFTER INSERT ON edges
+            WHEN NEW.src_id != NEW.dst_id AND NOT EXISTS (
+                SELECT 1 FROM edges WHERE src_id = NEW.dst_id AND dst_id = NEW.src_id
+            )
+            BEGIN
+                UPDATE users SET core_degree = core_degree + 1
+                WHERE id = NEW.src_id
+                AND (SELECT is_mutual_core FROM users WHERE id = NEW.dst_id) = 1;
+                UPDATE users SET core_degree = core_degree + 1
+                WHERE id = NEW.dst_id
+                AND (SELECT is_mutual_core FROM users WHERE id = NEW.src_id) = 1;
+            END
         ''')
         
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_users_core_degree AFTER UPDATE OF is_mutual_core ON users
+            WHEN NEW.is_mutual_core != OLD.is_mutual_core
+            BEGIN
+                UPDATE users SET core_degree = core_degree + (CASE WHEN NEW.is_mutual_core = 1 THEN 1 ELSE -1 END)
+                WHERE id != NEW.id AND id IN (
+                    SELECT dst_id FROM edges WHERE src_id = NEW.id
+                    UNION
+                    SELECT src_id FROM edges WHERE dst_id = NEW.id
+                );
+            END
+        ''')
+    
+    def _create_compact_tables(self):
+        """
+        Compact schema: each DID is stored once, in users, and edges are
+        (src_id, dst_id, flags) integer rows in a WITHOUT ROWID table. A
+        `follows` view with the legacy columns keeps every read query working.
+        """
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                did TEXT NOT NULL UNIQUE,
+                handle TEXT,
+                display_name TEXT,
+                followers_count INTEGER,
+                follows_count INTEGER,
+                description TEXT,
+                crawled BOOLEAN DEFAULT 0,
+                is_mutual_core BOOLEAN DEFAULT 0,
+                core_degree INTEGER NOT NULL DEFAULT 0,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS edges (
+                src_id INTEGER NOT NULL,
+                dst_id INTEGER NOT NULL,
+                flags INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (src_id, dst_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Followers lookups (covering, so no trip back to the table)
+        self.conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_edges_dst ON edges(dst_id, src_id)
+        ''')
+        
+        self.conn.execute(f'''
+            CREATE VIEW IF NOT EXISTS follows AS
+            SELECT s.did AS follower_did, s.handle AS follower_handle,
+                   d.did AS following_did, d.handle AS following_handle,
+                   e.flags & {FLAG_MUTUAL} AS is_mutual
+            FROM edges e
+            JOIN users s ON s.id = e.src_id
+            JOIN users d ON d.id = e.dst_id
+        ''')
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into one atomic transaction with a single commit
+        
+        e.g. `with db.transaction(): ...` around everything written for one
+        crawled user. Nested blocks join the outermost one; if an exception
+        escapes, the whole transaction is rolled back.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.conn.rollback()
+                self._pending_rows = 0
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self.flush()
+    
+    def _commit(self, rows=1):
+        """Commit after a write, unless batching (see commit_every and transaction())"""
+        self._pending_rows += rows
+        if self._transaction_depth == 0 and self._pending_rows >= self.commit_every:
+            self.flush()
+    
+    def flush(self):
+        """Commit any batched writes"""
         self.conn.commit()
+        self._pending_rows = 0
     
     def add_user(self, did, handle, display_name=None, followers_count=0, follows_count=0, description=None):
         """Add or update a user in the database (only update if we have better data)"""
-        # Check if user exists
-        cursor = self.conn.execute('''
-            SELECT followers_count, follows_count, description, display_name, crawled, is_mutual_core
-            FROM users WHERE did = ?
-        ''', (did,))
-        existing = cursor.fetchone()
-        
-        crawled = 0  # Default for new users
-        is_mutual_core = 0  # Default for new users
-        if existing:
-            # User exists - only update if new data is more complete
-            existing_followers, existing_follows, existing_desc, existing_display, existing_crawled, existing_mutual_core = existing
-            crawled = existing_crawled  # Preserve crawled status
-            is_mutual_core = existing_mutual_core  # Preserve mutual core status
-            
-            # Keep existing data if new data is incomplete (None or 0)
-            if followers_count == 0 and existing_followers > 0:
-                followers_count = existing_followers
-            if follows_count == 0 and existing_follows > 0:
-                follows_count = existing_follows
-            if description is None and existing_desc is not None:
-                description = existing_desc
-            if display_name is None and existing_display is not None:
-                display_name = existing_display
-        
-        # Insert or update
-        self.conn.execute('''
-            INSERT OR REPLACE INTO users 
-            (did, handle, display_name, followers_count, follows_count, description, crawled, is_mutual_core)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (did, handle, display_name, followers_count, follows_count, description, crawled, is_mutual_core))
-        self.conn.commit()
+        self.conn.execute(UPSERT_USER, (did, handle, display_name, followers_count, follows_count, description))
+        self._commit()
     
     def add_follow(self, follower_did, follower_handle, following_did, following_handle, is_mutual=False):
-        """Add a follow relationship"""
-        self.conn.execute('''
-            INSERT OR IGNORE INTO follows 
-            (follower_did, follower_handle, following_did, following_handle, is_mutual)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (follower_did, follower_handle, following_did, following_handle, is_mutual))
-        self.conn.commit()
+        """Add a follow relationship (an existing one is only upgraded to mutual)"""
+        self.add_follows([(follower_did, follower_handle, following_did, following_handle, is_mutual)])
+    
+    def add_users(self, users):
+        """Bulk version of add_user; each item is add_user's positional args"""
+        rows = [_user_row(*user) for user in users]
+        self.conn.executemany(UPSERT_USER, rows)
+        self._commit(len(rows))
+    
+    def add_missing_users(self, users):
+        """
+        Bulk-insert (did, handle, display_name) rows for users not in the
+        database yet, with 0 follower/follow counts like add_user
+        """
+        users = list(users)
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO users (did, handle, display_name, followers_count, follows_count) VALUES (?, ?, ?, 0, 0)
+        ''', users)
+        self._commit(len(users))
+    
+    def add_follows(self, follows):
+        """Bulk version of add_follow; each item is (follower_did, follower_handle, following_did, following_handle, is_mutual)"""
+        follows = list(follows)
+        if self.compact:
+            # Both ends need a users row (and so an id) before the edge can point at them
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO users (did, handle, followers_count, follows_count) VALUES (?, ?, 0, 0)
+            ''', {(did, handle) for row in follows for did, handle in (row[0:2], row[2:4])})
+            self.conn.executemany(ADD_EDGE, [
+                (FLAG_MUTUAL if is_mutual else 0, follower_did, following_did)
+                for follower_did, _, following_did, _, is_mutual in follows
+            ])
+        else:
+            self.conn.executemany(ADD_FOLLOW, follows)
+        self._commit(len(follows))
     
     def mark_as_crawled(self, did):
         """Mark a user as having been crawled"""
         self.conn.execute('''
             UPDATE users SET crawled = 1 WHERE did = ?
         ''', (did,))
-        self.conn.commit()
+        self._commit()
     
     def mark_as_mutual_core(self, did):
         """Mark a user as part of the Phase 1 mutual core"""
         self.conn.execute('''
             UPDATE users SET is_mutual_core = 1 WHERE did = ?
         ''', (did,))
-        self.conn.commit()
+        self._commit()
     
     def is_crawled(self, did):
         """Check if a user has already been crawled"""
@@ -138,6 +450,140 @@ class FurryNetworkDB:
         ''', (did,))
         return [row[0] for row in cursor.fetchall()]
     
+    def get_stored_connections(self, did, direction):
+        """Get (did, handle, display_name) of everyone this user follows ('follows') or is followed by ('followers')"""
+        if direction == 'follows':
+            query = '''
+                SELECT f.following_did, f.following_handle, u.display_name
+                FROM follows f LEFT JOIN users u ON u.did = f.following_did
+                WHERE f.follower_did = ?
+            '''
+        else:
+            query = '''
+                SELECT f.follower_did, f.follower_handle, u.display_name
+                FROM follows f LEFT JOIN users u ON u.did = f.follower_did
+                WHERE f.following_did = ?
+            '''
+        cursor = self.conn.execute(query, (did,))
+        return cursor.fetchall()
+    
+    def get_mutuals(self, did):
+        """Get DIDs recorded as mutuals of this user when it was crawled in Phase 1"""
+        cursor = self.conn.execute('''
+            SELECT following_did FROM follows WHERE follower_did = ? AND is_mutual = 1
+        ''', (did,))
+        return [row[0] for row in cursor.fetchall()]
+    
+    def save_cursor(self, did, direction, cursor):
+        """Remember where a failed follows/followers fetch should resume"""
+        self.conn.execute('''
+            INSERT OR REPLACE INTO crawl_cursors (did, direction, cursor) VALUES (?, ?, ?)
+        ''', (did, direction, cursor))
+        self._commit()
+    
+    def get_cursor(self, did, direction):
+        """Get the saved resume cursor for a follows/followers fetch (None if there is none)"""
+        cursor = self.conn.execute('''
+            SELECT cursor FROM crawl_cursors WHERE did = ? AND direction = ?
+        ''', (did, direction))
+        result = cursor.fetchone()
+        return result[0] if result else None
+    
+    def clear_cursors(self, did):
+        """Forget saved resume cursors once a user has been fully crawled"""
+        self.conn.execute('DELETE FROM crawl_cursors WHERE did = ?', (did,))
+        self._commit()
+    
+    def enqueue(self, phase, items):
+        """
+        Add (did, priority) pairs to a phase's crawl queue
+        
+        Users already queued get the new priority; users that are done or
+        skipped stay that way.
+        """
+        items = [(did, phase, priority) for did, priority in items]
+        self.conn.executemany('''
+            INSERT INTO crawl_queue (did, phase, priority) VALUES (?, ?, ?)
+            ON CONFLICT(phase, did) DO UPDATE SET priority = excluded.priority
+            WHERE status = 'queued'
+        ''', items)
+        self._commit(len(items))
+    
+    def get_queue(self, phase, min_priority=None):
+        """Get (did, priority) of users still queued for a phase and not crawled, best first then oldest first"""
+        query = '''
+            SELECT q.did, q.priority FROM crawl_queue q
+            LEFT JOIN users u ON u.did = q.did
+            WHERE q.phase = ? AND q.status = 'queued' AND COALESCE(u.crawled, 0) = 0
+        '''
+        params = [phase]
+        if min_priority is not None:
+            query += ' AND q.priority >= ?'
+            params.append(min_priority)
+        query += ' ORDER BY q.priority DESC, q.rowid'
+        cursor = self.conn.execute(query, params)
+        return cursor.fetchall()
+    
+    def set_queue_status(self, phase, did, status):
+        """Record that a queued user is 'done', was 'skipped' or 'failed'"""
+        self.conn.execute('''
+            UPDATE crawl_queue SET status = ? WHERE phase = ? AND did = ?
+        ''', (status, phase, did))
+        self._commit()
+    
+    def claim_batch(self, phase, limit, min_priority=None):
+        """
+        Atomically take up to `limit` queued, uncrawled DIDs (best first) for one worker
+        
+        They are marked 'claimed' so no other process gets them; see
+        sharded_crawler.py.
+        """
+        # Take the write lock before reading, so no other process can pick
+        # the same rows between the SELECT and the UPDATE
+        self.flush()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            claimed = self.conn.execute('''
+                SELECT q.rowid, q.did FROM crawl_queue q
+                LEFT JOIN users u ON u.did = q.did
+                WHERE q.phase = ? AND q.status = 'queued' AND COALESCE(u.crawled, 0) = 0
+                AND q.priority >= ?
+                ORDER BY q.priority DESC, q.rowid
+                LIMIT ?
+            ''', (phase, min_priority or 0, limit)).fetchall()
+            self.conn.executemany('''
+                UPDATE crawl_queue SET status = 'claimed' WHERE rowid = ?
+            ''', ((rowid,) for rowid, _ in claimed))
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.flush()  # Release the write lock straight away, even if nothing was claimed
+        return [did for _, did in claimed]
+    
+    def count_pending(self, phase, min_priority=None):
+        """Count DIDs of a phase that are claimed, or queued and claimable"""
+        cursor = self.conn.execute('''
+            SELECT COUNT(*) FROM crawl_queue q
+            LEFT JOIN users u ON u.did = q.did
+            WHERE q.phase = ? AND (q.status = 'claimed' OR (
+                q.status = 'queued' AND COALESCE(u.crawled, 0) = 0 AND q.priority >= ?
+            ))
+        ''', (phase, min_priority or 0))
+        return cursor.fetchone()[0]
+    
+    def requeue(self, phase, statuses):
+        """Put DIDs with any of the given statuses (e.g. 'claimed') back in the queue"""
+        placeholders = ', '.join('?' for _ in statuses)
+        self.conn.execute(f'''
+            UPDATE crawl_queue SET status = 'queued' WHERE phase = ? AND status IN ({placeholders})
+        ''', (phase, *statuses))
+        self._commit()
+    
+    def clear_queue(self, phase):
+        """Forget a phase's crawl queue"""
+        self.conn.execute('DELETE FROM crawl_queue WHERE phase = ?', (phase,))
+        self._commit()
+    
     def get_connection_count(self, did):
         """Get number of connections (followers + following) a user has in our graph"""
         cursor = self.conn.execute('''
@@ -166,6 +612,80 @@ class FurryNetworkDB:
         ''', (did, did))
         return cursor.fetchone()[0]
     
+    def get_core_degree(self, did):
+        """Get a user's core_degree (connections to mutual core members, 0 if unknown)"""
+        cursor = self.conn.execute('SELECT core_degree FROM users WHERE did = ?', (did,))
+        result = cursor.fetchone()
+        return result[0] if result else 0
+    
+    def get_phase2_candidates(self, min_connections):
+        """Stream (did, handle, core_degree) of uncrawled users with ≥min_connections to the core, best first"""
+        return self.conn.execute('''
+            SELECT did, handle, core_degree FROM users
+            WHERE crawled = 0 AND core_degree >= ?
+            ORDER BY core_degree DESC
+        ''', (min_connections,))
+    
+    def rebuild_core_degrees(self):
+        """
+        Recompute every user's core_degree from scratch
+        
+        One GROUP BY over the edges touching mutual-core members (found via
+        the follower/following indexes), instead of a query per user. The
+        triggers keep the counts current after that.
+        """
+        self.conn.execute('UPDATE users SET core_degree = 0 WHERE core_degree != 0')
+        if self.compact:
+            key = 'id'
+            counts = '''
+                SELECT id, COUNT(*) FROM (
+                    SELECT e.dst_id AS id, e.src_id AS core_id
+                    FROM users c JOIN edges e ON e.src_id = c.id WHERE c.is_mutual_core = 1
+                    UNION
+                    SELECT e.src_id, e.dst_id
+                    FROM users c JOIN edges e ON e.dst_id = c.id WHERE c.is_mutual_core = 1
+                )
+                WHERE id != core_id GROUP BY id
+            '''
+        else:
+            key = 'did'
+            counts = '''
+                SELECT did, COUNT(*) FROM (
+                    SELECT f.following_did AS did, f.follower_did AS core_did
+                    FROM users c JOIN follows f ON f.follower_did = c.did WHERE c.is_mutual_core = 1
+                    UNION
+                    SELECT f.follower_did, f.following_did
+                    FROM users c JOIN follows f ON f.following_did = c.did WHERE c.is_mutual_core = 1
+                )
+                WHERE did != core_did GROUP BY did
+            '''
+        # Through a temp table and correlated subquery rather than
+        # UPDATE ... FROM, which needs SQLite 3.33
+        self.conn.execute('DROP TABLE IF EXISTS temp.core_counts')
+        self.conn.execute('CREATE TEMP TABLE core_counts (key PRIMARY KEY, n INTEGER) WITHOUT ROWID')
+        self.conn.execute(f'INSERT INTO temp.core_counts {counts}')
+        self.conn.execute(f'''
+            UPDATE users SET core_degree = (SELECT n FROM temp.core_counts WHERE key = users.{key})
+            WHERE {key} IN (SELECT key FROM temp.core_counts)
+        ''')
+        self.conn.execute('DROP TABLE temp.core_counts')
+        self._commit()
+    
+    def save_user_scores(self, column, scores):
+        """
+        Store one analysis result per user, e.g. save_user_scores('pagerank', [(did, score), ...])
+        
+        column must be one of USER_SCORE_COLUMNS. Users not in `scores`
+        keep their old value.
+        """
+        if column not in USER_SCORE_COLUMNS:
+            raise ValueError(f"Unknown score column: {column}")
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(users)')]
+        with self.transaction():
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE users ADD COLUMN {column} {USER_SCORE_COLUMNS[column]}')
+            self.conn.executemany(f'UPDATE users SET {column} = ? WHERE did = ?', ((value, did) for did, value in scores))
+    
     def user_exists(self, did):
         """Check if user exists in database"""
         cursor = self.conn.execute('SELECT 1 FROM users WHERE did = ?', (did,))
@@ -179,11 +699,18 @@ class FurryNetworkDB:
         cursor = self.conn.execute('SELECT COUNT(*) FROM users WHERE crawled = 1')
         crawled_users = cursor.fetchone()[0]
         
-        cursor = self.conn.execute('SELECT COUNT(*) FROM follows')
-        total_follows = cursor.fetchone()[0]
+        if self.compact:
+            # Count the edge table directly rather than through the follows view
+            cursor = self.conn.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM(flags & {FLAG_MUTUAL}), 0) FROM edges
+            ''')
+            total_follows, mutual_follows = cursor.fetchone()
+        else:
+            cursor = self.conn.execute('SELECT COUNT(*) FROM follows')
+            total_follows = cursor.fetchone()[0]
         
-        cursor = self.conn.execute('SELECT COUNT(*) FROM follows WHERE is_mutual = 1')
-        mutual_follows = cursor.fetchone()[0]
+            cursor = self.conn.execute('SELECT COUNT(*) FROM follows WHERE is_mutual = 1')
+            mutual_follows = cursor.fetchone()[0]
         
         return {
             'total_users': total_users,
@@ -194,5 +721,6 @@ class FurryNetworkDB:
         }
     
     def close(self):
-        """Close database connection"""
+        """Close database connection (committing any batched writes)"""
+        self.flush()
         self.conn.close()
\ No newline at end of file
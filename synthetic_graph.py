@@ -0,0 +1,225 @@
+"""
+Synthetic follow graphs shaped like the furry community, for benchmarks
+
+Real crawls can't be repeated at will, so benchmarks run on generated
+graphs with the same broad features:
+
+- A few accounts follow thousands and most follow a few dozen (out-degree
+  is power-law distributed), and some accounts are much more followed than
+  others (so is in-degree)
+- Users sit in communities of very different sizes, most follows stay
+  inside the community, and in-community follows are usually followed back
+- A handful of hub accounts are followed by a large share of everyone and
+  rarely follow back
+
+Everything is done with numpy on arrays of edges, so millions of users and
+tens of millions of edges take minutes, not hours. The result can be
+written to a furry_network.db-style file or served by fake_bluesky.py:
+
+    graph = generate(users=100_000, avg_follows=40)
+    write_db(graph, 'synthetic.db', compact=True)
+    fake = to_fake_bluesky(graph, latency=0.02)
+
+Usage:
+    python synthetic_graph.py synthetic.db [users] [avg_follows] [--compact]
+"""
+
+from storage import FurryNetworkDB, FLAG_MUTUAL
+from collections import namedtuple
+import numpy as np
+import os, sys, time
+
+# Edges sampled per numpy batch; bounds the temporary arrays' memory
+CHUNK_EDGES = 5_000_000
+
+# Users written per executemany
+WRITE_BATCH = 100_000
+
+# users: node count; src/dst: edge arrays (follower -> followed), sorted and
+# without duplicates or self-follows; community: community of each user;
+# hubs: indexes of the hub accounts
+SyntheticGraph = namedtuple('SyntheticGraph', ['users', 'src', 'dst', 'community', 'hubs'])
+
+def did(i):
+    """DID of synthetic user i"""
+    return f'did:plc:synthetic{i:09d}'
+
+def handle(i):
+    """Handle of synthetic user i"""
+    return f'user{i}.synthetic.test'
+
+def _power_law(rng, size, exponent, minimum):
+    """Pareto samples >= minimum with P(x) ~ x^-exponent"""
+    return minimum * (1 - rng.random(size)) ** (-1 / (exponent - 1))
+
+def generate(users=10_000, avg_follows=40, communities=None, in_community=0.8, reciprocity=0.6,
+             cross_reciprocity=0.1, hubs=20, hub_share=0.05, hub_reciprocity=0.01, exponent=2.1, seed=0):
+    """
+    Generate a follow graph
+    
+    Args:
+        users: Number of accounts
+        avg_follows: Roughly the mean out-degree, before follow-backs are added
+        communities: Number of communities (default: about one per 500 users)
+        in_community: Fraction of follows that stay inside the follower's community
+        reciprocity: Chance an in-community follow is followed back
+        cross_reciprocity: Chance any other follow is followed back
+        hubs: Number of hub accounts
+        hub_share: Fraction of all follows that go to a hub
+        hub_reciprocity: Chance a hub follows back
+        exponent: Power-law exponent of out-degrees and popularity
+        seed: Random seed; the same arguments always give the same graph
+    
+    Returns:
+        SyntheticGraph
+    """
+    rng = np.random.default_rng(seed)
+    communities = communities or max(1, users // 500)
+    hubs = min(hubs, users)
+    
+    # Community sizes are power-law too: a few big fandom circles, many small ones
+    sizes = _power_law(rng, communities, exponent, 1.0)
+    community = rng.choice(communities, size=users, p=sizes / sizes.sum()).astype(np.int32)
+    
+    # Out-degrees, scaled to the requested mean and capped at a plausible maximum
+    out_degree = _power_law(rng, users, exponent, 1.0)
+    out_degree = np.minimum(np.rint(out_degree * avg_follows / out_degree.mean()), min(users - 1, 10_000)).astype(np.int64)
+    
+    # How likely each user is to be followed; hubs are picked from the most popular
+    popularity = _power_law(rng, users, exponent, 1.0)
+    hub_ids = np.argpartition(-popularity, hubs - 1)[:hubs] if hubs else np.empty(0, dtype=np.int64)
+    
+    # Users sorted by community, with cumulative popularity, so a follow
+    # target is one searchsorted into the follower's community's range
+    order = np.argsort(community, kind='stable')
+    cumulative = np.cumsum(popularity[order])
+    starts = np.searchsorted(community[order], np.arange(communities))
+    ends = np.searchsorted(community[order], np.arange(communities), side='right')
+    low = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0.0)
+    high = cumulative[np.maximum(ends - 1, 0)]
+    
+    keys = []
+    sources = np.repeat(np.arange(users, dtype=np.int64), out_degree)
+    for chunk in range(0, len(sources), CHUNK_EDGES):
+        src = sources[chunk:chunk + CHUNK_EDGES]
+        n = len(src)
+        kind = rng.random(n)
+        
+        # Inside the community, elsewhere (by popularity), or a hub
+        local = kind < in_community * (1 - hub_share)
+        to_hub = kind >= 1 - hub_share if hubs else np.zeros(n, dtype=bool)
+        c = community[src]
+        point = np.where(local, low[c] + rng.random(n) * (high[c] - low[c]), rng.random(n) * cumulative[-1])
+        dst = order[np.minimum(np.searchsorted(cumulative, point, side='right'), users - 1)].astype(np.int64)
+        if hubs:
+            dst[to_hub] = hub_ids[rng.integers(0, hubs, to_hub.sum())]
+        
+        # Follow-backs
+        chance = np.where(local, reciprocity, cross_reciprocity)
+        chance[np.isin(dst, hub_ids)] = hub_reciprocity
+        back = rng.random(n) < chance
+        keys.append(src * users + dst)
+        keys.append(dst[back] * users + src[back])
+    
+    keys = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)  # No follows with one user
+    src, dst = np.divmod(keys, users)
+    keep = src != dst
+    return SyntheticGraph(users, src[keep], dst[keep], community, np.sort(hub_ids))
+
+def mutual_mask(graph):
+    """Boolean array: is each edge followed back?"""
+    keys = graph.src * graph.users + graph.dst
+    reverse = graph.dst * graph.users + graph.src
+    found = np.minimum(np.searchsorted(keys, reverse), len(keys) - 1)
+    return keys[found] == reverse
+
+def write_db(graph, db_path, compact=False, core_community=None):
+    """
+    Write a graph to a new furry_network.db-style SQLite file
+    
+    Every user is marked crawled. Members of core_community (default: the
+    largest community) are marked as the mutual core, as if Phase 1 had
+    started there, so Phase 2 queries have something to count.
+    """
+    if os.path.exists(db_path):
+        raise SystemExit(f"{db_path} already exists, not overwriting it")
+    
+    if core_community is None:
+        core_community = int(np.bincount(graph.community).argmax())
+    core = graph.community == core_community
+    followers = np.bincount(graph.dst, minlength=graph.users)
+    follows = np.bincount(graph.src, minlength=graph.users)
+    mutual = mutual_mask(graph)
+    
+    db = FurryNetworkDB(db_path, compact=compact)
+    conn = db.conn
+    # Like migrate_compact.py: build indexes and core_degree once at the end
+    if db.compact:
+        conn.execute('DROP INDEX idx_edges_dst')
+        conn.execute('DROP TRIGGER trg_edges_core_degree')
+    else:
+        conn.execute('DROP INDEX idx_follower')
+        conn.execute('DROP INDEX idx_following')
+        conn.execute('DROP TRIGGER trg_follows_core_degree')
+    conn.execute('DROP TRIGGER trg_users_core_degree')
+    
+    print(f"Writing {graph.users} users...")
+    for start in range(0, graph.users, WRITE_BATCH):
+        ids = range(start, min(start + WRITE_BATCH, graph.users))
+        conn.executemany('''
+            INSERT INTO users (did, handle, display_name, followers_count, follows_count, description, crawled, is_mutual_core)
+            VALUES (?, ?, ?, ?, ?, '', 1, ?)
+        ''', ((did(i), handle(i), f'User {i}', int(followers[i]), int(follows[i]), int(core[i])) for i in ids))
+    
+    print(f"Writing {len(graph.src)} follows...")
+    if db.compact:
+        # Users went in in order, so user i has id i + 1
+        flags = np.where(mutual, FLAG_MUTUAL, 0)
+        conn.executemany('INSERT INTO edges (src_id, dst_id, flags) VALUES (?, ?, ?)', zip(
+            (graph.src + 1).tolist(), (graph.dst + 1).tolist(), flags.tolist()))
+    else:
+        conn.executemany('''
+            INSERT INTO follows (follower_did, follower_handle, following_did, following_handle, is_mutual)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ((did(s), handle(s), did(d), handle(d), m) for s, d, m in zip(
+            graph.src.tolist(), graph.dst.tolist(), mutual.tolist())))
+    
+    print("Indexing...")
+    db.create_tables()
+    db.rebuild_core_degrees()
+    conn.commit()
+    conn.execute('ANALYZE')
+    
+    stats = db.get_stats()
+    db.close()
+    print(f"\n✓ Wrote {stats['total_users']} users and {stats['total_follows']} follows ({stats['mutual_follows']} mutual) to {db_path}")
+
+def to_fake_bluesky(graph, **kwargs):
+    """FakeBluesky serving this graph (keyword arguments go to FakeBluesky)"""
+    from fake_bluesky import FakeBluesky
+    
+    bounds = np.searchsorted(graph.src, np.arange(graph.users + 1))
+    dst = graph.dst.tolist()
+    follows = {did(i): [did(j) for j in dst[bounds[i]:bounds[i + 1]]] for i in range(graph.users)}
+    profiles = {did(i): {'handle': handle(i), 'displayName': f'User {i}'} for i in range(graph.users)}
+    return FakeBluesky(follows, profiles, **kwargs)
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not args:
+        raise SystemExit(__doc__)
+    db_path = args[0]
+    users = int(args[1]) if len(args) > 1 else 100_000
+    avg_follows = int(args[2]) if len(args) > 2 else 40
+    
+    started = time.time()
+    graph = generate(users, avg_follows)
+    mutual = mutual_mask(graph)
+    print(f"Generated {users} users and {len(graph.src)} follows in {time.time() - started:.1f}s")
+    print(f"  {mutual.mean():.0%} of follows are mutual, {len(np.unique(graph.community))} communities")
+    print(f"  Most followed: {np.bincount(graph.dst, minlength=users).max()} followers")
+    write_db(graph, db_path, compact='--compact' in sys.argv)
+    print(f"  Done in {time.time() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Phase 2 limits count the same users in main.py and async_crawler.py"""
+
+from storage import FurryNetworkDB
+from synthetic_graph import generate, to_fake_bluesky, did
+import async_crawler
+import main as main_crawler
+import asyncio
+import numpy as np
+import shutil
+
+def _phase1(tmp_path):
+    """Fake server and a database after Phase 1, where some Phase 2 candidates have no profile"""
+    graph = generate(400, 20, communities=2, seed=3)
+    start = int(np.flatnonzero(graph.community == 0)[0])
+    fake = to_fake_bluesky(graph, account=did(start))
+    db = FurryNetworkDB(str(tmp_path / 'phase1.db'))
+    main_crawler.phase1_mutuals_graph(fake.api(), db, did(start), max_users=20)
+    
+    # Every other candidate's account is gone: their profile can't be fetched
+    candidates = [candidate for candidate, _ in main_crawler.scan_initial_candidates(db, main_crawler.MIN_CONNECTIONS)]
+    db.close()
+    gone = set(candidates[::2])
+    get_profile, get_profiles = fake._app_bsky_actor_getProfile, fake._app_bsky_actor_getProfiles
+    
+    def profile(request):
+        if request.url.params['actor'] in gone:
+            raise LookupError('Profile not found')
+        return get_profile(request)
+    
+    def profiles(request):
+        body = get_profiles(request)
+        body['profiles'] = [view for view in body['profiles'] if view['did'] not in gone]
+        return body
+    
+    fake._app_bsky_actor_getProfile, fake._app_bsky_actor_getProfiles = profile, profiles
+    return fake
+
+def _crawled(path):
+    db = FurryNetworkDB(str(path))
+    crawled = db.get_stats()['crawled_users']
+    db.close()
+    return crawled
+
+def test_failed_users_do_not_count_towards_phase2_limit(tmp_path):
+    fake = _phase1(tmp_path)
+    before = _crawled(tmp_path / 'phase1.db')
+    shutil.copy(tmp_path / 'phase1.db', tmp_path / 'sync.db')
+    shutil.copy(tmp_path / 'phase1.db', tmp_path / 'async.db')
+    
+    db = FurryNetworkDB(str(tmp_path / 'sync.db'))
+    main_crawler.phase2_expand_graph(fake.api(), db, main_crawler.MIN_CONNECTIONS, max_users=10)
+    db.close()
+    
+    async def run():
+        api = await fake.async_api()
+        db = FurryNetworkDB(str(tmp_path / 'async.db'))
+        await async_crawler.phase2_expand_graph_async(api, db, main_crawler.MIN_CONNECTIONS, max_users=10, concurrency=4)
+        db.close()
+        await api.close()
+    asyncio.run(run())
+    
+    assert _crawled(tmp_path / 'sync.db') - before == 10
+    assert _crawled(tmp_path / 'async.db') - before == 10
@@ -0,0 +1,25 @@
+"""Edge weights of the undirected graph community detection runs on"""
+
+from communities import symmetrize
+from sparse_graph import load_sparse_graph
+from storage import FurryNetworkDB
+import pytest
+
+def _did(i):
+    return f'did:plc:user{i}'
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_mutual_pair_weighs_two_however_stored(tmp_path, compact):
+    # 0-1: both rows, both flagged; 0-2: one flagged row; 0-3: two plain rows; 0 -> 4 only
+    follows = [(0, 1, True), (1, 0, True), (0, 2, True), (0, 3, False), (3, 0, False), (0, 4, False)]
+    db = FurryNetworkDB(str(tmp_path / 'test.db'), compact=compact)
+    with db.transaction():
+        db.add_users((_did(i), f'user{i}.test', None) for i in range(5))
+        db.add_follows((_did(a), f'user{a}.test', _did(b), f'user{b}.test', mutual) for a, b, mutual in follows)
+    db.close()
+    
+    graph = load_sparse_graph(str(tmp_path / 'test.db'))
+    W = symmetrize(graph)
+    index = [graph.index[_did(i)] for i in range(5)]
+    assert [W[index[0], index[i]] for i in range(1, 5)] == [2, 2, 2, 1]
+    assert (W != W.T).nnz == 0
@@ -0,0 +1,55 @@
+"""DBWriter stops the crawl after a failed write instead of dropping writes"""
+
+from async_crawler import run_workers
+from db_writer import DBWriter, DBWriteError
+from storage import FurryNetworkDB
+import asyncio
+import pytest
+
+def _failed_writer(tmp_path):
+    db = DBWriter(FurryNetworkDB(str(tmp_path / 'test.db')))
+    db.add_user('did:plc:a', 'a.test')
+    db.flush()
+    db.save_user_scores('no_such_column', [])  # Raises ValueError on the writer thread
+    db.add_user('did:plc:b', 'b.test')
+    db.queue.join()
+    return db
+
+def test_error_is_raised_on_every_later_write(tmp_path):
+    db = _failed_writer(tmp_path)
+    for _ in range(3):
+        with pytest.raises(DBWriteError):
+            db.add_user('did:plc:c', 'c.test')
+    with pytest.raises(DBWriteError):
+        with db.transaction():
+            db.add_user('did:plc:c', 'c.test')
+    with pytest.raises(DBWriteError):
+        db.flush()
+    with pytest.raises(DBWriteError):
+        db.close()
+    assert not db.thread.is_alive()
+    
+    db = FurryNetworkDB(str(tmp_path / 'test.db'))
+    assert db.user_exists('did:plc:a')
+    assert not db.user_exists('did:plc:b')
+    db.close()
+
+def test_run_workers_stops_on_write_error(tmp_path):
+    db = _failed_writer(tmp_path)
+    crawled = []
+    
+    async def crawl(item):
+        crawled.append(item)
+        db.add_user(f'did:plc:{item}', f'{item}.test')
+    
+    async def run():
+        queue = asyncio.Queue()
+        for item in range(20):
+            queue.put_nowait(item)
+        await run_workers(queue, crawl, concurrency=4)
+    
+    with pytest.raises(DBWriteError):
+        asyncio.run(run())
+    assert len(crawled) < 20
+    with pytest.raises(DBWriteError):
+        db.close()
@@ -0,0 +1,77 @@
+"""Bytes received are counted from the raw responses, with or without content-length"""
+
+from atproto import AsyncRequest, Request
+from bluesky_api import AsyncBlueskyAPI, BlueskyAPI, _count_response_bytes
+from fake_bluesky import BASE_URL, PASSWORD, FakeBluesky
+from metrics import ApiMetrics, response_size
+from rate_limiter import RateLimiter
+import asyncio
+import httpx
+import pytest
+
+def test_response_size_without_content_length():
+    response = httpx.Response(200, content=iter([b'x' * 300, b'y' * 200]))  # Streamed: chunked, no content-length
+    response.read()
+    assert 'content-length' not in response.headers
+    assert response_size(response) == 500
+    assert response_size(httpx.Response(200, content=b'z' * 42)) == 42
+
+class _Recorder:
+    """Wraps FakeBluesky.respond, optionally stripping content-length, and adds up body sizes"""
+    def __init__(self, fake, chunked, is_async=False):
+        self.fake = fake
+        self.chunked = chunked
+        self.is_async = is_async
+        self.bytes = 0
+    
+    def __call__(self, request):
+        response = self.fake.respond(request)
+        body = response.read()
+        if 'com.atproto.server.' not in str(request.url):
+            self.bytes += len(body)
+        if not self.chunked:
+            return response
+        headers = {key: value for key, value in response.headers.items() if key != 'content-length'}
+        return httpx.Response(response.status_code, headers=headers, content=self._stream(body))
+    
+    def _stream(self, body):
+        async def chunks():
+            yield body
+        return chunks() if self.is_async else iter([body])
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_sync_api_counts_bytes(chunked):
+    fake = FakeBluesky.random_graph(users=50, seed=1)
+    recorder = _Recorder(fake, chunked)
+    api = BlueskyAPI(fake.profiles[fake.account]['handle'], PASSWORD, rate_limiter=RateLimiter(rate=1e9, burst=1e9),
+                     base_url=BASE_URL, request=Request(transport=httpx.MockTransport(recorder)))
+    api.get_all_follows(fake.account)
+    api.get_all_followers(fake.account)
+    snapshot = api.metrics.snapshot()['methods']
+    assert recorder.bytes > 0
+    assert sum(stats['bytes'] for stats in snapshot.values()) == recorder.bytes
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_async_api_counts_bytes(chunked):
+    fake = FakeBluesky.random_graph(users=50, seed=1)
+    recorder = _Recorder(fake, chunked, is_async=True)
+    
+    async def handler(request):
+        return recorder(request)
+    
+    async def run():
+        api = await AsyncBlueskyAPI.create(
+            fake.profiles[fake.account]['handle'], PASSWORD, rate_limiter=RateLimiter(rate=1e9, burst=1e9),
+            base_url=BASE_URL, request=AsyncRequest(transport=httpx.MockTransport(handler)))
+        await api.get_all_follows(fake.account)
+        await api.close()
+        return api.metrics.snapshot()['methods']
+    
+    snapshot = asyncio.run(run())
+    assert recorder.bytes > 0
+    assert sum(stats['bytes'] for stats in snapshot.values()) == recorder.bytes
+
+def test_missing_httpx_client_is_tolerated(capsys):
+    # A later atproto that keeps its httpx client elsewhere: no byte counts, but no crash
+    _count_response_bytes(object(), ApiMetrics())
+    assert "response sizes won't be recorded" in capsys.readouterr().out
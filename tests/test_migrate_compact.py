@@ -0,0 +1,78 @@
+"""migrate_compact.py keeps enough state for a crawl to resume on the new file"""
+
+from migrate_compact import migrate
+from storage import FurryNetworkDB
+from synthetic_graph import generate, to_fake_bluesky, did
+import main as main_crawler
+import numpy as np
+import os
+import pytest
+import sqlite3
+
+def _fake(seed=0):
+    graph = generate(300, 20, communities=2, seed=seed)
+    start = int(np.flatnonzero(graph.community == 0)[0])
+    return to_fake_bluesky(graph, account=did(start)), did(start)
+
+def test_migrate_copies_crawl_queue(tmp_path):
+    fake, seed = _fake()
+    db = FurryNetworkDB(str(tmp_path / 'legacy.db'))
+    main_crawler.phase1_mutuals_graph(fake.api(), db, seed, max_users=5)
+    queued = list(db.get_queue(1))
+    rows = db.conn.execute('SELECT did, phase, status, priority, enqueued_at FROM crawl_queue ORDER BY rowid').fetchall()
+    db.close()
+    assert queued
+    
+    migrate(str(tmp_path / 'legacy.db'), str(tmp_path / 'compact.db'))
+    db = FurryNetworkDB(str(tmp_path / 'compact.db'))
+    assert db.compact
+    assert db.conn.execute('SELECT did, phase, status, priority, enqueued_at FROM crawl_queue ORDER BY rowid').fetchall() == rows
+    assert list(db.get_queue(1)) == queued
+    db.close()
+
+def test_crawl_resumes_after_migration(tmp_path, capsys):
+    fake, seed = _fake()
+    db = FurryNetworkDB(str(tmp_path / 'legacy.db'))
+    main_crawler.phase1_mutuals_graph(fake.api(), db, seed, max_users=5)
+    crawled = db.get_stats()['crawled_users']
+    db.close()
+    
+    migrate(str(tmp_path / 'legacy.db'), str(tmp_path / 'compact.db'))
+    db = FurryNetworkDB(str(tmp_path / 'compact.db'))
+    capsys.readouterr()
+    main_crawler.phase1_mutuals_graph(fake.api(), db, seed, max_users=5)
+    assert 'Resuming:' in capsys.readouterr().out
+    assert db.get_stats()['crawled_users'] == crawled + 5
+    db.close()
+
+def test_compact_source_leaves_no_destination(tmp_path):
+    FurryNetworkDB(str(tmp_path / 'compact.db'), compact=True).close()
+    with pytest.raises(SystemExit, match='already uses the compact schema'):
+        migrate(str(tmp_path / 'compact.db'), str(tmp_path / 'out.db'))
+    assert not os.path.exists(tmp_path / 'out.db')
+
+def test_failed_copy_removes_destination(tmp_path, monkeypatch):
+    fake, seed = _fake()
+    db = FurryNetworkDB(str(tmp_path / 'legacy.db'))
+    main_crawler.phase1_mutuals_graph(fake.api(), db, seed, max_users=2)
+    db.close()
+    
+    def fail(self):
+        raise sqlite3.OperationalError('disk I/O error')
+    monkeypatch.setattr(FurryNetworkDB, 'rebuild_core_degrees', fail)
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(str(tmp_path / 'legacy.db'), str(tmp_path / 'compact.db'))
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('compact.db')]
+    
+    monkeypatch.undo()
+    migrate(str(tmp_path / 'legacy.db'), str(tmp_path / 'compact.db'))
+
+def test_users_only_seen_in_follows_get_zero_counts(tmp_path):
+    db = FurryNetworkDB(str(tmp_path / 'legacy.db'))
+    db.conn.execute("INSERT INTO follows (follower_did, follower_handle, following_did, following_handle, is_mutual) VALUES ('did:plc:a', 'a.test', 'did:plc:b', 'b.test', 0)")
+    db.conn.commit()
+    db.close()
+    migrate(str(tmp_path / 'legacy.db'), str(tmp_path / 'compact.db'))
+    db = FurryNetworkDB(str(tmp_path / 'compact.db'))
+    assert db.conn.execute('SELECT DISTINCT followers_count, follows_count FROM users').fetchall() == [(0, 0)]
+    db.close()
@@ -0,0 +1,51 @@
+"""PageRank converges to networkx's scores, also on graphs where n * tol is large"""
+
+from pagerank import PageRank
+from sparse_graph import load_sparse_graph
+from synthetic_graph import generate, write_db
+import numpy as np
+import pytest
+
+nx = pytest.importorskip('networkx')
+
+@pytest.fixture(scope='module')
+def graph(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('pagerank') / 'test.db')
+    write_db(generate(3000, 20, seed=5), path)
+    return load_sparse_graph(path)
+
+def _reference(graph, personalization=None):
+    """networkx PageRank on the same follows, run to (near) exact convergence"""
+    flagged = graph.adjacency.copy()
+    flagged.data = graph.mutual.astype(np.int8)
+    links = (graph.adjacency + flagged.T).tocoo()
+    G = nx.DiGraph()
+    G.add_nodes_from(range(graph.num_nodes))
+    G.add_edges_from((a, b) for a, b in zip(links.row.tolist(), links.col.tolist()) if a != b)
+    scores = nx.pagerank(G, personalization=personalization, tol=1e-12, max_iter=1000)
+    return np.array([scores[i] for i in range(graph.num_nodes)])
+
+# n * tol = 3: more than any L1 change, so a size-scaled test would stop after one iteration
+TOL = 1e-3
+
+def test_pagerank_matches_networkx(graph):
+    ranker = PageRank(graph, threads=3)
+    scores = ranker.run(tol=TOL)
+    assert ranker.iterations > 1
+    assert np.abs(scores - _reference(graph)).sum() < 10 * TOL
+    assert scores.sum() == pytest.approx(1)
+
+def test_core_pagerank_matches_networkx(graph):
+    ranker = PageRank(graph, threads=3)
+    scores = ranker.run(personalization=graph.is_mutual_core, tol=TOL)
+    expected = _reference(graph, {i: 1 for i in np.flatnonzero(graph.is_mutual_core).tolist()})
+    assert ranker.iterations > 1
+    assert np.abs(scores - expected).sum() < 10 * TOL
+    top = np.argsort(-expected)[:10]
+    assert set(np.argsort(-scores)[:10].tolist()) == set(top.tolist())
+
+def test_default_tolerance_converges(graph):
+    ranker = PageRank(graph)
+    scores = ranker.run()
+    assert ranker.iterations > 20
+    assert np.abs(scores - _reference(graph)).sum() < 1e-5
@@ -0,0 +1,64 @@
+"""Prefetched profiles are let go once the crawl won't use them"""
+
+from storage import FurryNetworkDB
+from synthetic_graph import generate, to_fake_bluesky, did
+import async_crawler
+import main as main_crawler
+import asyncio
+import numpy as np
+
+def _fake():
+    graph = generate(300, 20, communities=2, seed=4)
+    start = int(np.flatnonzero(graph.community == 0)[0])
+    return to_fake_bluesky(graph, account=did(start)), did(start)
+
+def _capture(monkeypatch, module, name):
+    """Replace module.name with a subclass that remembers its instances"""
+    instances = []
+    cls = getattr(module, name)
+    
+    class Captured(cls):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            instances.append(self)
+    
+    monkeypatch.setattr(module, name, Captured)
+    return instances
+
+def test_profile_cache_is_emptied_after_each_phase(tmp_path, monkeypatch):
+    caches = _capture(monkeypatch, main_crawler, 'ProfileCache')
+    fake, seed = _fake()
+    api = fake.api()
+    db = FurryNetworkDB(str(tmp_path / 'test.db'))
+    main_crawler.phase1_mutuals_graph(api, db, seed, max_users=5)
+    main_crawler.phase2_expand_graph(api, db, main_crawler.MIN_CONNECTIONS, max_users=5)
+    db.close()
+    assert len(caches) == 2
+    assert all(not cache.profiles for cache in caches)
+
+def test_profile_cache_drops_skipped_users():
+    class API:
+        def get_profiles(self, dids):
+            return {did: object() for did in dids}
+    
+    cache = main_crawler.ProfileCache(API())
+    cache.get('a', ['b', 'c'])
+    assert set(cache.profiles) == {'b', 'c'}
+    cache.drop('b')
+    assert set(cache.profiles) == {'c'}
+
+def test_prefetcher_is_emptied_after_each_phase(tmp_path, monkeypatch):
+    prefetchers = _capture(monkeypatch, async_crawler, 'ProfilePrefetcher')
+    fake, seed = _fake()
+    
+    async def run():
+        api = await fake.async_api()
+        db = FurryNetworkDB(str(tmp_path / 'test.db'))
+        await async_crawler.phase1_mutuals_graph_async(api, db, seed, max_users=5, concurrency=4)
+        await async_crawler.phase2_expand_graph_async(api, db, main_crawler.MIN_CONNECTIONS, max_users=5, concurrency=4)
+        db.close()
+        await api.close()
+    asyncio.run(run())
+    
+    assert len(prefetchers) == 2
+    assert all(not prefetcher.pending and not prefetcher.requests for prefetcher in prefetchers)
@@ -0,0 +1,72 @@
+"""Accounts that are gone are skipped for good; other profile failures are retried next run"""
+
+from storage import FurryNetworkDB
+from synthetic_graph import generate, to_fake_bluesky, did
+import async_crawler
+import main as main_crawler
+from collections import Counter
+import asyncio
+import pytest
+
+def _fake():
+    """Fake server where one of the seed's mutuals is gone and another's profile keeps failing with 503s"""
+    graph = generate(200, 15, communities=2, seed=5)
+    follows = set(zip(graph.src.tolist(), graph.dst.tolist()))
+    mutual_pairs = [(a, b) for a, b in follows if (b, a) in follows]
+    start = Counter(a for a, _ in mutual_pairs).most_common(1)[0][0]
+    fake = to_fake_bluesky(graph, account=did(start))
+    mutuals = sorted(b for a, b in mutual_pairs if a == start)
+    gone, down = did(mutuals[0]), did(mutuals[1])
+    get_profile, get_profiles, respond = fake._app_bsky_actor_getProfile, fake._app_bsky_actor_getProfiles, fake.respond
+    
+    def profile(request):
+        if request.url.params['actor'] == gone:
+            raise LookupError('Profile not found')
+        return get_profile(request)
+    
+    def profiles(request):
+        body = get_profiles(request)
+        body['profiles'] = [view for view in body['profiles'] if view['did'] not in (gone, down)]
+        return body
+    
+    def failing(request):
+        if fake.down and request.url.path.endswith('.getProfile') and request.url.params['actor'] == down:
+            return fake._error(503, 'InternalServerError', 'Injected error')
+        return respond(request)
+    
+    fake._app_bsky_actor_getProfile, fake._app_bsky_actor_getProfiles, fake.respond = profile, profiles, failing
+    fake.down = True
+    return fake, did(start), gone, down
+
+def _statuses(db):
+    return dict(db.conn.execute('SELECT did, status FROM crawl_queue WHERE phase = 1'))
+
+@pytest.mark.parametrize('crawler', ['sync', 'async'])
+def test_failed_profile_is_retried_next_run(tmp_path, crawler):
+    fake, start, gone, down = _fake()
+    
+    def run():
+        db = FurryNetworkDB(str(tmp_path / 'test.db'))
+        if crawler == 'sync':
+            main_crawler.phase1_mutuals_graph(fake.api(), db, start)
+        else:
+            async def crawl():
+                api = await fake.async_api()
+                await async_crawler.phase1_mutuals_graph_async(api, db, start, concurrency=4)
+                await api.close()
+            asyncio.run(crawl())
+        statuses = _statuses(db)
+        crawled = db.is_crawled(down)
+        db.close()
+        return statuses, crawled
+    
+    statuses, crawled = run()
+    assert statuses[gone] == 'skipped'
+    assert statuses[down] == 'failed'
+    assert not crawled
+    
+    fake.down = False
+    statuses, crawled = run()
+    assert statuses[gone] == 'skipped'
+    assert statuses[down] == 'done'
+    assert crawled
@@ -0,0 +1,50 @@
+"""Claiming work and recovering from dead workers in sharded_crawler.py"""
+
+from storage import FurryNetworkDB
+from sharded_crawler import Profile, ResultWriter
+
+def _queue(tmp_path, n):
+    db = FurryNetworkDB(str(tmp_path / 'test.db'))
+    db.enqueue(1, [(f'did:plc:{i}', i) for i in range(n)])
+    db.flush()
+    return db
+
+def test_claims_best_first_without_overlap(tmp_path):
+    db = _queue(tmp_path, 10)
+    other = FurryNetworkDB(str(tmp_path / 'test.db'))
+    first = db.claim_batch(1, 4)
+    second = other.claim_batch(1, 4, min_priority=3)
+    assert first == ['did:plc:9', 'did:plc:8', 'did:plc:7', 'did:plc:6']
+    assert second == ['did:plc:5', 'did:plc:4', 'did:plc:3']
+    assert other.claim_batch(1, 4, min_priority=3) == []
+    assert db.count_pending(1) == 10
+    other.close()
+    db.close()
+
+def test_dead_worker_claims_are_requeued(tmp_path):
+    db = _queue(tmp_path, 4)
+    writer = ResultWriter(db, 1, 3)
+    writer.apply(('claimed', 'one.test', db.claim_batch(1, 2)))
+    writer.apply(('claimed', 'two.test', db.claim_batch(1, 2)))
+    writer.apply(('profile', 'did:plc:3', Profile('did:plc:3', '3.test', None, 0, 0, ''), False))
+    writer.apply(('done', 'did:plc:3'))
+    writer.apply(('profile', 'did:plc:2', Profile('did:plc:2', '2.test', None, 0, 0, ''), False))
+    
+    # one.test died halfway through did:plc:2; two.test is still working
+    assert writer.release('one.test') == 1
+    assert db.claim_batch(1, 4) == ['did:plc:2']
+    assert writer.release('one.test') == 0
+    statuses = dict(db.conn.execute('SELECT did, status FROM crawl_queue'))
+    assert statuses == {'did:plc:3': 'done', 'did:plc:2': 'claimed', 'did:plc:1': 'claimed', 'did:plc:0': 'claimed'}
+    db.close()
+
+def test_failed_fetch_saves_cursor(tmp_path):
+    db = _queue(tmp_path, 1)
+    writer = ResultWriter(db, 1, 3)
+    writer.apply(('claimed', 'one.test', db.claim_batch(1, 1)))
+    writer.apply(('profile', 'did:plc:0', Profile('did:plc:0', '0.test', None, 0, 0, ''), False))
+    writer.apply(('failed', 'did:plc:0', 'Gave up', 'followers', 'page-3'))
+    assert db.get_cursor('did:plc:0', 'followers') == 'page-3'
+    assert db.conn.execute('SELECT status FROM crawl_queue').fetchone() == ('failed',)
+    assert writer.release('one.test') == 0
+    db.close()
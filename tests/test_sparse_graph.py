@@ -0,0 +1,40 @@
+"""Mutual matrix and k-cores of a small graph with a self-follow"""
+
+from kcore import core_numbers
+from sparse_graph import load_sparse_graph
+from storage import FurryNetworkDB
+import numpy as np
+import pytest
+
+def _did(i):
+    return f'did:plc:user{i}'
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_self_follow_is_not_a_mutual_pair(tmp_path, compact):
+    # Triangle 0-1-2, user 3 mutual with 0 only, and user 3 following themselves
+    mutual_pairs = [(0, 1), (1, 2), (0, 2), (0, 3)]
+    db = FurryNetworkDB(str(tmp_path / 'test.db'), compact=compact)
+    with db.transaction():
+        db.add_users((_did(i), f'user{i}.test', None) for i in range(4))
+        db.add_follows((_did(a), f'user{a}.test', _did(b), f'user{b}.test', True) for a, b in mutual_pairs)
+        db.add_follows([(_did(3), 'user3.test', _did(3), 'user3.test', True)])
+    db.close()
+    
+    graph = load_sparse_graph(str(tmp_path / 'test.db'))
+    mutual = graph.mutual_adjacency()
+    assert mutual.diagonal().sum() == 0
+    assert mutual.nnz == 2 * len(mutual_pairs)
+    cores = core_numbers(mutual)
+    assert cores[[graph.index[_did(i)] for i in range(4)]].tolist() == [2, 2, 2, 1]
+
+def test_core_numbers_matches_networkx():
+    nx = pytest.importorskip('networkx')
+    import scipy.sparse as sp
+    rng = np.random.default_rng(1)
+    n, m = 500, 3000
+    rows, cols = rng.integers(0, n, m), rng.integers(0, n, m)
+    keep = rows != cols
+    M = sp.csr_matrix((np.ones(keep.sum()), (rows[keep], cols[keep])), shape=(n, n))
+    M = ((M + M.T) > 0).astype(np.int8).tocsr()
+    expected = nx.core_number(nx.from_scipy_sparse_array(M))
+    assert core_numbers(M).tolist() == [expected[i] for i in range(n)]
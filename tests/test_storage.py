@@ -0,0 +1,36 @@
+"""FurryNetworkDB schema and queries"""
+
+from storage import FurryNetworkDB
+import pytest
+import sqlite3
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_missing_users_get_zero_counts(tmp_path, compact):
+    db = FurryNetworkDB(str(tmp_path / 'test.db'), compact=compact)
+    db.add_missing_users([('did:plc:a', 'a.test', 'A')])
+    db.add_user('did:plc:b', 'b.test')
+    assert db.conn.execute('SELECT did, followers_count, follows_count FROM users ORDER BY did').fetchall() == [
+        ('did:plc:a', 0, 0), ('did:plc:b', 0, 0)]
+    db.close()
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_rebuild_core_degrees_matches_triggers(tmp_path, compact):
+    db = FurryNetworkDB(str(tmp_path / 'test.db'), compact=compact)
+    follows = [(0, 1), (1, 0), (0, 2), (3, 1), (2, 4), (4, 4), (5, 0), (1, 5)]
+    with db.transaction():
+        db.add_users((f'did:plc:{i}', f'{i}.test', None) for i in range(6))
+        for did in ('did:plc:0', 'did:plc:1'):
+            db.mark_as_mutual_core(did)
+        db.add_follows((f'did:plc:{a}', f'{a}.test', f'did:plc:{b}', f'{b}.test', False) for a, b in follows)
+    expected = db.conn.execute('SELECT did, core_degree FROM users ORDER BY did').fetchall()
+    assert dict(expected) == {'did:plc:0': 1, 'did:plc:1': 1, 'did:plc:2': 1, 'did:plc:3': 1, 'did:plc:4': 0, 'did:plc:5': 2}
+    
+    db.conn.execute('UPDATE users SET core_degree = 7')
+    db.rebuild_core_degrees()
+    assert db.conn.execute('SELECT did, core_degree FROM users ORDER BY did').fetchall() == expected
+    db.close()
+
+def test_old_sqlite_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite3, 'sqlite_version_info', (3, 22, 0))
+    with pytest.raises(SystemExit, match='too old'):
+        FurryNetworkDB(str(tmp_path / 'test.db'))
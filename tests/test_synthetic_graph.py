@@ -0,0 +1,11 @@
+"""synthetic_graph.generate on graphs smaller than its defaults"""
+
+from synthetic_graph import generate
+import pytest
+
+@pytest.mark.parametrize('users', [1, 2, 10, 19, 20, 21])
+def test_fewer_users_than_hubs(users):
+    graph = generate(users, 5)
+    assert len(graph.hubs) == min(users, 20)
+    assert (graph.src != graph.dst).all()
+    assert graph.src.max(initial=0) < users and graph.dst.max(initial=0) < users